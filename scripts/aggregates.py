@@ -0,0 +1,172 @@
+"""
+aggregates.py
+Couche agrégée matérialisée du Data Warehouse : le cube agg_orders
+(pays, employee_key, mois, source) -> total_orders, delivered, freight.
+
+Tous les résumés de kpi_analysis.py (globaux, par pays, par employé, par mois)
+et tout autre regroupement sur ces axes se calculent à partir du cube, dont
+la taille dépend du nombre de combinaisons et non du nombre de commandes.
+
+Le cube est construit par datawarehouse.py (étape agg_orders). En mode
+--incremental, seules les lignes de fact_orders ajoutées, modifiées ou
+supprimées sont agrégées puis ajoutées / retranchées au cube précédent ; les
+commandes d'un client dont le pays a changé dans dim_customers sont
+retranchées de leurs anciennes cases et ajoutées aux nouvelles.
+
+    python scripts/aggregates.py --bench [--scale 1,10,100]   # KPI : cube vs fact
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+import constants
+import storage
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+WAREHOUSE = os.path.join(BASE, "data", "warehouse")
+
+CUBE = constants.CUBE
+DIMENSIONS = ["country", "employee_key", "month", "source"]
+MEASURES = ["total_orders", "delivered", "freight"]
+
+# Colonnes de fact_orders nécessaires au cube
+FACT_COLUMNS = ["fact_key", "orderdate", "customer_key", "employee_key", "delivered", "freight", "source"]
+
+# Lignes identiques si ces colonnes sont identiques (row_hash : contenu source)
+_ROW_IDENTITY = ["fact_key", "row_hash", "customer_key", "employee_key"]
+
+# Attributs de dim_customers recopiés dans le cube
+CUSTOMER_ATTRIBUTES = ["country"]
+
+
+def aggregate_orders(fact, dim_customers):
+    """Agrège les lignes `fact` au grain du cube (les clés manquantes forment leur propre groupe)."""
+    rows = fact[[c for c in FACT_COLUMNS if c in fact.columns]]
+    country = dim_customers[["customer_key", "country"]].drop_duplicates("customer_key")
+    rows = rows.merge(country, on="customer_key", how="left")
+    rows["month"] = rows["orderdate"].dt.to_period("M").dt.to_timestamp()
+    rows["source"] = rows["source"].astype(str)
+    cube = rows.groupby(DIMENSIONS, dropna=False, observed=True).agg(
+        total_orders=("fact_key", "count"),
+        delivered=("delivered", "sum"),
+        freight=("freight", "sum"),
+    ).reset_index()
+    return cube.astype({"total_orders": "int64", "delivered": "int64", "freight": "float64"})
+
+
+def merge_cubes(cube, delta):
+    """Somme deux cubes case par case ; les cases vides (0 commande) disparaissent."""
+    parts = [c for c in (cube, delta) if len(c)]
+    if not parts:
+        return cube
+    merged = pd.concat(parts, ignore_index=True)
+    merged = merged.groupby(DIMENSIONS, dropna=False, observed=True)[MEASURES].sum().reset_index()
+    return merged[merged["total_orders"] != 0].reset_index(drop=True)
+
+
+def changed_members(previous_dim, dim, key, attributes):
+    """Clés dont les `attributes` diffèrent entre les deux versions de la dimension (ou absentes d'un côté)."""
+    def hashed(d):
+        d = d.drop_duplicates(key)
+        return pd.Series(pd.util.hash_pandas_object(d[attributes], index=False).to_numpy(), index=d[key].to_numpy())
+
+    both = pd.concat([hashed(previous_dim), hashed(dim)], axis=1, keys=["previous", "current"])
+    return both.index[both["previous"] != both["current"]]
+
+
+def update_cube(cube, previous_fact, fact, previous_dim_customers, dim_customers):
+    """
+    Met à jour `cube` (construit sur `previous_fact` et `previous_dim_customers`)
+    pour refléter `fact` et `dim_customers` : seules les lignes ajoutées,
+    modifiées ou supprimées, et celles des clients dont un attribut du cube a
+    changé, sont agrégées (les anciennes avec l'ancienne dimension).
+    """
+    identity = [c for c in _ROW_IDENTITY if c in fact.columns and c in previous_fact.columns]
+    both = previous_fact[identity].merge(fact[identity], on=identity, how="outer", indicator=True)
+    removed = both.loc[both["_merge"] == "left_only", "fact_key"]
+    added = both.loc[both["_merge"] == "right_only", "fact_key"]
+    moved = changed_members(previous_dim_customers, dim_customers, "customer_key", CUSTOMER_ATTRIBUTES)
+
+    old_rows = previous_fact["fact_key"].isin(removed) | previous_fact["customer_key"].isin(moved)
+    delta_removed = aggregate_orders(previous_fact[old_rows], previous_dim_customers)
+    delta_removed[MEASURES] = -delta_removed[MEASURES]
+    new_rows = fact["fact_key"].isin(added) | fact["customer_key"].isin(moved)
+    delta_added = aggregate_orders(fact[new_rows], dim_customers)
+    return merge_cubes(merge_cubes(cube, delta_removed), delta_added)
+
+
+def load_cube(warehouse=WAREHOUSE):
+    """Le cube matérialisé, ou None s'il n'a pas encore été construit."""
+    try:
+        return storage.read_table(CUBE, warehouse)
+    except FileNotFoundError:
+        return None
+
+
+def rollup(cube, by):
+    """Somme des mesures du cube par `by` (liste d'axes, ex. ["country"])."""
+    return cube.groupby(by, observed=True)[MEASURES].sum().reset_index()
+
+
+# -------------------------
+# Benchmark
+# -------------------------
+def _kpi_from_fact(fact, dim_c, dim_e):
+    fact_c = fact.merge(dim_c, on="customer_key", how="left")
+    fact_c.groupby("country").agg(total_orders=("fact_key", "count"), delivered=("delivered", "sum"))
+    fact_e = fact.merge(dim_e, on="employee_key", how="left")
+    fact_e["employee_name"] = fact_e["firstname"].fillna("") + " " + fact_e["lastname"].fillna("")
+    fact_e.groupby("employee_name").agg(total_orders=("fact_key", "count"), delivered=("delivered", "sum"))
+    fact.groupby(fact["orderdate"].dt.to_period("M")).agg(total_orders=("fact_key", "count"))
+
+
+def _kpi_from_cube(cube, dim_e):
+    rollup(cube, ["country"])
+    by_emp = rollup(cube, ["employee_key"]).merge(dim_e, on="employee_key", how="left")
+    by_emp["employee_name"] = by_emp["firstname"].fillna("") + " " + by_emp["lastname"].fillna("")
+    by_emp.groupby("employee_name")[MEASURES].sum()
+    rollup(cube, ["month"])
+
+
+def benchmark(warehouse=WAREHOUSE, scales=(1, 10, 100), repeat=3):
+    """Temps des résumés KPI calculés depuis fact_orders et depuis le cube, pour des faits répliqués."""
+    fact = storage.read_table("fact_orders", warehouse, columns=FACT_COLUMNS)
+    dim_c = storage.read_table("dim_customers", warehouse, columns=["customer_key", "country"])
+    dim_e = storage.read_table("dim_employees", warehouse, columns=["employee_key", "firstname", "lastname"])
+
+    print(f"\n===== Benchmark KPI : fact_orders vs cube {CUBE} =====")
+    print(f"{'lignes fact':>12} {'cases cube':>11} {'depuis fact':>12} {'depuis cube':>12}")
+    results = []
+    for scale in scales:
+        big = pd.concat([fact] * scale, ignore_index=True)
+        big["fact_key"] = range(1, len(big) + 1)
+        cube = aggregate_orders(big, dim_c)
+        t_fact = min(_timed(_kpi_from_fact, big, dim_c, dim_e) for _ in range(repeat))
+        t_cube = min(_timed(_kpi_from_cube, cube, dim_e) for _ in range(repeat))
+        results.append({"fact_rows": len(big), "cube_rows": len(cube), "fact_s": t_fact, "cube_s": t_cube})
+        print(f"{len(big):>12} {len(cube):>11} {t_fact * 1000:>10.1f}ms {t_cube * 1000:>10.1f}ms")
+    return results
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cube agrégé agg_orders")
+    parser.add_argument("--bench", action="store_true", help="comparer les KPI depuis le cube et depuis les faits")
+    parser.add_argument("--scale", default="1,10,100", help="facteurs de réplication de fact_orders")
+    parser.add_argument("--folder", default=WAREHOUSE)
+    args = parser.parse_args(argv)
+    if args.bench:
+        benchmark(args.folder, [int(s) for s in args.scale.split(",")])
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
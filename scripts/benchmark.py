@@ -0,0 +1,328 @@
+"""
+benchmark.py
+Benchmark de bout en bout du pipeline, avec budgets de performance.
+
+Pour chaque échelle (nombre de commandes), un projet « bac à sable » est
+créé dans un dossier temporaire : copie des scripts, données synthétiques
+(synthetic.py) et classeurs .xlsx tirés des extraits Access. Chaque étape y
+est lancée dans son propre processus :
+
+    extract_excel, transform_excel, clean_all_sources,
+    datawarehouse (+ chacune de ses étapes), kpi_analysis, dashboard
+
+et l'on relève la durée, le pic de mémoire (RSS, si l'OS le fournit) et le
+débit (lignes / s). Les résultats sont écrits en JSON puis comparés à une
+référence : une étape plus lente que la référence au-delà du budget fait
+échouer la commande (code de sortie 1).
+
+    python scripts/benchmark.py --scales 10000,100000 --save-baseline
+    python scripts/benchmark.py --scales 10000,100000 --budget 0.25
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+BASE = os.path.join(SCRIPTS, "..")
+OUTPUT = os.path.join(BASE, "data", "benchmarks")
+RESULTS_FILE = "results.json"
+BASELINE_FILE = "baseline.json"
+
+DEFAULT_SCALES = [10_000, 100_000]
+
+# Ralentissement toléré par rapport à la référence (0.25 = +25 %)
+DEFAULT_BUDGET = 0.25
+# En dessous de cet écart absolu, une différence est du bruit de mesure
+MIN_SECONDS = 0.05
+
+# Scripts lancés tels quels dans le bac à sable, dans l'ordre du pipeline
+SCRIPT_STAGES = ["extract_excel", "transform_excel", "clean_all_sources"]
+
+# Extraits Access convertis en classeurs pour extract_excel
+WORKBOOKS = ["Customers", "Employees", "Orders"]
+
+_MARK = "BENCH "
+
+
+# -------------------------
+# Bac à sable
+# -------------------------
+def make_sandbox(root, orders, seed=42):
+    """Copie des scripts + données synthétiques de `orders` commandes sous `root`."""
+    import synthetic
+
+    shutil.copytree(SCRIPTS, os.path.join(root, "scripts"),
+                    ignore=shutil.ignore_patterns("__pycache__", "*.pyc"))
+    raw = os.path.join(root, "data", "raw")
+    generated = os.path.join(root, "data", "generated")
+    synthetic.generate(orders, generated, seed=seed)
+    shutil.move(os.path.join(generated, "sql_sources"), os.path.join(raw, "sql_sources"))
+
+    sources = os.path.join(root, "data", "sources")
+    os.makedirs(sources, exist_ok=True)
+    for name in WORKBOOKS:
+        csv_to_xlsx(os.path.join(generated, "excel_sources", name + ".csv"), os.path.join(sources, name + ".xlsx"))
+    shutil.rmtree(generated)
+
+
+def csv_to_xlsx(csv_path, xlsx_path):
+    """Classeur d'une feuille, écrit en streaming (openpyxl write-only)."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        for row in csv.reader(f):
+            ws.append(row)
+    wb.save(xlsx_path)
+
+
+# -------------------------
+# Mesure d'un processus
+# -------------------------
+def run_measured(args, cwd=None):
+    """
+    Lance `args` et attend la fin : (secondes, pic RSS en Mo ou None, stdout).
+    Le pic RSS vient de wait4 (Unix) ; il n'est pas disponible ailleurs.
+    """
+    env = dict(os.environ, PYTHONIOENCODING="utf-8")
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if hasattr(os, "wait4"):
+        # read the pipes on the side so a chatty child never blocks
+        import threading
+
+        out = {}
+        readers = [threading.Thread(target=lambda k=k, s=s: out.__setitem__(k, s.read()))
+                   for k, s in (("stdout", proc.stdout), ("stderr", proc.stderr))]
+        for t in readers:
+            t.start()
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        for t in readers:
+            t.join()
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        stdout, stderr = out["stdout"], out["stderr"]
+        # ru_maxrss: kilobytes on Linux, bytes on macOS
+        rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    else:
+        stdout, stderr = proc.communicate()
+        elapsed = time.perf_counter() - start
+        rss = None
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} a échoué :\n{stderr.decode('utf-8', 'replace')}")
+    return elapsed, rss, stdout.decode("utf-8", "replace")
+
+
+def _child_payload(stdout):
+    for line in stdout.splitlines():
+        if line.startswith(_MARK):
+            return json.loads(line[len(_MARK):])
+    return {}
+
+
+def _row(scale, stage, seconds, rss, rows):
+    return {
+        "scale": scale,
+        "stage": stage,
+        "seconds": round(seconds, 4),
+        "peak_rss_mb": round(rss, 1) if rss is not None else None,
+        "rows": rows,
+        "rows_per_s": round(rows / seconds, 1) if seconds > 0 and rows else None,
+    }
+
+
+def bench_scale(orders, workdir, seed=42):
+    """Mesures de toutes les étapes pour `orders` commandes (liste de dicts)."""
+    root = os.path.join(workdir, f"scale_{orders}")
+    make_sandbox(root, orders, seed)
+    scripts = os.path.join(root, "scripts")
+    results = []
+
+    for stage in SCRIPT_STAGES:
+        seconds, rss, _ = run_measured([sys.executable, os.path.join(scripts, stage + ".py"), "--force"], cwd=root)
+        results.append(_row(orders, stage, seconds, rss, orders))
+
+    for child in ("datawarehouse", "kpi_analysis", "dashboard"):
+        seconds, rss, stdout = run_measured(
+            [sys.executable, os.path.abspath(__file__), "--child", child, "--root", root], cwd=root)
+        payload = _child_payload(stdout)
+        results.append(_row(orders, child, seconds, rss, payload.get("rows", orders)))
+        for step, (step_seconds, step_rows) in payload.get("steps", {}).items():
+            results.append(_row(orders, f"{child}:{step}", step_seconds, None, step_rows))
+    return results
+
+
+# -------------------------
+# Étapes lancées dans un processus enfant (scripts du bac à sable)
+# -------------------------
+def _child(name, root):
+    sys.path.insert(0, os.path.join(root, "scripts"))
+    payload = {}
+    if name == "datawarehouse":
+        import datawarehouse
+        import warehouse
+
+        context, timings = warehouse.build_warehouse(datawarehouse.discover_sources(), datawarehouse.WAREHOUSE)
+        outputs = {stage.name: stage.outputs for stage in warehouse.build_stages()}
+        steps = {}
+        for step, seconds in timings.items():
+            rows = sum(len(context[o]) for o in outputs.get(step, ()) if hasattr(context.get(o), "__len__")
+                       and not isinstance(context.get(o), str))
+            steps[step] = (seconds, rows)
+        payload = {"rows": len(context["fact_orders"]), "steps": steps}
+    elif name == "kpi_analysis":
+        import kpi_analysis
+
+        start = time.perf_counter()
+        kpi_analysis.main([])
+        payload = {"steps": {"summaries": (time.perf_counter() - start, 0)}}
+    elif name == "dashboard":
+        start = time.perf_counter()
+        import dashboard
+
+        loaded = time.perf_counter()
+        state = dashboard.filter_state(None, None, None, None, None)
+        dashboard.view(state)
+        dashboard.cube_view(state, "M", "auto")
+        store = dashboard.get_store()
+        payload = {
+            "rows": int(store.count.sum()),
+            "steps": {
+                "import": (loaded - start, 0),
+                "figures": (time.perf_counter() - loaded, len(store.cells)),
+            },
+        }
+    print(_MARK + json.dumps(payload))
+
+
+# -------------------------
+# Référence et budgets
+# -------------------------
+def save_results(results, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_results(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
+
+
+def compare(results, baseline, budget=DEFAULT_BUDGET, min_seconds=MIN_SECONDS, budgets=None):
+    """
+    Compare `results` à `baseline` étape par étape (même échelle).
+    `budgets` ({étape: fraction}) remplace `budget` pour certaines étapes.
+    Retourne la liste des lignes (avec ratio et verdict) et celle des régressions.
+    """
+    budgets = budgets or {}
+    reference = {(r["scale"], r["stage"]): r for r in baseline}
+    rows, regressions = [], []
+    for r in results:
+        base = reference.get((r["scale"], r["stage"]))
+        if base is None:
+            rows.append({**r, "baseline_s": None, "ratio": None, "status": "nouveau"})
+            continue
+        allowed = budgets.get(r["stage"], budget)
+        ratio = r["seconds"] / base["seconds"] if base["seconds"] else None
+        slower = r["seconds"] > base["seconds"] * (1 + allowed) and r["seconds"] - base["seconds"] > min_seconds
+        row = {**r, "baseline_s": base["seconds"], "ratio": ratio, "status": "RÉGRESSION" if slower else "ok"}
+        rows.append(row)
+        if slower:
+            regressions.append(row)
+    return rows, regressions
+
+
+def print_report(rows):
+    print(f"\n{'échelle':>9} {'étape':<48} {'durée':>9} {'réf.':>9} {'ratio':>6} {'RSS':>8} {'lignes/s':>11}  statut")
+    for r in rows:
+        base = f"{r['baseline_s']:.3f}s" if r.get("baseline_s") is not None else "-"
+        ratio = f"{r['ratio']:.2f}" if r.get("ratio") is not None else "-"
+        rss = f"{r['peak_rss_mb']:.0f}Mo" if r["peak_rss_mb"] is not None else "-"
+        speed = f"{r['rows_per_s']:.0f}" if r["rows_per_s"] is not None else "-"
+        print(f"{r['scale']:>9} {r['stage']:<48} {r['seconds']:>8.3f}s {base:>9} {ratio:>6} {rss:>8} {speed:>11}"
+              f"  {r.get('status', '')}")
+
+
+def _parse_budgets(values):
+    budgets = {}
+    for value in values or ():
+        stage, _, fraction = value.partition("=")
+        budgets[stage] = float(fraction)
+    return budgets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark du pipeline avec budgets de performance")
+    parser.add_argument("--scales", default=",".join(str(s) for s in DEFAULT_SCALES),
+                        help="nombres de commandes, séparés par des virgules")
+    parser.add_argument("--output", default=OUTPUT, help="dossier des résultats JSON")
+    parser.add_argument("--baseline", default=None, help=f"référence (défaut : <output>/{BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true", help="enregistrer ces mesures comme référence")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="ralentissement toléré (0.25 = +25 %%)")
+    parser.add_argument("--stage-budget", action="append", metavar="ÉTAPE=FRACTION",
+                        help="budget propre à une étape (répétable)")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS, help="écart absolu ignoré")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="garder les bacs à sable")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.child, args.root)
+        return 0
+
+    scales = [int(s) for s in args.scales.split(",")]
+    workdir = tempfile.mkdtemp(prefix="bi_bench_")
+    results = []
+    try:
+        for scale in scales:
+            print(f"Échelle {scale} commandes...", flush=True)
+            results += bench_scale(scale, workdir, args.seed)
+    finally:
+        if args.keep:
+            print(f"Bacs à sable conservés dans {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    path = save_results(results, os.path.join(args.output, RESULTS_FILE))
+    print(f"✅ Résultats : {path}")
+    baseline_path = args.baseline or os.path.join(args.output, BASELINE_FILE)
+    if args.save_baseline:
+        save_results(results, baseline_path)
+        print(f"✅ Référence enregistrée : {baseline_path}")
+        print_report(results)
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f"⚠️ Pas de référence ({baseline_path}) : relancer avec --save-baseline")
+        print_report(results)
+        return 0
+
+    rows, regressions = compare(results, load_results(baseline_path), args.budget, args.min_seconds,
+                                _parse_budgets(args.stage_budget))
+    print_report(rows)
+    if regressions:
+        print(f"\n❌ {len(regressions)} étape(s) au-delà du budget")
+        return 1
+    print("\n✅ Toutes les étapes respectent le budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
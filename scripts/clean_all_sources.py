@@ -1,60 +1,88 @@
-import pandas as pd
 import os
-import unidecode
+import sys
 
-SQL = "data/raw/sql_sources/"
-EXCEL = "data/processed/excel_sources/"
-OUT = "../data/processed/final/"
-os.makedirs(OUT, exist_ok=True)
+import manifest
+import metrics
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+SQL = os.path.join(BASE, "data", "raw", "sql_sources")
+EXCEL = os.path.join(BASE, "data", "processed", "excel_sources")
+OUT = os.path.join(BASE, "data", "processed", "final")
 
-def normalize(s):
-    if pd.isna(s): return ""
-    return unidecode.unidecode(str(s).strip().lower())
+INPUTS = [os.path.join(SQL, f) for f in ("Customers.csv", "Employees.csv", "Orders.csv")] + \
+         [os.path.join(EXCEL, f) for f in ("customers_norm.csv", "employees_norm.csv", "orders_norm.csv")] + \
+         [__file__, os.path.join(os.path.dirname(__file__), "normalization.py")]
+OUTPUTS = [os.path.join(OUT, f) for f in ("customers_all.csv", "employees_all.csv", "orders_all.csv")]
+
+run = metrics.start("clean_all_sources")
+
+# Sources inchangées depuis la dernière exécution : rien à faire
+# (vérifié avant l'import de pandas pour qu'une relance à vide soit immédiate)
+if "--force" not in sys.argv and manifest.is_fresh("clean_all_sources", INPUTS, OUTPUTS):
+    print("✔ clean_all_sources : sources inchangées, rien à faire")
+    metrics.record("skipped", True)
+    run.finish()
+    raise SystemExit
+
+import pandas as pd
+
+from normalization import normalize_series
+
+os.makedirs(OUT, exist_ok=True)
 
 # ------------------------
 # CUSTOMERS
 # ------------------------
-sql = pd.read_csv(SQL + "Customers.csv")
-sql["company_norm"] = sql["CompanyName"].apply(normalize)
-sql["source"] = "sql"
+with metrics.stage("customers") as st:
+    sql = pd.read_csv(os.path.join(SQL, "Customers.csv"))
+    sql["company_norm"] = normalize_series(sql["CompanyName"])
+    sql["source"] = "sql"
 
-ex = pd.read_csv(EXCEL + "customers_norm.csv")
-ex["source"] = "excel"
+    ex = pd.read_csv(os.path.join(EXCEL, "customers_norm.csv"))
+    ex["source"] = "excel"
 
-final = pd.concat([sql, ex], ignore_index=True)
-final.to_csv(OUT + "customers_all.csv", index=False)
+    final = pd.concat([sql, ex], ignore_index=True)
+    final.to_csv(os.path.join(OUT, "customers_all.csv"), index=False)
+    st.rows_in, st.rows_out = len(sql) + len(ex), len(final)
 print("✔ customers_all.csv (union SQL+Excel)")
 
 # ------------------------
 # EMPLOYEES
 # ------------------------
-sql = pd.read_csv(SQL + "Employees.csv")
-sql["emp_norm"] = (sql["FirstName"] + " " + sql["LastName"]).apply(normalize)
-sql["source"] = "sql"
+with metrics.stage("employees") as st:
+    sql = pd.read_csv(os.path.join(SQL, "Employees.csv"))
+    sql["emp_norm"] = normalize_series(sql["FirstName"] + " " + sql["LastName"])
+    sql["source"] = "sql"
 
-ex = pd.read_csv(EXCEL + "employees_norm.csv")
-ex["source"] = "excel"
+    ex = pd.read_csv(os.path.join(EXCEL, "employees_norm.csv"))
+    ex["source"] = "excel"
 
-final = pd.concat([sql, ex], ignore_index=True)
-final.to_csv(OUT + "employees_all.csv", index=False)
+    final = pd.concat([sql, ex], ignore_index=True)
+    final.to_csv(os.path.join(OUT, "employees_all.csv"), index=False)
+    st.rows_in, st.rows_out = len(sql) + len(ex), len(final)
 print("✔ employees_all.csv")
 
 # ------------------------
 # ORDERS
 # ------------------------
-sql = pd.read_csv(SQL + "Orders.csv")
-sql["OrderDate"] = pd.to_datetime(sql["OrderDate"], errors="coerce")
-sql["ShippedDate"] = pd.to_datetime(sql["ShippedDate"], errors="coerce")
-sql["delivered"] = sql["ShippedDate"].notna().astype(int)
-sql["source"] = "sql"
+with metrics.stage("orders") as st:
+    sql = pd.read_csv(os.path.join(SQL, "Orders.csv"))
+    sql["OrderDate"] = pd.to_datetime(sql["OrderDate"], errors="coerce")
+    sql["ShippedDate"] = pd.to_datetime(sql["ShippedDate"], errors="coerce")
+    sql["delivered"] = sql["ShippedDate"].notna().astype(int)
+    sql["source"] = "sql"
 
-# On doit aussi générer normalisation SQL:
-sql["customer_norm"] = sql["CustomerID"].apply(lambda x: normalize(x))
-sql["employee_norm"] = sql["EmployeeID"].apply(lambda x: normalize(x))
+    # On doit aussi générer normalisation SQL:
+    sql["customer_norm"] = normalize_series(sql["CustomerID"])
+    sql["employee_norm"] = normalize_series(sql["EmployeeID"])
 
-ex = pd.read_csv(EXCEL + "orders_norm.csv")
-ex["source"] = "excel"
+    ex = pd.read_csv(os.path.join(EXCEL, "orders_norm.csv"))
+    ex["source"] = "excel"
 
-final = pd.concat([sql, ex], ignore_index=True)
-final.to_csv(OUT + "orders_all.csv", index=False)
+    final = pd.concat([sql, ex], ignore_index=True)
+    final.to_csv(os.path.join(OUT, "orders_all.csv"), index=False)
+    st.rows_in, st.rows_out = len(sql) + len(ex), len(final)
 print("✔ orders_all.csv")
+
+manifest.record("clean_all_sources", INPUTS, OUTPUTS)
+run.finish()
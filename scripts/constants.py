@@ -0,0 +1,54 @@
+"""
+constants.py
+Noms, formats et réglages par défaut du Data Warehouse partagés entre les
+modules. Ce module n'importe ni pandas ni pyarrow : datawarehouse.py s'en
+sert pour vérifier que le build est à jour avant de charger les
+bibliothèques. Les modules qui en sont responsables (warehouse, storage,
+aggregates, quality, matching, dashboard_data) les reprennent sous leur nom
+habituel ; une valeur ne se modifie qu'ici.
+"""
+import importlib.util
+import os
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+WAREHOUSE = os.path.join(BASE, "data", "warehouse")
+
+# pyarrow installé (sans l'importer) : formats colonnaires disponibles
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Formats de stockage (voir storage.py)
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+FORMATS = list(EXTENSIONS)
+DEFAULT_FORMAT = "parquet" if HAS_PYARROW else "csv"
+
+# Catalogue d'une table partitionnée : <table>/_catalog.json
+CATALOG = "_catalog.json"
+
+# Cube agrégé (voir aggregates.py)
+CUBE = "agg_orders"
+
+# Tables du warehouse écrites par warehouse.build_warehouse
+TABLES = ["dim_customers", "dim_employees", "dim_temps", "dim_products", "dim_shippers",
+          "fact_orders", "fact_order_lines", CUBE]
+
+# Tables stockées en une partition par mois de leur clé de date
+PARTITIONED = {"fact_orders": "orderdate_key"}
+
+# Snapshot du dashboard (voir dashboard_data.py)
+SNAPSHOT = "dashboard_cells"
+SNAPSHOT_FORMAT = "arrow" if HAS_PYARROW else "csv"
+
+# Score minimal (cosinus) pour considérer deux libellés comme la même entité (voir matching.py)
+DEFAULT_MATCH_THRESHOLD = 0.8
+
+# Modes du contrôle qualité (voir quality.py)
+QUALITY_MODES = ["warn", "fail", "quarantine"]
+DEFAULT_QUALITY_MODE = "warn"
+
+
+def table_path(name, folder=WAREHOUSE, fmt=DEFAULT_FORMAT):
+    return os.path.join(folder, name + EXTENSIONS[fmt])
+
+
+def catalog_path(name, folder=WAREHOUSE):
+    return os.path.join(folder, name, CATALOG)
@@ -1,147 +1,280 @@
-import pandas as pd
+import argparse
+from functools import lru_cache
+
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, dcc, html
-
-# ====== LOAD FACT & DIMENSIONS ======
-fact = pd.read_csv("data/warehouse/fact_orders.csv")
-dim_customer = pd.read_csv("data/warehouse/dim_customers.csv")
-dim_employee = pd.read_csv("data/warehouse/dim_employees.csv")
-dim_time = pd.read_csv("data/warehouse/dim_temps.csv")
-
-# ====== CLEAN COLUMN NAMES ======
-for df in [fact, dim_customer, dim_employee, dim_time]:
-    df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-
-# ====== CREATE DESCRIPTIVE COLUMNS ======
-dim_customer['customer and company'] = dim_customer['customerid'].astype(str) + " - " + dim_customer['companyname']
-dim_employee['employee name'] = dim_employee['firstname'] + " " + dim_employee['lastname']
-
-# ====== STAR SCHEMA CREATION ======
-fact = fact.merge(
-    dim_customer[['customer_key', 'customer and company', 'region', 'customerid']],
-    left_on='customer_key', right_on='customer_key', how='left'
-)
-fact = fact.merge(
-    dim_employee[['employee_key', 'employee name']],
-    left_on='employee_key', right_on='employee_key', how='left'
-)
-fact = fact.merge(
-    dim_time[['date_key', 'date', 'day', 'month', 'year']],
-    left_on='orderdate_key', right_on='date_key', how='left'
-)
+from dash import Dash, Input, Output, dcc, html
 
-# ====== ADD STATUS ======
-fact['status'] = fact['delivered'].apply(lambda x: "Livré" if x == 1 else "Non livré")
-
-# ====== CALCULATE KPIs ======
-total = len(fact)
-liv = fact["delivered"].sum()
-non = total - liv
-taux = round((liv / total * 100), 2)
-
-# ====== CREATE FIGURES ======
-# Commandes au fil du temps (darker bars)
-time_fig = px.bar(
-    fact,
-    x="date",
-    title="Commandes au fil du temps",
-    color_discrete_sequence=['#1f2c56']  
-)
+import metrics
+from dashboard_data import WAREHOUSE as WH, CUBE_MODES, CUBE_PERIODS, CellStore, load_cells
 
-# Commandes par employé
-emp_fig = px.histogram(fact, x="employee name", title="Commandes par Employé")
+# ====== LOAD PRE-AGGREGATED DATA (one row per customer x employee x date x status x source) ======
+# Loaded from the warehouse snapshot by the first callback of the first page
+# load (the layout itself is static, so import, server start and debug reloads
+# do not depend on the warehouse size); indexed once, then every filter state
+# is answered from this store.
+# WINDOW (--from / --to) limits the loaded dates to a range
+WINDOW = (None, None)
 
-# Commandes par client
-client_fig = px.histogram(fact, x="customer and company", title="Commandes par Client",width=3000)
 
-# Livré / Non Livré
-delivery_fig = px.pie(fact, names="status", title="Livré / Non Livré")
+@lru_cache(maxsize=1)
+def get_store():
+    run = metrics.start("dashboard")
+    with metrics.stage("load_cells") as st:
+        cells = load_cells(WH, *WINDOW)
+        st.rows_out = len(cells)
+    with metrics.stage("index_cells", rows_in=len(cells)):
+        store = CellStore(cells)
+    metrics.record("orders", int(store.count.sum()))
+    run.finish()
+    return store
 
-# Répartition des livraisons par région (larger pie)
-region_pie = px.pie(
-    fact,
-    names="region",
-    title="Répartition des livraisons par région",
-    color="region",
-    width=1000,
-    height=1000
-)
 
-# Nombre total livré vs non livré (narrower bars)
-delivery_bar = px.bar(
-    fact.groupby("status").size().reset_index(name="count"),
-    x="status",
-    y="count",
-    title="Nombre total livré vs non livré",
-    color="status"
-)
-delivery_bar.update_traces(width=0.4)
-
-# Employés par région
-employee_region = px.bar(
-    fact.groupby(["region", "employee name"]).size().reset_index(name="count"),
-    x="region",
-    y="count",
-    color="employee name",
-    title="Employés par Région"
-)
+# ====== CREATE FIGURES (each one fed by a compact count series) ======
+def build_figures(series):
+    # Commandes au fil du temps (darker bars)
+    time_fig = px.bar(
+        series["by_date"],
+        x="date",
+        y="count",
+        title="Commandes au fil du temps",
+        color_discrete_sequence=['#1f2c56']
+    )
+
+    # Commandes par employé
+    emp_fig = px.bar(series["by_employee"], x="employee name", y="count", title="Commandes par Employé")
+
+    # Commandes par client
+    client_fig = px.bar(series["by_client"], x="customer and company", y="count", title="Commandes par Client",width=3000)
+
+    # Livré / Non Livré
+    delivery_fig = px.pie(series["by_status"], names="status", values="count", title="Livré / Non Livré")
+
+    # Répartition des livraisons par région (larger pie)
+    region_pie = px.pie(
+        series["by_region"],
+        names="region",
+        values="count",
+        title="Répartition des livraisons par région",
+        color="region",
+        width=1000,
+        height=1000
+    )
+
+    # Nombre total livré vs non livré (narrower bars)
+    delivery_bar = px.bar(
+        series["by_status"],
+        x="status",
+        y="count",
+        title="Nombre total livré vs non livré",
+        color="status"
+    )
+    delivery_bar.update_traces(width=0.4)
+
+    # Employés par région
+    employee_region = px.bar(
+        series["by_region_employee"],
+        x="region",
+        y="count",
+        color="employee name",
+        title="Employés par Région"
+    )
+
+    return time_fig, emp_fig, client_fig, delivery_fig, region_pie, delivery_bar, employee_region
+
+
+# 3D OLAP Cube: hover text comes from per-point customdata columns and one
+# shared hovertemplate, so no string is built per point in Python
+def build_cube(level, points):
+    cube = go.Figure()
+    if level == "detail":
+        # one marker per employee x client x date x status cell
+        cube.add_trace(go.Scatter3d(
+            x=points["employee name"],
+            y=points["customer and company"],
+            z=points["date"],
+            mode="markers",
+            marker=dict(
+                size=8,
+                color=points["status"].map({"Livré": "green", "Non livré": "red"}),
+                opacity=0.9
+            ),
+            customdata=np.column_stack([points["status"], points["count"]]),
+            hovertemplate=(
+                "Employé : %{x}<br>Client : %{y}<br>Date : %{z|%Y-%m-%d}<br>"
+                "Statut : %{customdata[0]}<br>Commandes : %{customdata[1]}<extra></extra>"
+            ),
+        ))
+    else:
+        # one marker per employee x client x period bin, sized by orders, coloured by delivery rate
+        counts = points["count"].to_numpy()
+        size = 4 + 20 * np.sqrt(counts / counts.max()) if len(counts) else counts
+        cube.add_trace(go.Scatter3d(
+            x=points["employee name"],
+            y=points["customer and company"],
+            z=points["period"],
+            mode="markers",
+            marker=dict(
+                size=size,
+                color=points["rate"],
+                colorscale="RdYlGn",
+                cmin=0,
+                cmax=100,
+                colorbar=dict(title="Taux de livraison (%)"),
+                opacity=0.9
+            ),
+            customdata=np.column_stack([points["count"], points["delivered"], points["rate"]]),
+            hovertemplate=(
+                "Employé : %{x}<br>Client : %{y}<br>Période : %{z|%Y-%m}<br>"
+                "Commandes : %{customdata[0]}<br>Livrées : %{customdata[1]}<br>"
+                "Taux de livraison : %{customdata[2]}%<extra></extra>"
+            ),
+        ))
+    cube.update_layout(scene=dict(
+        xaxis_title="Employé",
+        yaxis_title="Client",
+        zaxis_title="Date" if level == "detail" else "Période"
+    ))
+    return cube
+
+
+GRAPHS = ["time", "employee", "client", "delivery", "region", "delivery-bar", "employee-region"]
+
+
+def filter_state(start, end, regions, employees, sources):
+    """Hashable, order-independent filter state (empty selection = no filter)."""
+    return (
+        start[:10] if start else None,
+        end[:10] if end else None,
+        tuple(sorted(regions or ())),
+        tuple(sorted(employees or ())),
+        tuple(sorted(sources or ())),
+    )
+
+
+@lru_cache(maxsize=64)
+def view(state):
+    """KPI texts and figures for one filter state (cached: revisiting a filter is free)."""
+    series = get_store().series(*state)
+    total, liv, non, taux = series["kpis"]
+    kpi_texts = (
+        f"Total Commandes : {total}",
+        f"Livrées : {liv}",
+        f"Non Livrées : {non}",
+        f"Taux de Livraison : {taux}%",
+    )
+    return kpi_texts + build_figures(series)
+
+
+@lru_cache(maxsize=64)
+def cube_view(state, period, mode):
+    return build_cube(*get_store().cube(*state, period, mode))
 
-# 3D OLAP Cube
-cube = go.Figure()
-cube.add_trace(go.Scatter3d(
-    x=fact["employee name"],
-    y=fact["customer and company"],
-    z=fact["date"],
-    mode="markers",
-    marker=dict(
-        size=8,
-        color=fact["status"].map({"Livré": "green", "Non livré": "red"}),
-        opacity=0.9
-    ),
-    text=(
-        "Employé : " + fact["employee name"] + "<br>" +
-        "Client : " + fact["customer and company"] + "<br>" +
-        "Date : " + fact["date"].astype(str) + "<br>" +
-        "Statut : " + fact["status"]
-    ),
-    hoverinfo="text"
-))
-cube.update_layout(scene=dict(
-    xaxis_title="Employé",
-    yaxis_title="Client",
-    zaxis_title="Date"
-))
 
 # ====== DASHBOARD ======
 app = Dash(__name__)
 
-app.layout = html.Div([
-    html.H1("📊 Dashboard of the Business Intelligence Project", style={"textAlign": "center"}),
 
-    # KPIs
-    html.Div([
-        html.Div(f"Total Commandes : {total}", className="kpi-box"),
-        html.Div(f"Livrées : {liv}", className="kpi-box"),
-        html.Div(f"Non Livrées : {non}", className="kpi-box"),
-        html.Div(f"Taux de Livraison : {taux}%", className="kpi-box"),
-    ], style={"display": "flex", "justifyContent": "space-around"}),
+def serve_layout():
+    # static shell: date bounds and filter options are filled by load_filters
+    return html.Div([
+        dcc.Location(id="url"),
+        html.H1("📊 Dashboard of the Business Intelligence Project", style={"textAlign": "center"}),
+
+        # Filters
+        html.Div([
+            dcc.DatePickerRange(id="date-range", display_format="DD/MM/YYYY"),
+            dcc.Dropdown(id="region-filter", options=[], multi=True,
+                         placeholder="Régions", style={"minWidth": "220px"}),
+            dcc.Dropdown(id="employee-filter", options=[], multi=True,
+                         placeholder="Employés", style={"minWidth": "220px"}),
+            dcc.Dropdown(id="source-filter", options=[], multi=True,
+                         placeholder="Sources", style={"minWidth": "160px"}),
+        ], style={"display": "flex", "gap": "12px", "justifyContent": "center", "flexWrap": "wrap"}),
+
+        html.Br(),
+
+        # KPIs
+        html.Div([
+            html.Div(id="kpi-total", className="kpi-box"),
+            html.Div(id="kpi-delivered", className="kpi-box"),
+            html.Div(id="kpi-not-delivered", className="kpi-box"),
+            html.Div(id="kpi-rate", className="kpi-box"),
+        ], style={"display": "flex", "justifyContent": "space-around"}),
+
+        html.Br(),
+
+        # Graphs
+        dcc.Graph(id="graph-time"),
+        dcc.Graph(id="graph-employee"),
+        dcc.Graph(id="graph-client"),
+        dcc.Graph(id="graph-delivery"),
 
-    html.Br(),
+        html.H2("🔷 3D Cube Graph (using OLAP) : Employé X Client X Date"),
+        html.Div([
+            dcc.RadioItems(id="cube-mode", value="auto", inline=True,
+                           options=[{"label": label, "value": value} for value, label in CUBE_MODES.items()]),
+            dcc.RadioItems(id="cube-period", value="M", inline=True,
+                           options=[{"label": label, "value": value} for value, label in CUBE_PERIODS.items()]),
+        ], style={"display": "flex", "gap": "24px"}),
+        dcc.Graph(id="graph-cube"),
 
-    # Graphs
-    dcc.Graph(figure=time_fig),
-    dcc.Graph(figure=emp_fig),
-    dcc.Graph(figure=client_fig),
-    dcc.Graph(figure=delivery_fig),
+        dcc.Graph(id="graph-region"),
+        dcc.Graph(id="graph-delivery-bar"),
+        dcc.Graph(id="graph-employee-region"),
+    ])
 
-    html.H2("🔷 3D Cube Graph (using OLAP) : Employé X Client X Date"),
-    dcc.Graph(figure=cube),
 
-    dcc.Graph(figure=region_pie),
-    dcc.Graph(figure=delivery_bar),
-    dcc.Graph(figure=employee_region),
-])
+app.layout = serve_layout
+
+
+# the figure callbacks read these filters, so Dash runs them once this one is done
+@app.callback(
+    Output("date-range", "min_date_allowed"), Output("date-range", "max_date_allowed"),
+    Output("date-range", "start_date"), Output("date-range", "end_date"),
+    Output("region-filter", "options"), Output("employee-filter", "options"), Output("source-filter", "options"),
+    Input("url", "pathname"),
+)
+def load_filters(_):
+    store = get_store()
+    start_date, end_date = store.date_bounds()
+    return (start_date, end_date, start_date, end_date,
+            store.options("region"), store.options("employee name"), store.options("source"))
+
+
+@app.callback(
+    [Output("kpi-total", "children"), Output("kpi-delivered", "children"),
+     Output("kpi-not-delivered", "children"), Output("kpi-rate", "children")]
+    + [Output(f"graph-{name}", "figure") for name in GRAPHS],
+    Input("date-range", "start_date"),
+    Input("date-range", "end_date"),
+    Input("region-filter", "value"),
+    Input("employee-filter", "value"),
+    Input("source-filter", "value"),
+)
+def update_dashboard(start, end, regions, employees, sources):
+    return view(filter_state(start, end, regions, employees, sources))
+
+
+@app.callback(
+    Output("graph-cube", "figure"),
+    Input("date-range", "start_date"),
+    Input("date-range", "end_date"),
+    Input("region-filter", "value"),
+    Input("employee-filter", "value"),
+    Input("source-filter", "value"),
+    Input("cube-mode", "value"),
+    Input("cube-period", "value"),
+)
+def update_cube(start, end, regions, employees, sources, mode, period):
+    return cube_view(filter_state(start, end, regions, employees, sources), period, mode)
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dashboard des commandes")
+    parser.add_argument("--from", dest="start", help="première date chargée (AAAA-MM-JJ)")
+    parser.add_argument("--to", dest="end", help="dernière date chargée (AAAA-MM-JJ)")
+    args = parser.parse_args()
+    WINDOW = (args.start, args.end)
     app.run(debug=True)
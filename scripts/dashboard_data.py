@@ -0,0 +1,287 @@
+"""
+dashboard_data.py
+Données pré-agrégées du dashboard.
+
+Les commandes sont d'abord regroupées sur les clés entières de fact_orders
+(client, employé, date, livré, source) : une « cellule » par combinaison, avec
+son nombre de commandes. Les libellés (client, employé, région, date) ne sont
+joints qu'aux cellules, puis chaque figure est un petit regroupement de ces
+cellules. La taille des données envoyées au navigateur dépend donc du nombre
+de catégories, pas du nombre de commandes.
+
+Les cellules sont calculées une fois par datawarehouse.py et stockées dans le
+snapshot dashboard_cells (Arrow IPC, lu en memory-map, colonnes typées et
+libellés en catégories) : le dashboard démarre sans jointure ni regroupement.
+Sans snapshot (ou s'il est plus ancien que fact_orders), les cellules sont
+recalculées depuis les tables. Limité à une plage de dates, le chargement ne
+lit que les partitions mensuelles de fact_orders qui la recoupent.
+
+CellStore indexe les cellules pour les filtres du dashboard (plage de dates,
+région, employé, source) : tri par date, codes entiers par axe, positions de
+chaque valeur précalculées, comptages par np.bincount et résultats mémorisés
+(LRU) par état de filtre.
+
+Le cube 3D a deux niveaux de détail : agrégé (employé × client × période,
+taille = commandes, couleur = taux de livraison) ou détail (une cellule par
+date et statut). En mode automatique, le détail n'est affiché que si la
+sélection compte au plus RAW_POINT_LIMIT commandes.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import constants
+import storage
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+WAREHOUSE = os.path.join(BASE, "data", "warehouse")
+
+CELL_KEYS = ["customer_key", "employee_key", "orderdate_key", "delivered", "source"]
+
+STATUS_LABELS = {1: "Livré", 0: "Non livré"}
+
+# Snapshot des cellules écrit à la construction du warehouse
+SNAPSHOT = constants.SNAPSHOT
+SNAPSHOT_FORMAT = constants.SNAPSHOT_FORMAT
+SNAPSHOT_DTYPES = {
+    "customer_key": "Int64",
+    "employee_key": "Int64",
+    "orderdate_key": "Int32",
+    "delivered": "int8",
+    "count": "int64",
+    "customer and company": "category",
+    "region": "category",
+    "employee name": "category",
+    "status": "category",
+    "source": "category",
+}
+
+
+def build_cells(fact, dim_customers, dim_employees, dim_temps):
+    """Une ligne par (client, employé, date, statut, source) avec `count` commandes, libellés joints."""
+    cells = fact[CELL_KEYS].groupby(CELL_KEYS, dropna=False, observed=True).size().reset_index(name="count")
+
+    dim_customer = dim_customers[["customer_key", "customerid", "companyname", "region"]].copy()
+    dim_employee = dim_employees[["employee_key", "firstname", "lastname"]].copy()
+    dim_time = dim_temps[["date_key", "date"]]
+
+    dim_customer["customer and company"] = dim_customer["customerid"].astype(str) + " - " + dim_customer["companyname"]
+    dim_employee["employee name"] = dim_employee["firstname"] + " " + dim_employee["lastname"]
+
+    cells = cells.merge(dim_customer[["customer_key", "customer and company", "region"]], on="customer_key", how="left")
+    cells = cells.merge(dim_employee[["employee_key", "employee name"]], on="employee_key", how="left")
+    cells = cells.merge(dim_time, left_on="orderdate_key", right_on="date_key", how="left").drop(columns="date_key")
+    cells["status"] = np.where(cells["delivered"] == 1, STATUS_LABELS[1], STATUS_LABELS[0])
+    cells["source"] = cells["source"].astype(str)
+    return cells.astype({c: t for c, t in SNAPSHOT_DTYPES.items() if c in cells.columns})
+
+
+def write_snapshot(cells, warehouse=WAREHOUSE):
+    """Écrit le snapshot des cellules (Arrow si pyarrow est installé) et retourne son chemin."""
+    path = storage.write_table(cells, SNAPSHOT, warehouse, SNAPSHOT_FORMAT)
+    storage.drop_other_formats(SNAPSHOT, warehouse, keep={SNAPSHOT_FORMAT})
+    return path
+
+
+def snapshot_is_fresh(warehouse=WAREHOUSE):
+    """Vrai si le snapshot existe et n'est pas plus ancien que fact_orders."""
+    try:
+        snapshot, _ = storage.find_table(SNAPSHOT, warehouse)
+        fact, _ = storage.find_table("fact_orders", warehouse)
+    except FileNotFoundError:
+        return False
+    return os.stat(snapshot).st_mtime_ns >= os.stat(fact).st_mtime_ns
+
+
+def load_cells(warehouse=WAREHOUSE, start=None, end=None):
+    """
+    Les cellules du dashboard : snapshot s'il est à jour, sinon recalculées
+    depuis les tables ; seulement les dates de [start, end] si précisé.
+    """
+    between = None
+    if start is not None or end is not None:
+        between = ("orderdate_key", storage.date_key(start), storage.date_key(end))
+    if snapshot_is_fresh(warehouse):
+        return storage.read_table(SNAPSHOT, warehouse, between=between)
+    return build_cells(
+        storage.read_table("fact_orders", warehouse, columns=CELL_KEYS, between=between),
+        storage.read_table("dim_customers", warehouse, columns=["customer_key", "customerid", "companyname", "region"]),
+        storage.read_table("dim_employees", warehouse, columns=["employee_key", "firstname", "lastname"]),
+        storage.read_table("dim_temps", warehouse, columns=["date_key", "date"]),
+    )
+
+
+def kpis(cells):
+    """(total, livrées, non livrées, taux %) sur les cellules."""
+    total = int(cells["count"].sum())
+    delivered = int(cells.loc[cells["delivered"] == 1, "count"].sum())
+    rate = round(delivered / total * 100, 2) if total else 0.0
+    return total, delivered, total - delivered, rate
+
+
+def count_by(cells, by, dropna=False):
+    """Nombre de commandes par `by` (colonne ou liste) ; sauf `dropna`, les valeurs manquantes forment un groupe."""
+    by = [by] if isinstance(by, str) else list(by)
+    return cells.groupby(by, dropna=dropna, observed=True)["count"].sum().reset_index()
+
+
+# -------------------------
+# Store indexé pour les filtres
+# -------------------------
+# Séries simples : nom -> axe compté
+SERIES_AXES = {
+    "by_date": "date",
+    "by_employee": "employee name",
+    "by_client": "customer and company",
+    "by_status": "status",
+    "by_region": "region",
+}
+FILTER_AXES = ["region", "employee name", "source"]
+AXES = list(SERIES_AXES.values()) + ["source"]
+
+# Libellé des valeurs manquantes dans les listes de filtres
+MISSING = "(non renseigné)"
+
+# États de filtre mémorisés
+CACHE_SIZE = 256
+
+# Cube 3D : périodes d'agrégation et seuil du mode détail automatique
+CUBE_PERIODS = {"M": "Mois", "Q": "Trimestre", "Y": "Année"}
+CUBE_MODES = {"auto": "Automatique", "aggregated": "Agrégé", "detail": "Détail"}
+RAW_POINT_LIMIT = 5000
+CUBE_AXES = ["employee name", "customer and company"]
+
+
+class CellStore:
+    """
+    Cellules indexées pour le filtrage interactif :
+    - triées par date : une plage de dates est la tranche [i, j) trouvée par
+      np.searchsorted (les dates manquantes sont à la fin) ;
+    - chaque axe est codé en entiers (valeur manquante = dernier code) ;
+    - pour chaque axe filtrable, les positions des cellules de chaque valeur
+      sont précalculées (ordre trié par code + offsets de début de groupe) ;
+    - les comptages par axe sont des np.bincount sur la sélection.
+    `series(*state)` est mémorisé (LRU) : un état de filtre déjà vu répond
+    sans recalcul.
+    """
+
+    def __init__(self, cells, cache_size=CACHE_SIZE):
+        self.cells = cells.sort_values("date", na_position="last", kind="stable").reset_index(drop=True)
+        self.count = self.cells["count"].to_numpy(dtype=np.int64)
+        self.delivered = self.cells["delivered"].to_numpy() == 1
+        self.dates = self.cells["date"].to_numpy(dtype="datetime64[ns]")
+        self.n_dated = int(self.cells["date"].notna().sum())
+
+        self.codes = {}
+        self.labels = {}
+        for axis in AXES:
+            codes, uniques = pd.factorize(self.cells[axis], sort=True)
+            self.codes[axis] = np.where(codes < 0, len(uniques), codes)
+            self.labels[axis] = np.array(list(uniques) + [None], dtype=object)
+
+        # positions of the cells of each value: order[offsets[c]:offsets[c + 1]]
+        self.groups = {}
+        for axis in FILTER_AXES:
+            order = np.argsort(self.codes[axis], kind="stable")
+            offsets = np.searchsorted(self.codes[axis][order], np.arange(len(self.labels[axis]) + 1))
+            self.groups[axis] = (order, offsets)
+
+        self.series = lru_cache(maxsize=cache_size)(self._series)
+        self.cube = lru_cache(maxsize=cache_size)(self._cube)
+
+    def options(self, axis):
+        """Valeurs proposées dans le filtre `axis`."""
+        labels = self.labels[axis]
+        present = np.bincount(self.codes[axis], minlength=len(labels)) > 0
+        return [MISSING if label is None else label for label, ok in zip(labels, present) if ok]
+
+    def date_bounds(self):
+        if not self.n_dated:
+            return None, None
+        return pd.Timestamp(self.dates[0]).date(), pd.Timestamp(self.dates[self.n_dated - 1]).date()
+
+    def _date_slice(self, start, end):
+        if start is None and end is None:
+            return 0, len(self.cells)
+        dated = self.dates[:self.n_dated]
+        i = np.searchsorted(dated, np.datetime64(start, "ns"), "left") if start else 0
+        j = (np.searchsorted(dated, np.datetime64(end, "ns") + np.timedelta64(1, "D"), "left")
+             if end else self.n_dated)
+        return int(i), int(j)
+
+    def _value_codes(self, axis, values):
+        """Codes des valeurs sélectionnées (MISSING = code des valeurs manquantes)."""
+        position = {label: code for code, label in enumerate(self.labels[axis])}
+        wanted = (None if v == MISSING else v for v in values)
+        return [position[v] for v in wanted if v in position]
+
+    def select(self, start=None, end=None, regions=(), employees=(), sources=()):
+        """Positions des cellules retenues par les filtres (listes vides = tout)."""
+        i, j = self._date_slice(start, end)
+        mask = np.ones(j - i, dtype=bool)
+        for axis, values in zip(FILTER_AXES, (regions, employees, sources)):
+            if not values:
+                continue
+            order, offsets = self.groups[axis]
+            keep = np.zeros(len(self.cells), dtype=bool)
+            for code in self._value_codes(axis, values):
+                keep[order[offsets[code]:offsets[code + 1]]] = True
+            mask &= keep[i:j]
+        return np.arange(i, j)[mask]
+
+    def _count(self, axis, idx):
+        labels = self.labels[axis]
+        counts = np.bincount(self.codes[axis][idx], weights=self.count[idx], minlength=len(labels))
+        present = counts > 0
+        return pd.DataFrame({axis: labels[present], "count": counts[present].astype(np.int64)})
+
+    def _count_pair(self, first, second, idx):
+        """Comptage par (first, second), sans les valeurs manquantes."""
+        n1, n2 = len(self.labels[first]) - 1, len(self.labels[second]) - 1
+        c1, c2 = self.codes[first][idx], self.codes[second][idx]
+        known = (c1 < n1) & (c2 < n2)
+        pair = c1[known] * n2 + c2[known]
+        counts = np.bincount(pair, weights=self.count[idx][known], minlength=n1 * n2)
+        present = np.flatnonzero(counts)
+        return pd.DataFrame({
+            first: self.labels[first][present // n2],
+            second: self.labels[second][present % n2],
+            "count": counts[present].astype(np.int64),
+        })
+
+    def _series(self, start=None, end=None, regions=(), employees=(), sources=()):
+        idx = self.select(start, end, regions, employees, sources)
+        series = {name: self._count(axis, idx) for name, axis in SERIES_AXES.items()}
+        series["by_region_employee"] = self._count_pair("region", "employee name", idx)
+        total = int(self.count[idx].sum())
+        delivered = int(self.count[idx][self.delivered[idx]].sum())
+        series["kpis"] = (total, delivered, total - delivered,
+                          round(delivered / total * 100, 2) if total else 0.0)
+        return series
+
+    def _cube(self, start=None, end=None, regions=(), employees=(), sources=(), period="M", mode="auto"):
+        """
+        (niveau, points) du cube 3D pour un état de filtre :
+        niveau "detail" -> une ligne par (employé, client, date, statut) avec `count` ;
+        niveau "aggregated" -> une ligne par (employé, client, période) avec
+        `count`, `delivered` et `rate` (taux de livraison en %).
+        """
+        idx = self.select(start, end, regions, employees, sources)
+        if mode == "auto":
+            mode = "detail" if self.count[idx].sum() <= RAW_POINT_LIMIT else "aggregated"
+        subset = self.cells.iloc[idx]
+        if mode == "detail":
+            return mode, count_by(subset, CUBE_AXES + ["date", "status"])
+        return mode, cube_bins(subset, period)
+
+
+def cube_bins(cells, period="M"):
+    """Cellules regroupées par (employé, client, début de période), avec taux de livraison."""
+    bins = cells[CUBE_AXES + ["count"]].copy()
+    bins["period"] = cells["date"].dt.to_period(period).dt.start_time
+    bins["delivered"] = np.where(cells["delivered"] == 1, cells["count"], 0)
+    bins = bins.groupby(CUBE_AXES + ["period"], dropna=False, observed=True)[["count", "delivered"]].sum().reset_index()
+    bins["rate"] = (bins["delivered"] / bins["count"] * 100).round(1)
+    return bins
@@ -1,27 +1,268 @@
-import pandas as pd
+"""
+extract_excel.py
+Ingestion de tous les classeurs Excel exportés depuis Access (data/sources/*.xlsx)
+vers data/raw/excel_sources/.
+
+Chaque classeur est lu en streaming (openpyxl en lecture seule) et écrit par lots,
+les classeurs étant répartis sur un pool de processus. Les valeurs gardent leur
+type natif (entiers nullables, dates ISO, booléens) et le schéma de chaque
+table est enregistré dans data/raw/excel_sources/_schema.json.
+
+    python scripts/extract_excel.py               # tous les classeurs
+    python scripts/extract_excel.py Orders        # un sous-ensemble
+    python scripts/extract_excel.py --bench       # comparaison avec pd.read_excel
+
+Un classeur dont l'empreinte (data/raw/_manifest.json) n'a pas changé depuis
+la dernière extraction n'est pas relu (--force pour tout reconvertir).
+"""
+import argparse
+import json
 import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import manifest
+import metrics
+
+# pandas est importé dans les fonctions qui l'utilisent : une relance dont
+# tous les classeurs sont inchangés n'en paie pas le coût d'import.
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
 
 # Dossier source (Excel exporté depuis Access)
-input_folder = "data/sources/"
+INPUT_FOLDER = os.path.join(BASE, "data", "sources")
 
 # Dossier de sortie
-output_folder = "../data/raw/excel_sources/"
-os.makedirs(output_folder, exist_ok=True)
+OUTPUT_FOLDER = os.path.join(BASE, "data", "raw", "excel_sources")
+SCHEMA_FILE = "_schema.json"
+
+# Lignes converties en DataFrame à la fois
+BATCH_ROWS = 50_000
+
+# Écriture des dates dans le CSV
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def discover_workbooks(input_folder=INPUT_FOLDER):
+    """Retourne {nom de table: chemin} pour chaque .xlsx du dossier."""
+    books = {}
+    for file in sorted(os.listdir(input_folder)):
+        if file.lower().endswith(".xlsx") and not file.startswith("~$"):
+            books[os.path.splitext(file)[0]] = os.path.join(input_folder, file)
+    return books
+
+
+def output_name(table):
+    return table.replace(" ", "_") + ".csv"
+
+
+def _typed(rows, columns, dtypes):
+    """
+    Lot de lignes -> DataFrame typé. Le premier lot fixe les types (`dtypes`
+    vide, rempli ici) ; les suivants y sont ramenés, de sorte qu'une colonne
+    s'écrit de la même façon dans tout le CSV. Une colonne qu'un lot ne permet
+    plus de convertir est élargie (Int64 -> Float64, sinon object) et le schéma
+    l'indique.
+    """
+    import pandas as pd
+
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    if not dtypes:
+        # entiers avec cellules vides -> Int64 plutôt que float ("12.0")
+        df = df.convert_dtypes(convert_string=False)
+        dtypes.update((c, str(t)) for c, t in df.dtypes.items())
+        return df
+    for column, dtype in dtypes.items():
+        if dtype == "object" or str(df[column].dtype) == dtype:
+            continue
+        for target in ([dtype, "Float64"] if dtype == "Int64" else [dtype]):
+            try:
+                df[column] = df[column].astype(target)
+                dtypes[column] = target
+                break
+            except (TypeError, ValueError):
+                pass
+        else:
+            dtypes[column] = "object"
+    return df
+
+
+def _dates_as_text(df, formats):
+    """
+    Dates -> texte au format fixé par le premier lot : la date seule, ou la date
+    et l'heure dès qu'une valeur a une heure (pandas en déciderait lot par lot).
+    """
+    for column in df.columns:
+        if not str(df[column].dtype).startswith("datetime64"):
+            continue
+        values = df[column].dropna()
+        fmt = formats.get(column, DATE_FORMAT)
+        if (values != values.dt.normalize()).any():
+            fmt = DATETIME_FORMAT
+        formats[column] = fmt
+        df[column] = df[column].dt.strftime(fmt)
+    return df
+
+
+def convert_workbook(path, output_path, batch_rows=BATCH_ROWS):
+    """
+    Lit la première feuille de `path` en streaming et l'écrit en CSV par lots.
+    Retourne (lignes, durée, {colonne: dtype}).
+    """
+    from openpyxl import load_workbook
+
+    start = time.perf_counter()
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        columns = [str(c) if c is not None else f"col_{i}" for i, c in enumerate(header or [])]
+
+        tmp_path = output_path + ".part"
+        total = 0
+        dtypes = {}
+        date_formats = {}
+        batch = []
+        first = True
+        for row in rows:
+            if not any(v is not None and v != "" for v in row):
+                continue
+            batch.append(row[:len(columns)])
+            if len(batch) >= batch_rows:
+                df = _dates_as_text(_typed(batch, columns, dtypes), date_formats)
+                df.to_csv(tmp_path, mode="w" if first else "a", header=first, index=False, encoding="utf-8")
+                total += len(batch)
+                first = False
+                batch = []
+        if batch or first:
+            df = _dates_as_text(_typed(batch, columns, dtypes), date_formats)
+            df.to_csv(tmp_path, mode="w" if first else "a", header=first, index=False, encoding="utf-8")
+            total += len(batch)
+    finally:
+        wb.close()
+
+    os.replace(tmp_path, output_path)
+    return total, time.perf_counter() - start, dtypes
+
+
+def _convert_task(args):
+    table, path, output_folder = args
+    rows, elapsed, dtypes = convert_workbook(path, os.path.join(output_folder, output_name(table)))
+    return table, rows, elapsed, dtypes
+
+
+def extract_all(books, output_folder=OUTPUT_FOLDER, workers=None, verbose=True, force=False, cache=True):
+    """
+    Convertit les classeurs `books` ({table: chemin}) sur un pool de processus.
+    Sauf `force`, les classeurs inchangés depuis la dernière extraction sont
+    ignorés ; `cache=False` n'utilise ni ne met à jour le manifeste.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    state = manifest.load_manifest() if cache else {}
+    tasks = []
+    for table, path in books.items():
+        output_path = os.path.join(output_folder, output_name(table))
+        if cache and not force and manifest.is_fresh(f"extract_excel:{table}", [path, __file__], [output_path], state):
+            if verbose:
+                print(f" Fichier Excel inchangé : {os.path.basename(path)}")
+            continue
+        tasks.append((table, path, output_folder))
+
+    if workers == 1 or len(tasks) <= 1:
+        outputs = [_convert_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outputs = list(executor.map(_convert_task, tasks))
+
+    results = {}
+    for table, rows, elapsed, dtypes in outputs:
+        results[table] = {"rows": rows, "seconds": round(elapsed, 4), "dtypes": dtypes}
+        if verbose:
+            print(f" Fichier Excel importé : {os.path.basename(books[table])} ({rows} lignes, {elapsed:.2f}s)")
+        if cache:
+            manifest.record(f"extract_excel:{table}", [books[table], __file__],
+                            [os.path.join(output_folder, output_name(table))], state, save=False)
+    if not results:
+        return results
+    if cache:
+        manifest.save_manifest(state)
+
+    schema_path = os.path.join(output_folder, SCHEMA_FILE)
+    schema = {}
+    if os.path.exists(schema_path):
+        with open(schema_path, encoding="utf-8") as f:
+            schema = json.load(f)
+    schema.update({table: r["dtypes"] for table, r in results.items()})
+    with open(schema_path, "w", encoding="utf-8") as f:
+        json.dump(schema, f, indent=2, ensure_ascii=False)
+    return results
+
+
+def legacy_extract(books, output_folder):
+    """Ancienne boucle séquentielle pd.read_excel (référence du benchmark)."""
+    import pandas as pd
+
+    for table, path in books.items():
+        df = pd.read_excel(path)
+        df.to_csv(os.path.join(output_folder, output_name(table)), index=False, encoding="utf-8")
+
+
+def benchmark(books, workers=None, repeat=3):
+    """Compare la boucle pd.read_excel et le moteur parallèle (meilleur de `repeat`)."""
+    timings = {"pd.read_excel (séquentiel)": [], "openpyxl streaming + pool": []}
+    tmp = tempfile.mkdtemp()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            legacy_extract(books, tmp)
+            timings["pd.read_excel (séquentiel)"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            extract_all(books, tmp, workers=workers, verbose=False, cache=False)
+            timings["openpyxl streaming + pool"].append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"\n===== Benchmark ingestion Excel ({len(books)} classeurs) =====")
+    for label, values in timings.items():
+        print(f"{label:<30} {min(values):8.3f}s")
+    return {label: min(values) for label, values in timings.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestion des classeurs Access -> CSV")
+    parser.add_argument("tables", nargs="*", help="classeurs à charger (par défaut : tous)")
+    parser.add_argument("--input", default=INPUT_FOLDER, help="dossier des .xlsx")
+    parser.add_argument("--output", default=OUTPUT_FOLDER, help="dossier de sortie")
+    parser.add_argument("--workers", type=int, default=None, help="taille du pool de processus")
+    parser.add_argument("--force", action="store_true", help="reconvertir même les classeurs inchangés")
+    parser.add_argument("--bench", action="store_true", help="comparer avec la boucle pd.read_excel")
+    args = parser.parse_args(argv)
 
-# Tables Excel à charger
-excel_files = {
-    "Customers": "Customers.xlsx",
-    "Employees": "Employees.xlsx",
-    "Orders": "Orders.xlsx"
-}
+    books = discover_workbooks(args.input)
+    if args.tables:
+        missing = [t for t in args.tables if t not in books]
+        if missing:
+            parser.error(f"classeurs introuvables : {', '.join(missing)}")
+        books = {t: books[t] for t in args.tables}
 
-for name, file in excel_files.items():
-    path = os.path.join(input_folder, file)
-    df = pd.read_excel(path)
+    if args.bench:
+        benchmark(books, args.workers)
+        return
 
-    output_path = os.path.join(output_folder, name + ".csv")
-    df.to_csv(output_path, index=False, encoding="utf-8")
+    run = metrics.start("extract_excel")
+    start = time.perf_counter()
+    results = extract_all(books, args.output, args.workers, force=args.force)
+    for table, r in results.items():
+        metrics.add_stage(table, r["seconds"], rows_out=r["rows"])
+    metrics.record("skipped", sorted(set(books) - set(results)))
+    run.finish()
+    print(f"\n Extraction Excel terminée en {time.perf_counter() - start:.2f}s !"
+          " Les fichiers sont dans data/raw/excel_sources/")
 
-    print(f" Fichier Excel importé : {file}")
 
-print("\n Extraction Excel terminée ! Les fichiers sont dans data/raw/excel_sources/")
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,41 @@
-import pyodbc #pouvoir se connecter a sql server
-import pandas as pd #transformer les tables sql server en csv
+"""
+extract_sql.py
+Extraction des tables Northwind depuis SQL Server vers data/raw/sql_sources/.
+Les tables sont lues par lots (chunksize) et ajoutées au CSV au fil de l'eau :
+la mémoire reste constante quelle que soit la taille de la table.
+
+Mode incrémental (--incremental) : pour les tables déclarées dans INCREMENTAL,
+seules les lignes au-delà du dernier high-water mark sont extraites puis
+fusionnées dans le CSV existant.
+
+Mode parallèle (--workers N) : les tables sont extraites simultanément via un
+pool borné de connexions ; --partitions P découpe en plus les grosses tables
+(PARTITION_KEYS) en P plages de clés.
+
+Une table dont le checksum (data/raw/_manifest.json) n'a pas changé depuis la
+dernière extraction complète n'est pas relue (--force pour tout réextraire).
+"""
+import argparse
+import json
 import os #creer des dossier
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd #transformer les tables sql server en csv
+
+import manifest
+import metrics
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+OUTPUT_FOLDER = os.path.join(BASE, "data", "raw", "sql_sources")
+WATERMARK_FILE = "_watermarks.json"
 
 #Connexion à SQL Server
-conn_str = (
+CONN_STR = (
     "Driver={ODBC Driver 17 for SQL Server};"
     "Server=localhost\\SQLEXPKHELIL;"
     "Database=Northwind;"
@@ -11,30 +43,425 @@ conn_str = (
     "PWD=khelil2059;"
 )
 
-conn = pyodbc.connect(conn_str)
-
 #Tables à extraire
-tables = [
+TABLES = [
     "Customers",
     "Employees",
     "Orders"
 ]
 
-#Dossier de sortie
-output_folder = "../data/raw/sql_sources/"
-os.makedirs(output_folder, exist_ok=True)
+# Tables extraites en incrémental : colonne de watermark + clé primaire.
+# Si watermark == clé (identité croissante), les nouvelles lignes sont ajoutées ;
+# sinon (date de modification), les lignes modifiées remplacent les anciennes.
+INCREMENTAL = {
+    "Orders": {"watermark": "OrderID", "key": "OrderID"},
+}
+
+# Clé numérique servant à découper une grosse table en plages (--partitions)
+PARTITION_KEYS = {
+    "Orders": "OrderID",
+}
+
+# Nombre de lignes lues par lot (0 = table entière en mémoire)
+DEFAULT_CHUNKSIZE = 50_000
+
+
+def get_connection(conn_str=CONN_STR):
+    """Ouvre une connexion pyodbc (pouvoir se connecter a sql server)."""
+    # import local : une base SQLite peut remplacer SQL Server sans pyodbc
+    import pyodbc
+    return pyodbc.connect(conn_str)
+
+
+def output_path_for(table, output_folder=OUTPUT_FOLDER):
+    return os.path.join(output_folder, table.replace(" ", "_") + ".csv")
 
-#Extraction + export
-for table in tables:
+
+def _frame(records, columns):
+    """
+    Lot de lignes -> DataFrame. Une colonne entière qui contient des NULL est
+    gardée en Int64 (pandas la passerait en float) : un entier s'écrit "5" dans
+    tous les lots, qu'ils contiennent des NULL ou non.
+    """
+    df = pd.DataFrame.from_records(records, columns=columns, coerce_float=True)
+    for i, column in enumerate(columns):
+        if df[column].dtype != "float64":
+            continue
+        values = [record[i] for record in records]
+        if all(isinstance(v, int) for v in values if v is not None):
+            df[column] = pd.array(values, dtype="Int64")
+    return df
+
+
+def stream_query(conn, query, path, params=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Écrit le résultat de `query` dans `path` lot par lot. Retourne le nombre de lignes."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params or [])
+        columns = [d[0] for d in cursor.description]
+        rows = 0
+        header = True
+        while True:
+            records = cursor.fetchmany(chunksize) if chunksize else cursor.fetchall()
+            if not records and not header:
+                break
+            # résultat vide : le premier lot (vide) écrit au moins l'en-tête
+            _frame(records, columns).to_csv(path, mode="w" if header else "a", header=header,
+                                            index=False, encoding="utf-8")
+            header = False
+            rows += len(records)
+            if not chunksize:
+                break
+    finally:
+        cursor.close()
+    return rows
+
+
+def extract_table(conn, table, output_folder=OUTPUT_FOLDER, chunksize=DEFAULT_CHUNKSIZE,
+                  where=None, params=None):
+    """
+    Exporte une table en CSV, lot par lot. Chaque lot est ajouté au fichier
+    puis libéré ; le fichier final n'apparaît qu'une fois complet.
+    Retourne (nombre de lignes, durée en secondes).
+    """
     query = f"SELECT * FROM [{table}]"
-    df = pd.read_sql(query, conn)
+    if where:
+        query += f" WHERE {where}"
+    output_path = output_path_for(table, output_folder)
+    tmp_path = output_path + ".part"
+
+    start = time.perf_counter()
+    rows = stream_query(conn, query, tmp_path, params, chunksize)
+    os.replace(tmp_path, output_path)
+    return rows, time.perf_counter() - start
+
+
+# -------------------------
+# Extraction incrémentale
+# -------------------------
+def load_watermarks(output_folder=OUTPUT_FOLDER):
+    path = os.path.join(output_folder, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_watermarks(state, output_folder=OUTPUT_FOLDER):
+    path = os.path.join(output_folder, WATERMARK_FILE)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".part", path)
+
+
+def _watermark_value(value):
+    """Valeur sérialisable en JSON et réutilisable comme paramètre SQL."""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat(sep=" ") if hasattr(value, "hour") else value.isoformat()
+    return str(value)
+
+
+def merge_delta(output_path, delta_path, key, append_only, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Fusionne le delta dans le CSV existant.
+    - append_only : les lignes du delta sont ajoutées en fin de fichier.
+    - sinon : les lignes existantes dont la clé figure dans le delta sont
+      retirées (lecture par lots) puis le delta est ajouté.
+    """
+    delta = pd.read_csv(delta_path, dtype=str, keep_default_na=False)
+    if delta.empty:
+        return
+
+    if append_only:
+        # ajout en place : coût proportionnel au delta ; en cas d'erreur le
+        # fichier est tronqué à sa taille d'origine
+        with open(output_path, "a", encoding="utf-8", newline="") as f:
+            size = f.tell()
+            try:
+                delta.to_csv(f, header=False, index=False)
+            except BaseException:
+                f.truncate(size)
+                raise
+        return
+
+    tmp_path = output_path + ".part"
+    changed = set(delta[key])
+    header = True
+    for chunk in pd.read_csv(output_path, dtype=str, keep_default_na=False, chunksize=chunksize or None):
+        chunk = chunk[~chunk[key].isin(changed)]
+        chunk.to_csv(tmp_path, mode="w" if header else "a", header=header,
+                     index=False, encoding="utf-8")
+        header = False
+    delta.to_csv(tmp_path, mode="a", header=False, index=False, encoding="utf-8")
+    os.replace(tmp_path, output_path)
+
+
+def extract_incremental(conn, table, state, output_folder=OUTPUT_FOLDER, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Extrait uniquement les lignes entre le watermark précédent et le MAX actuel,
+    puis les fusionne dans le CSV existant. Première exécution (pas de
+    watermark ou pas de fichier) : extraction complète bornée par le MAX actuel.
+    Met à jour `state[table]` et retourne (lignes extraites, durée).
+    """
+    cfg = INCREMENTAL[table]
+    col, key = cfg["watermark"], cfg["key"]
+    output_path = output_path_for(table, output_folder)
+
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MAX([{col}]) FROM [{table}]")
+    high = _watermark_value(cursor.fetchone()[0])
+    cursor.close()
+
+    low = state.get(table)
+    if high is None:
+        rows, _ = extract_table(conn, table, output_folder, chunksize)
+    elif low is None or not os.path.exists(output_path):
+        rows, _ = extract_table(conn, table, output_folder, chunksize,
+                                where=f"[{col}] <= ?", params=[high])
+    else:
+        delta_path = output_path + ".delta"
+        query = f"SELECT * FROM [{table}] WHERE [{col}] > ? AND [{col}] <= ?"
+        rows = stream_query(conn, query, delta_path, [low, high], chunksize)
+        merge_delta(output_path, delta_path, key, append_only=(col == key), chunksize=chunksize)
+        os.remove(delta_path)
+
+    if high is not None:
+        state[table] = high
+    return rows, time.perf_counter() - start
+
+
+# -------------------------
+# Extraction parallèle
+# -------------------------
+class ConnectionPool:
+    """
+    Pool borné de connexions : au plus `size` connexions ouvertes, chacune
+    utilisée par un seul worker à la fois. Avec SQLite, la fabrique doit
+    ouvrir ses connexions avec check_same_thread=False.
+    """
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self.factory()
+                with self._lock:
+                    self._opened.append(conn)
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            for conn in self._opened:
+                conn.close()
+            self._opened.clear()
+
+
+def partition_bounds(conn, table, key, partitions):
+    """Découpe [MIN(key), MAX(key)] en `partitions` intervalles [début, fin[ (le dernier est fermé)."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT MIN([{key}]), MAX([{key}]) FROM [{table}]")
+    low, high = cursor.fetchone()
+    cursor.close()
+    if low is None:
+        return []
+    step = max(1, -(-(high - low + 1) // partitions))
+    bounds = []
+    start = low
+    while start <= high:
+        bounds.append((start, min(start + step, high + 1)))
+        start += step
+    return bounds
+
+
+def extract_partition(conn, table, key, bounds, part_path, chunksize=DEFAULT_CHUNKSIZE):
+    query = f"SELECT * FROM [{table}] WHERE [{key}] >= ? AND [{key}] < ?"
+    return stream_query(conn, query, part_path, list(bounds), chunksize)
+
+
+def concat_parts(part_paths, output_path):
+    """Concatène les fichiers de partition (en-tête du premier uniquement)."""
+    tmp_path = output_path + ".part"
+    with open(tmp_path, "wb") as dst:
+        for i, part in enumerate(part_paths):
+            with open(part, "rb") as src:
+                header = src.readline()
+                if i == 0:
+                    dst.write(header)
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.remove(part)
+    os.replace(tmp_path, output_path)
+
+
+def extract_parallel(factory, tables, output_folder=OUTPUT_FOLDER, workers=4,
+                     chunksize=DEFAULT_CHUNKSIZE, partitions=1, incremental=False, state=None,
+                     sources=None, force=False):
+    """
+    Extrait les tables en parallèle via un pool de `workers` connexions.
+    Les tables de PARTITION_KEYS sont découpées en `partitions` plages de clés
+    extraites indépendamment puis concaténées dans l'ordre.
+    Si `sources` (manifeste, cf. manifest.py) est fourni, une table extraite
+    en entier dont le checksum n'a pas changé n'est pas relue (sauf `force`).
+    Si `state` (watermarks) est fourni, il est mis à jour et sauvegardé dans
+    `output_folder` dès qu'une table est publiée : une erreur sur une autre
+    table ne peut pas faire réappliquer un delta déjà fusionné.
+    Retourne {table: (lignes, durée)} ; la durée va du début de la première
+    tâche de la table à la fin de la dernière, lignes vaut None si la table
+    est inchangée.
+    """
+    persist = state is not None
+    state = {} if state is None else state
+    state_lock = threading.Lock()
+    checksums = {}
+    pool = ConnectionPool(factory, workers)
+    timings = {}
+    timings_lock = threading.Lock()
+
+    def publish(table, mark):
+        # the CSV of `table` is final: its watermark (or its absence after a
+        # full, unbounded extraction) is saved at once
+        with state_lock:
+            if table in mark:
+                state[table] = mark[table]
+            else:
+                state.pop(table, None)
+            if persist:
+                save_watermarks(state, output_folder)
+
+    def timed(table, func, *args):
+        start = time.perf_counter()
+        rows = func(*args)
+        end = time.perf_counter()
+        with timings_lock:
+            t = timings.setdefault(table, [0, start, end])
+            t[0] += rows
+            t[1] = min(t[1], start)
+            t[2] = max(t[2], end)
+        return rows
+
+    def run_table(table):
+        mark = {}
+        with pool.connection() as conn:
+            if incremental and table in INCREMENTAL:
+                with state_lock:
+                    if table in state:
+                        mark[table] = state[table]
+                rows = extract_incremental(conn, table, mark, output_folder, chunksize)[0]
+            else:
+                rows = extract_table(conn, table, output_folder, chunksize)[0]
+        publish(table, mark)
+        return rows
+
+    def run_partition(table, key, bounds, part_path):
+        with pool.connection() as conn:
+            return extract_partition(conn, table, key, bounds, part_path, chunksize)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            split = {}
+            for table in tables:
+                full = not (incremental and table in INCREMENTAL)
+                if full and sources is not None:
+                    with pool.connection() as conn:
+                        checksums[table] = manifest.table_checksum(conn, table)
+                    if not force and manifest.is_fresh(f"extract_sql:{table}", [],
+                                                       [output_path_for(table, output_folder)],
+                                                       sources, extra=checksums[table]):
+                        timings[table] = [None, 0.0, 0.0]
+                        checksums.pop(table)
+                        continue
+                key = PARTITION_KEYS.get(table)
+                partitioned = partitions > 1 and key and full
+                if partitioned:
+                    with pool.connection() as conn:
+                        ranges = partition_bounds(conn, table, key, partitions)
+                    partitioned = len(ranges) > 1
+                if not partitioned:
+                    futures.append(executor.submit(timed, table, run_table, table))
+                    continue
+                output_path = output_path_for(table, output_folder)
+                split[table] = [f"{output_path}.{i:03d}" for i in range(len(ranges))]
+                for bounds, part_path in zip(ranges, split[table]):
+                    futures.append(executor.submit(timed, table, run_partition,
+                                                   table, key, bounds, part_path))
+            for future in futures:
+                future.result()
+    finally:
+        pool.close()
+
+    for table, part_paths in split.items():
+        concat_parts(part_paths, output_path_for(table, output_folder))
+        publish(table, {})
+    for table, checksum in checksums.items():
+        manifest.record(f"extract_sql:{table}", [], [output_path_for(table, output_folder)],
+                        sources, extra=checksum, save=False)
+    return {table: (rows, end - start) for table, (rows, start, end) in timings.items()}
+
+
+def report(table, rows, elapsed):
+    if rows is None:
+        print(f" Table inchangée : {table} (checksum identique, extraction ignorée)")
+        return
+    rate = rows / elapsed if elapsed > 0 else float("inf")
+    print(f" Table exportée : {table} ({rows} lignes, {elapsed:.2f}s, {rate:,.0f} lignes/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extraction SQL Server -> CSV")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="lignes par lot (0 = lecture complète en mémoire)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="n'extraire que les nouvelles lignes des tables de INCREMENTAL")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="nombre de connexions / extractions simultanées")
+    parser.add_argument("--partitions", type=int, default=1,
+                        help="plages de clés par table de PARTITION_KEYS (extraction complète)")
+    parser.add_argument("--force", action="store_true", help="réextraire même les tables inchangées")
+    parser.add_argument("--output", default=OUTPUT_FOLDER, help="dossier de sortie")
+    parser.add_argument("tables", nargs="*", default=TABLES, help="tables à extraire")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    state = load_watermarks(args.output)
+    sources = manifest.load_manifest()
 
-    file_name = table.replace(" ", "_") + ".csv"
-    output_path = os.path.join(output_folder, file_name)
+    run = metrics.start("extract_sql")
+    start = time.perf_counter()
+    timings = extract_parallel(get_connection, args.tables, args.output, max(1, args.workers),
+                               args.chunksize, args.partitions, args.incremental, state,
+                               sources, args.force)
+    manifest.save_manifest(sources)
+    for table in args.tables:
+        report(table, *timings.get(table, (0, 0.0)))
+        rows, elapsed = timings.get(table, (0, 0.0))
+        if rows is None:
+            metrics.record("unchanged_" + table, True)
+        else:
+            metrics.add_stage(table, elapsed, rows_out=rows)
+    run.finish()
 
-    df.to_csv(output_path, index=False, encoding="utf-8")
-    print(f" Table exportée : {table}")
+    print(f"\n Extraction SQL Server terminée en {time.perf_counter() - start:.2f}s !"
+          " Les fichiers sont dans data/raw/sql_sources/")
 
-conn.close()
 
-print("\n Extraction SQL Server terminée ! Les fichiers sont dans data/raw/sql_sources/")
+if __name__ == "__main__":
+    main()
@@ -1,70 +1,123 @@
 """
 kpi_analysis.py
 Calcul des KPI principaux (Total commandes, Livrées, Non livrées, Taux de livraison),
-par pays, par employé et par mois. Résultats affichés et sauvegardés.
+par pays, par employé et par mois, et chiffre d'affaires par catégorie de produit
+(si fact_order_lines est chargée). Résultats affichés et sauvegardés.
+
+Les résumés sont calculés sur le cube agrégé agg_orders (voir aggregates.py),
+sans relire les lignes de fact_orders.
+
+Avec --from / --to, les KPI portent sur une plage de dates : le cube est
+recalculé depuis les seules partitions mensuelles de fact_orders qui la
+recoupent, et les résumés vont dans kpi_summaries/<début>_<fin>/.
+
+    python scripts/kpi_analysis.py [--from 1997-01-01] [--to 1997-06-30]
 """
+import argparse
 import os
 import pandas as pd
 
+import aggregates
+import metrics
+from storage import date_key, read_table
+
 BASE = os.path.join(os.path.dirname(__file__), "..")
 WH = os.path.join(BASE, "data", "warehouse")
 
-fact_path = os.path.join(WH, "fact_orders.csv")
-dim_c_path = os.path.join(WH, "dim_customers.csv")
-dim_e_path = os.path.join(WH, "dim_employees.csv")
-dim_t_path = os.path.join(WH, "dim_temps.csv")
-
-# Load
-fact = pd.read_csv(fact_path, parse_dates=["orderdate","shippeddate"], keep_default_na=False, na_values=[""])
-dim_c = pd.read_csv(dim_c_path, keep_default_na=False, na_values=[""])
-dim_e = pd.read_csv(dim_e_path, keep_default_na=False, na_values=[""])
-dim_t = pd.read_csv(dim_t_path, parse_dates=["date"], keep_default_na=False, na_values=[""])
-
-# Safeguard
-if fact.empty:
-    print("⚠️ fact_orders.csv est vide — exécute datawarehouse.py d'abord.")
-    raise SystemExit
-
-# Basic KPIs
-total_orders = len(fact)
-delivered = int(fact["delivered"].sum())
-not_delivered = total_orders - delivered
-delivered_rate = (delivered / total_orders * 100) if total_orders > 0 else 0.0
-
-print("\n===== KPI GLOBAUX =====")
-print(f"Total commandes : {total_orders}")
-print(f"Commandes livrées : {delivered}")
-print(f"Commandes non livrées : {not_delivered}")
-print(f"Taux de livraison : {delivered_rate:.2f}%")
-
-# Orders by country (use dim_customers mapping)
-# Merge to get country
-fact_c = fact.merge(dim_c[['customer_key','country']], left_on='customer_key', right_on='customer_key', how='left')
-orders_by_country = fact_c.groupby('country').agg(total_orders=('fact_key','count'), delivered=('delivered','sum')).reset_index()
-orders_by_country['not_delivered'] = orders_by_country['total_orders'] - orders_by_country['delivered']
-print("\n===== Commandes par pays (résumé) =====")
-print(orders_by_country.sort_values('total_orders', ascending=False).head(20).to_string(index=False))
-
-# Orders by employee
-fact_e = fact.merge(dim_e[['employee_key','firstname','lastname']], left_on='employee_key', right_on='employee_key', how='left')
-fact_e['employee_name'] = fact_e['firstname'].fillna('') + ' ' + fact_e['lastname'].fillna('')
-orders_by_employee = fact_e.groupby('employee_name').agg(total_orders=('fact_key','count'), delivered=('delivered','sum')).reset_index()
-orders_by_employee['not_delivered'] = orders_by_employee['total_orders'] - orders_by_employee['delivered']
-print("\n===== Commandes par employé (résumé) =====")
-print(orders_by_employee.sort_values('total_orders', ascending=False).head(20).to_string(index=False))
-
-# Orders by month (use orderdate)
-fact['period'] = pd.to_datetime(fact['orderdate'], errors='coerce').dt.to_period('M')
-orders_by_month = fact.groupby('period').agg(total_orders=('fact_key','count'), delivered=('delivered','sum')).reset_index()
-orders_by_month['not_delivered'] = orders_by_month['total_orders'] - orders_by_month['delivered']
-print("\n===== Commandes par mois =====")
-print(orders_by_month.sort_values('period').to_string(index=False))
-
-# Save summaries
-out_dir = os.path.join(WH, "kpi_summaries")
-os.makedirs(out_dir, exist_ok=True)
-orders_by_country.to_csv(os.path.join(out_dir, "orders_by_country.csv"), index=False)
-orders_by_employee.to_csv(os.path.join(out_dir, "orders_by_employee.csv"), index=False)
-orders_by_month.to_csv(os.path.join(out_dir, "orders_by_month.csv"), index=False)
-
-print(f"\n✅ KPI summary files saved to {out_dir}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KPI des commandes")
+    parser.add_argument("--from", dest="start", help="première date (AAAA-MM-JJ)")
+    parser.add_argument("--to", dest="end", help="dernière date (AAAA-MM-JJ)")
+    args = parser.parse_args(argv)
+    between = None
+    if args.start or args.end:
+        between = ("orderdate_key", date_key(args.start), date_key(args.end))
+
+    run = metrics.start("kpi_analysis")
+
+    # Load the aggregate cube (built by datawarehouse.py; rebuilt from the facts for an older warehouse
+    # or a date range, reading only the partitions of the range)
+    with metrics.stage("load_cube") as st:
+        cube = aggregates.load_cube(WH) if between is None else None
+        if cube is None:
+            cube = aggregates.aggregate_orders(
+                read_table("fact_orders", WH, columns=aggregates.FACT_COLUMNS, between=between),
+                read_table("dim_customers", WH, columns=["customer_key", "country"]))
+        dim_e = read_table("dim_employees", WH, columns=["employee_key", "firstname", "lastname"])
+        st.rows_out = len(cube)
+
+    # Safeguard
+    if cube.empty and between is not None:
+        print(f"⚠️ Aucune commande entre {args.start or 'le début'} et {args.end or 'la fin'}.")
+        run.finish("empty")
+        return
+    if cube.empty:
+        print("⚠️ fact_orders.csv est vide — exécute datawarehouse.py d'abord.")
+        run.finish("empty")
+        return
+
+    # Basic KPIs
+    total_orders = int(cube["total_orders"].sum())
+    delivered = int(cube["delivered"].sum())
+    not_delivered = total_orders - delivered
+    delivered_rate = (delivered / total_orders * 100) if total_orders > 0 else 0.0
+
+    print("\n===== KPI GLOBAUX =====")
+    print(f"Total commandes : {total_orders}")
+    print(f"Commandes livrées : {delivered}")
+    print(f"Commandes non livrées : {not_delivered}")
+    print(f"Taux de livraison : {delivered_rate:.2f}%")
+    metrics.record("kpi", {"total_orders": total_orders, "delivered": delivered, "delivery_rate": round(delivered_rate, 2)})
+
+    # Orders by country (country is an axis of the cube)
+    orders_by_country = cube.groupby('country').agg(total_orders=('total_orders','sum'), delivered=('delivered','sum')).reset_index()
+    orders_by_country['not_delivered'] = orders_by_country['total_orders'] - orders_by_country['delivered']
+    print("\n===== Commandes par pays (résumé) =====")
+    print(orders_by_country.sort_values('total_orders', ascending=False).head(20).to_string(index=False))
+
+    # Orders by employee (roll the cube up to employee_key, then attach the names)
+    cube_e = cube.groupby('employee_key', dropna=False).agg(total_orders=('total_orders','sum'), delivered=('delivered','sum')).reset_index()
+    cube_e = cube_e.merge(dim_e[['employee_key','firstname','lastname']], left_on='employee_key', right_on='employee_key', how='left')
+    cube_e['employee_name'] = cube_e['firstname'].fillna('') + ' ' + cube_e['lastname'].fillna('')
+    orders_by_employee = cube_e.groupby('employee_name').agg(total_orders=('total_orders','sum'), delivered=('delivered','sum')).reset_index()
+    orders_by_employee['not_delivered'] = orders_by_employee['total_orders'] - orders_by_employee['delivered']
+    print("\n===== Commandes par employé (résumé) =====")
+    print(orders_by_employee.sort_values('total_orders', ascending=False).head(20).to_string(index=False))
+
+    # Orders by month
+    cube['period'] = cube['month'].dt.to_period('M')
+    orders_by_month = cube.groupby('period').agg(total_orders=('total_orders','sum'), delivered=('delivered','sum')).reset_index()
+    orders_by_month['not_delivered'] = orders_by_month['total_orders'] - orders_by_month['delivered']
+    print("\n===== Commandes par mois =====")
+    print(orders_by_month.sort_values('period').to_string(index=False))
+
+    # Save summaries
+    out_dir = os.path.join(WH, "kpi_summaries")
+    if between is not None:
+        out_dir = os.path.join(out_dir, f"{args.start or 'debut'}_{args.end or 'fin'}")
+    os.makedirs(out_dir, exist_ok=True)
+    orders_by_country.to_csv(os.path.join(out_dir, "orders_by_country.csv"), index=False)
+    orders_by_employee.to_csv(os.path.join(out_dir, "orders_by_employee.csv"), index=False)
+    orders_by_month.to_csv(os.path.join(out_dir, "orders_by_month.csv"), index=False)
+
+    # Revenue by product category (order lines, when the order details are loaded)
+    try:
+        lines = read_table("fact_order_lines", WH, columns=["product_key", "quantity", "revenue"], between=between)
+    except FileNotFoundError:
+        lines = pd.DataFrame()
+    if not lines.empty:
+        dim_p = read_table("dim_products", WH, columns=["product_key", "category"])
+        lines_p = lines.merge(dim_p, on="product_key", how="left")
+        revenue_by_category = lines_p.groupby("category", observed=True).agg(quantity=("quantity", "sum"), revenue=("revenue", "sum")).reset_index()
+        print("\n===== Chiffre d'affaires =====")
+        print(f"Chiffre d'affaires total : {lines['revenue'].sum():.2f}")
+        print(revenue_by_category.sort_values("revenue", ascending=False).to_string(index=False))
+        revenue_by_category.to_csv(os.path.join(out_dir, "revenue_by_category.csv"), index=False)
+
+    print(f"\n✅ KPI summary files saved to {out_dir}")
+    run.finish()
+
+
+if __name__ == "__main__":
+    main()
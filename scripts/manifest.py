@@ -0,0 +1,131 @@
+"""
+manifest.py
+Empreintes des sources (data/raw/_manifest.json) pour ne relancer une étape
+que si ses entrées ont changé.
+
+Pour un fichier, l'empreinte est (taille, mtime) ; si elles diffèrent, le
+SHA-256 du contenu est recalculé et comparé, de sorte qu'un fichier simplement
+« touché » ne déclenche pas de reconstruction. Pour une table SQL Server,
+l'empreinte est (COUNT_BIG, CHECKSUM_AGG(BINARY_CHECKSUM(*))).
+
+Ce module n'importe pas pandas : une relance dont toutes les étapes sont à jour
+reste quasi instantanée.
+"""
+import hashlib
+import json
+import os
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+MANIFEST_PATH = os.path.join(BASE, "data", "raw", "_manifest.json")
+
+
+def _key(path):
+    """Chemin relatif à la racine du projet (manifeste portable)."""
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(BASE)).replace(os.sep, "/")
+
+
+def sha256(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, previous=None):
+    """
+    Empreinte {size, mtime_ns, sha256} d'un fichier. Si taille et mtime sont
+    identiques à `previous`, le hash précédent est réutilisé sans relire le fichier.
+    """
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if previous and previous.get("size") == fp["size"] and previous.get("mtime_ns") == fp["mtime_ns"]:
+        fp["sha256"] = previous.get("sha256")
+    else:
+        fp["sha256"] = sha256(path)
+    return fp
+
+
+def table_checksum(conn, table):
+    """Empreinte d'une table SQL Server ; à défaut (ex. SQLite), seulement le nombre de lignes."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(*)) FROM [{table}]")
+        count, checksum = cursor.fetchone()
+    except Exception:
+        cursor.execute(f"SELECT COUNT(*) FROM [{table}]")
+        count, checksum = cursor.fetchone()[0], None
+    finally:
+        cursor.close()
+    return {"rows": int(count), "checksum": checksum}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".part", path)
+
+
+def fingerprint_inputs(paths, previous=None):
+    """{chemin relatif: empreinte} ; un fichier absent a l'empreinte None."""
+    previous = previous or {}
+    fps = {}
+    for path in paths:
+        key = _key(path)
+        fps[key] = file_fingerprint(path, previous.get(key)) if os.path.exists(path) else None
+    return fps
+
+
+def _same(current, recorded):
+    if current.keys() != recorded.keys():
+        return False
+    for key, fp in current.items():
+        old = recorded[key]
+        if fp is None or old is None:
+            if fp is not old:
+                return False
+        elif isinstance(fp, dict) and "sha256" in fp:
+            if fp["sha256"] != old.get("sha256"):
+                return False
+        elif fp != old:
+            return False
+    return True
+
+
+def is_fresh(stage, inputs, outputs=(), manifest=None, extra=None):
+    """
+    True si l'étape `stage` a déjà tourné avec exactement ces entrées
+    (fichiers `inputs` + valeurs `extra`, ex. checksum SQL) et que toutes
+    ses sorties existent encore.
+    """
+    manifest = load_manifest() if manifest is None else manifest
+    entry = manifest.get(stage)
+    if not entry or not all(os.path.exists(p) for p in outputs):
+        return False
+    current = fingerprint_inputs(inputs, entry.get("inputs"))
+    return _same(current, entry.get("inputs", {})) and (extra or {}) == entry.get("extra", {})
+
+
+def record(stage, inputs, outputs=(), manifest=None, extra=None, save=True):
+    """Enregistre les empreintes des entrées de `stage` après une exécution réussie."""
+    manifest = load_manifest() if manifest is None else manifest
+    previous = (manifest.get(stage) or {}).get("inputs")
+    manifest[stage] = {
+        "inputs": fingerprint_inputs(inputs, previous),
+        "outputs": [_key(p) for p in outputs],
+        "extra": extra or {},
+    }
+    if save:
+        save_manifest(manifest)
+    return manifest
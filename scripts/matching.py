@@ -0,0 +1,227 @@
+"""
+matching.py
+Rapprochement approximatif des libellés normalisés (sociétés, employés) entre
+deux sources, quand l'égalité stricte de company_norm / emp_norm échoue
+(« alfreds futterkiste » / « alfred futterkiste »).
+
+- Blocage : un libellé n'est comparé qu'aux libellés partageant une clé de
+  bloc (préfixe de 4 lettres ou code phonétique d'un de ses mots). Les blocs
+  trop gros (mots très fréquents comme « company ») sont ignorés ; on évite
+  ainsi le produit cartésien O(n·m).
+- Score : cosinus des trigrammes de caractères pondérés par IDF, calculé par
+  lots de paires avec des jointures pandas (pas de boucle Python par paire).
+  Les trigrammes communs à beaucoup de libellés pèsent peu : « company a » et
+  « company b » restent distincts.
+- Modèle IDF ajusté une fois (toutes les cibles et tous les libellés à
+  rapprocher) puis persisté : le score d'une paire ne dépend pas des autres
+  libellés évalués avec elle, et les scores d'une relance sont comparables à
+  ceux des précédentes.
+- Table de correspondances persistée (data/warehouse/matches/) : seuls les
+  libellés nouveaux, ou les nouvelles cibles, sont évalués aux relances.
+"""
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import constants
+import storage
+
+# Score minimal (cosinus) pour considérer deux libellés comme la même entité
+DEFAULT_THRESHOLD = constants.DEFAULT_MATCH_THRESHOLD
+
+# Un bloc contenant plus de libellés que cela (d'un côté) est ignoré
+MAX_BLOCK_SIZE = 100
+
+# Paires scorées à la fois
+BATCH_PAIRS = 200_000
+
+PREFIX = 4
+
+# df : nombre de libellés du corpus d'ajustement contenant chaque trigramme
+IdfModel = namedtuple("IdfModel", ["df", "documents"])
+
+_SOUNDEX = str.maketrans("bfpvcgjkqsxzdtlmnr", "111122222222334556")
+
+
+@lru_cache(maxsize=1 << 16)
+def soundex(token):
+    """Code phonétique Soundex d'un mot ASCII en minuscules ("" si pas de lettre)."""
+    letters = [c for c in token if c.isalpha()]
+    if not letters:
+        return ""
+    codes = "".join(letters).translate(_SOUNDEX)
+    out = letters[0]
+    last = codes[0]
+    for c in codes[1:]:
+        if c.isdigit() and c != last:
+            out += c
+        if c not in "hw":
+            last = c
+    return (out + "000")[:4]
+
+
+def block_keys(names):
+    """(id, clé de bloc) : préfixe et code phonétique de chaque mot de chaque libellé."""
+    tokens = pd.Series(names, dtype=object).str.split().explode().dropna()
+    tokens = tokens[tokens.str.len() >= 2]
+    uniques = pd.Series(tokens.unique(), dtype=object)
+    phonetic = dict(zip(uniques, "s:" + uniques.map(soundex)))
+    keys = pd.concat([
+        "p:" + tokens.str[:PREFIX],
+        tokens.map(phonetic),
+    ])
+    keys = keys[keys.str.len() > 2]
+    return pd.DataFrame({"id": keys.index.to_numpy(), "key": keys.to_numpy()}).drop_duplicates()
+
+
+def candidate_pairs(left, right, max_block_size=MAX_BLOCK_SIZE):
+    """Paires (left_id, right_id) partageant au moins une clé de bloc raisonnable."""
+    lk = block_keys(left)
+    rk = block_keys(right)
+    sizes_l = lk["key"].value_counts()
+    sizes_r = rk["key"].value_counts()
+    keep = sizes_l.index[sizes_l <= max_block_size].intersection(sizes_r.index[sizes_r <= max_block_size])
+    pairs = lk[lk["key"].isin(keep)].merge(rk[rk["key"].isin(keep)], on="key", suffixes=("_l", "_r"))
+    return pairs[["id_l", "id_r"]].drop_duplicates().rename(columns={"id_l": "left", "id_r": "right"})
+
+
+def trigrams(names):
+    """(id, gram) : trigrammes distincts de chaque libellé."""
+    padded = " " + pd.Series(list(names), dtype=object) + " "
+    grams = padded.map(lambda s: [s[i:i + 3] for i in range(len(s) - 2)]).explode().dropna()
+    return pd.DataFrame({"id": grams.index.to_numpy(), "gram": grams.to_numpy()}).drop_duplicates()
+
+
+def fit_idf(names):
+    """Modèle IDF du corpus `names` (libellés distincts)."""
+    names = pd.unique(pd.Series(list(names), dtype=object))
+    return IdfModel(trigrams(names)["gram"].value_counts(), len(names))
+
+
+def trigram_weights(names, model):
+    """(id, gram, poids IDF²) et norme de chaque libellé ; un trigramme absent du modèle a le poids maximal."""
+    grams = trigrams(names)
+    df = grams["gram"].map(model.df).fillna(0).to_numpy()
+    grams["w2"] = (np.log((1 + model.documents) / (1 + df)) + 1) ** 2
+    norms = np.sqrt(grams.groupby("id")["w2"].sum())
+    return grams, norms
+
+
+def score_pairs(pairs, left, right, model=None, batch_pairs=BATCH_PAIRS):
+    """
+    Score cosinus de chaque paire (left_id, right_id), par lots vectorisés.
+    Sans `model`, l'IDF est ajusté sur `left` + `right`.
+    """
+    if model is None:
+        model = fit_idf(list(left) + list(right))
+    lg, left_norms = trigram_weights(left, model)
+    rg, right_norms = trigram_weights(right, model)
+    lg = lg.rename(columns={"id": "left"})
+    rg = rg.rename(columns={"id": "right"})[["right", "gram"]]
+
+    scores = []
+    for start in range(0, len(pairs), batch_pairs):
+        batch = pairs.iloc[start:start + batch_pairs]
+        shared = batch.merge(lg, on="left").merge(rg, on=["right", "gram"])
+        dot = shared.groupby(["left", "right"], as_index=False)["w2"].sum()
+        dot["score"] = dot["w2"] / (left_norms.reindex(dot["left"]).to_numpy()
+                                    * right_norms.reindex(dot["right"]).to_numpy())
+        scores.append(dot[["left", "right", "score"]])
+    if not scores:
+        return pd.DataFrame({"left": pd.Series(dtype="int64"), "right": pd.Series(dtype="int64"),
+                             "score": pd.Series(dtype="float64")})
+    return pd.concat(scores, ignore_index=True)
+
+
+def best_matches(left, right, model=None, max_block_size=MAX_BLOCK_SIZE):
+    """
+    Meilleure cible de chaque libellé de `left` parmi `right` : DataFrame alias,
+    canonical, score (IDF de `model`, sinon ajusté sur `left` + `right`).
+    """
+    left = list(left)
+    right = list(right)
+    pairs = candidate_pairs(left, right, max_block_size)
+    scores = score_pairs(pairs, left, right, model)
+    best = scores.sort_values(["left", "score"], ascending=[True, False]).drop_duplicates("left")
+    out = pd.DataFrame({"alias": pd.Series(left, dtype=object), "canonical": "", "score": 0.0})
+    out.loc[best["left"].to_numpy(), "canonical"] = np.asarray(right, dtype=object)[best["right"].to_numpy()]
+    out.loc[best["left"].to_numpy(), "score"] = best["score"].to_numpy()
+    return out
+
+
+# -------------------------
+# Table de correspondances persistée
+# -------------------------
+def load_matches(name, folder):
+    """
+    (correspondances alias -> canonical, cibles déjà évaluées, modèle IDF ou
+    None) ; vides au premier passage.
+    """
+    try:
+        matches = storage.read_table(name, folder)
+        targets = set(storage.read_table(name + "_targets", folder)["canonical"].astype(str))
+    except FileNotFoundError:
+        matches = pd.DataFrame({"alias": pd.Series(dtype=object), "canonical": pd.Series(dtype=object),
+                                "score": pd.Series(dtype="float64")})
+        targets = set()
+    matches[["alias", "canonical"]] = matches[["alias", "canonical"]].fillna("").astype(str)
+    try:
+        idf = storage.read_table(name + "_idf", folder)
+        model = IdfModel(pd.Series(idf["df"].to_numpy(), index=idf["gram"].astype(str).to_numpy()),
+                         int(idf["documents"].iloc[0])) if len(idf) else None
+    except FileNotFoundError:
+        model = None
+    return matches, targets, model
+
+
+def save_matches(name, folder, matches, targets, model, fmt=storage.DEFAULT_FORMAT):
+    storage.write_table(matches, name, folder, fmt)
+    storage.write_table(pd.DataFrame({"canonical": sorted(targets)}), name + "_targets", folder, fmt)
+    storage.write_table(pd.DataFrame({"gram": model.df.index.astype(str), "df": model.df.to_numpy(),
+                                      "documents": model.documents}), name + "_idf", folder, fmt)
+
+
+def update_matches(left, right, matches, targets, model=None, max_block_size=MAX_BLOCK_SIZE):
+    """
+    Met à jour la table `matches` pour les libellés `left` face aux cibles `right` :
+    - libellé jamais vu, ou dont la cible a disparu : comparé à toutes les cibles ;
+    - libellé connu : comparé seulement aux nouvelles cibles, le meilleur score l'emporte.
+    Tous les scores utilisent le même `model` ; sans modèle (premier passage),
+    il est ajusté sur `right` + `left` et toutes les correspondances sont
+    recalculées.
+    Retourne (matches, targets, model) pour les seuls libellés / cibles présents.
+    """
+    left = pd.unique(pd.Series(list(left), dtype=object))
+    right = pd.unique(pd.Series(list(right), dtype=object))
+    right_set = set(right)
+    if model is None:
+        model = fit_idf(list(right) + list(left))
+        matches = matches.iloc[:0]
+    known = matches[matches["alias"].isin(left) & (matches["canonical"].isin(right_set) | (matches["canonical"] == ""))]
+    new_targets = [r for r in right if r not in targets]
+    seen = set(known["alias"])
+    fresh = [a for a in left if a not in seen]
+
+    parts = [known]
+    if fresh and len(right):
+        parts.append(best_matches(fresh, right, model, max_block_size))
+    if len(known) and new_targets:
+        parts.append(best_matches(known["alias"], new_targets, model, max_block_size))
+    parts = [p for p in parts if len(p)]
+    matches = pd.concat(parts, ignore_index=True) if parts else known
+    matches = (matches.sort_values(["alias", "score"], ascending=[True, False])
+               .drop_duplicates("alias").reset_index(drop=True))
+    return matches, right_set, model
+
+
+def aliases(matches, threshold=DEFAULT_THRESHOLD):
+    """{alias: canonical} des correspondances au-dessus du seuil."""
+    ok = matches[(matches["score"] >= threshold) & (matches["canonical"] != "")]
+    return dict(zip(ok["alias"], ok["canonical"]))
+
+
+def match_folder(warehouse=storage.WAREHOUSE):
+    return os.path.join(warehouse, "matches")
@@ -0,0 +1,296 @@
+"""
+metrics.py
+Instrumentation commune des scripts : durée de chaque étape, lignes en entrée
+et en sortie, mémoire et indicateurs libres (taux de résolution des clés, ...).
+Chaque exécution écrit un fichier JSON dans data/metrics/
+(<script>-<date>-<heure>-<pid>.json).
+
+Mémoire d'une étape : le pic du processus à la fin de l'étape
+(process_peak_rss_mb) et de combien l'étape l'a relevé (peak_rss_growth_mb,
+0 si elle est restée sous un pic antérieur). Des étapes lancées en parallèle
+se partagent ce relèvement.
+
+    run = metrics.start("transform_excel")
+    with metrics.stage("customers", rows_in=len(df)) as st:
+        ...
+        st.rows_out = len(norm)
+    metrics.record("key_match_rates", {...})
+    run.finish()
+
+Les étapes du DAG de pipeline.py sont instrumentées automatiquement.
+Sans exécution démarrée, metrics.stage() ne fait rien.
+
+Variables d'environnement :
+- BI_METRICS=0          : pas de fichier JSON (les mesures restent disponibles) ;
+- BI_METRICS_DIR=...    : dossier des fichiers (défaut : data/metrics) ;
+- BI_PROFILE=cprofile   : profil cProfile (.prof, lisible avec pstats / snakeviz) ;
+- BI_PROFILE=sample     : profileur par échantillonnage de tous les threads
+                          (piles repliées .folded, pour flamegraph) ;
+- BI_PROFILE_INTERVAL=5 : période d'échantillonnage en millisecondes.
+Sans BI_PROFILE, le coût se limite à deux appels d'horloge par étape.
+"""
+import itertools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows : pas de pic de mémoire
+    resource = None
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+METRICS_FOLDER = os.path.join(BASE, "data", "metrics")
+
+PROFILERS = ("cprofile", "sample")
+DEFAULT_INTERVAL_MS = 5
+
+_current = None
+# several runs of one process in the same second get distinct files
+_sequence = itertools.count()
+
+
+def peak_rss_mb():
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo), ou None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss: kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def rows_of(value):
+    """Nombre de lignes d'un DataFrame (ou somme sur un tuple), sinon None."""
+    if isinstance(value, tuple):
+        counts = [rows_of(v) for v in value]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    shape = getattr(value, "shape", None)
+    return int(shape[0]) if shape else None
+
+
+class StageMetrics:
+    """Mesures d'une étape ; `rows_out` (et `rows_in`) peuvent être renseignés dans le bloc."""
+
+    __slots__ = ("name", "rows_in", "rows_out", "seconds", "process_peak_rss_mb", "peak_rss_growth_mb", "thread")
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.process_peak_rss_mb = None
+        self.peak_rss_growth_mb = None
+        self.thread = threading.current_thread().name
+
+    def as_dict(self):
+        out = {k: getattr(self, k) for k in self.__slots__}
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        out["rows_per_s"] = round(rows / self.seconds, 1) if rows and self.seconds else None
+        return out
+
+
+class _NullStage:
+    """Étape hors exécution : les affectations sont acceptées et ignorées."""
+
+    def __setattr__(self, name, value):
+        pass
+
+
+class Run:
+    """Une exécution de script : étapes, indicateurs et profil éventuel."""
+
+    def __init__(self, name, folder=None, profile=None):
+        self.name = name
+        self.folder = folder or os.environ.get("BI_METRICS_DIR") or METRICS_FOLDER
+        self.write = os.environ.get("BI_METRICS", "1") != "0"
+        self.profile = profile if profile is not None else os.environ.get("BI_PROFILE", "").lower()
+        if self.profile and self.profile not in PROFILERS:
+            raise ValueError(f"BI_PROFILE inconnu : {self.profile!r} (attendu : {', '.join(PROFILERS)})")
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = []
+        self.values = {}
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._profiler = None
+        self._sampler = None
+        if self.profile == "cprofile":
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.profile == "sample":
+            interval = float(os.environ.get("BI_PROFILE_INTERVAL", DEFAULT_INTERVAL_MS)) / 1000
+            self._sampler = _Sampler(interval)
+            self._sampler.start()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        st = StageMetrics(name, rows_in)
+        # before Python 3.12, cProfile only sees the thread it was enabled in:
+        # worker threads get their own (3.12+ profiles every thread at once)
+        profiler = None
+        if (self._profiler is not None and sys.version_info < (3, 12)
+                and threading.current_thread() is not threading.main_thread()):
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+        peak_before = peak_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st.seconds = round(time.perf_counter() - start, 4)
+            st.process_peak_rss_mb = peak_rss_mb()
+            if peak_before is not None:
+                st.peak_rss_growth_mb = round(st.process_peak_rss_mb - peak_before, 1)
+            if profiler is not None:
+                profiler.disable()
+            with self._lock:
+                self.stages.append(st)
+                if profiler is not None:
+                    self._profiles.append(profiler)
+
+    def add_stage(self, name, seconds, rows_in=None, rows_out=None):
+        """Étape mesurée ailleurs (processus enfant, thread d'extraction, ...)."""
+        st = StageMetrics(name, rows_in)
+        st.rows_out = rows_out
+        st.seconds = round(seconds, 4)
+        with self._lock:
+            self.stages.append(st)
+
+    def record(self, key, value):
+        """Indicateur libre (nombre, texte, dict, liste ; un DataFrame est converti)."""
+        if hasattr(value, "to_dict"):
+            value = value.to_dict()
+        with self._lock:
+            self.values[key] = value
+
+    def summary(self, status="ok"):
+        return {
+            "run": self.name,
+            "status": status,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "seconds": round(time.perf_counter() - self._start, 4),
+            "peak_rss_mb": peak_rss_mb(),
+            "python": platform.python_version(),
+            "argv": sys.argv[1:],
+            "stages": [st.as_dict() for st in self.stages],
+            "metrics": self.values,
+        }
+
+    def finish(self, status="ok"):
+        """Arrête le profileur, écrit le JSON (sauf BI_METRICS=0) ; retourne son chemin ou None."""
+        global _current
+        if _current is self:
+            _current = None
+        doc = self.summary(status)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        sequence = next(_sequence)
+        suffix = f"-{os.getpid()}" + (f"-{sequence}" if sequence else "")
+        base = os.path.join(self.folder, f"{self.name}-{stamp}{suffix}")
+        profile_path = self._stop_profile(base)
+        if profile_path:
+            doc["profile"] = profile_path
+        if not self.write:
+            return None
+        os.makedirs(self.folder, exist_ok=True)
+        path = base + ".json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2, ensure_ascii=False, default=str)
+        return path
+
+    def _stop_profile(self, base):
+        if self._profiler is not None:
+            import pstats
+
+            self._profiler.disable()
+            stats = pstats.Stats(self._profiler)
+            for profile in self._profiles:
+                stats.add(profile)
+            os.makedirs(self.folder, exist_ok=True)
+            stats.dump_stats(base + ".prof")
+            return base + ".prof"
+        if self._sampler is not None:
+            self._sampler.stop()
+            os.makedirs(self.folder, exist_ok=True)
+            self._sampler.write(base + ".folded")
+            return base + ".folded"
+        return None
+
+
+class _Sampler(threading.Thread):
+    """Relève la pile de chaque thread toutes les `interval` secondes (piles repliées)."""
+
+    def __init__(self, interval):
+        super().__init__(name="metrics-sampler", daemon=True)
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# -------------------------
+# Exécution courante (une par processus)
+# -------------------------
+def start(name, folder=None, profile=None):
+    """Démarre l'exécution `name` ; les appels stage() / record() s'y rattachent."""
+    global _current
+    _current = Run(name, folder, profile)
+    return _current
+
+
+def current():
+    return _current
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Mesure le bloc comme étape de l'exécution courante (sans effet s'il n'y en a pas)."""
+    if _current is None:
+        yield _NullStage()
+        return
+    with _current.stage(name, rows_in) as st:
+        yield st
+
+
+def add_stage(name, seconds, rows_in=None, rows_out=None):
+    if _current is not None:
+        _current.add_stage(name, seconds, rows_in, rows_out)
+
+
+def record(key, value):
+    if _current is not None:
+        _current.record(key, value)
+
+
+def finish(status="ok"):
+    return _current.finish(status) if _current is not None else None
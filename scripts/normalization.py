@@ -0,0 +1,76 @@
+"""
+normalization.py
+Normalisation des libellés (sociétés, employés) partagée par toutes les étapes :
+translittération (unidecode), minuscules, séparateurs optionnels remplacés par
+des espaces, espaces multiples réduits.
+
+Deux chemins vectorisés :
+- normalize_series : chaque valeur distincte n'est normalisée qu'une fois
+  (pd.factorize) puis le résultat est rediffusé sur toutes les lignes ;
+- normalize_bulk : opérations .str vectorisées sur toute la colonne, unidecode
+  n'étant appelé (via un cache borné) que sur les valeurs non ASCII.
+normalize_text reste disponible pour une valeur isolée.
+"""
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import unidecode
+
+# Nombre maximal de libellés gardés en cache
+CACHE_SIZE = 1 << 16
+
+_NON_ASCII = r"[^\x00-\x7f]"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _transliterate(s):
+    return unidecode.unidecode(s)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _normalize_one(s, separators):
+    if not s.isascii():
+        s = _transliterate(s)
+    s = s.lower()
+    for sep in separators:
+        s = s.replace(sep, " ")
+    return " ".join(s.split())
+
+
+def normalize_text(s, separators=""):
+    """Normalise une valeur isolée ("" pour NaN / None)."""
+    if pd.isna(s):
+        return ""
+    return _normalize_one(str(s), separators)
+
+
+def _blank_pattern(separators):
+    if not separators:
+        return r"\s+"
+    return r"[\s" + "".join(re.escape(c) for c in separators) + r"]+"
+
+
+def normalize_bulk(values, separators=""):
+    """Normalise une colonne entière avec les opérations .str de pandas."""
+    s = pd.Series(values, copy=False)
+    s = s.astype(object).where(s.notna(), "").astype(str)
+    non_ascii = s.str.contains(_NON_ASCII, regex=True)
+    if non_ascii.any():
+        s = s.copy()
+        s[non_ascii] = s[non_ascii].map(_transliterate)
+    return s.str.lower().str.replace(_blank_pattern(separators), " ", regex=True).str.strip()
+
+
+def normalize_series(values, separators=""):
+    """
+    Normalise une colonne en ne traitant que ses valeurs distinctes.
+    Adapté aux colonnes très répétitives (client / employé d'une commande).
+    """
+    s = pd.Series(values, copy=False)
+    codes, uniques = pd.factorize(s)
+    normalized = normalize_bulk(pd.Series(uniques, dtype=object), separators).to_numpy(dtype=object)
+    # code -1 (valeur manquante) -> dernière case : ""
+    normalized = np.append(normalized, "")
+    return pd.Series(normalized[codes], index=s.index, dtype=object)
@@ -0,0 +1,96 @@
+"""
+pipeline.py
+Mini-exécuteur de DAG : chaque étape déclare les artefacts qu'elle lit (inputs)
+et ceux qu'elle produit (outputs). Une étape est lancée dès que tous ses
+inputs sont disponibles, les étapes indépendantes s'exécutant en parallèle
+sur un pool de threads. La durée de chaque étape est mesurée (et, si une
+exécution metrics.py est démarrée, ses lignes en entrée / sortie et le pic
+de mémoire).
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+
+
+class Stage:
+    """Étape du pipeline : `func(*inputs)` (dans l'ordre déclaré) retourne ses outputs (une valeur ou un tuple)."""
+
+    def __init__(self, name, func, inputs=(), outputs=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+    def run(self, context):
+        result = self.func(*[context[name] for name in self.inputs])
+        if len(self.outputs) == 0:
+            return {}
+        if len(self.outputs) == 1:
+            return {self.outputs[0]: result}
+        if not isinstance(result, tuple) or len(result) != len(self.outputs):
+            raise ValueError(f"L'étape {self.name} doit retourner {len(self.outputs)} valeurs")
+        return dict(zip(self.outputs, result))
+
+
+def check_stages(stages, available=()):
+    """Vérifie que chaque input est produit une seule fois et qu'il n'y a pas de cycle."""
+    producers = {}
+    for stage in stages:
+        for out in stage.outputs:
+            if out in producers or out in available:
+                raise ValueError(f"Artefact {out!r} produit plusieurs fois")
+            producers[out] = stage.name
+    known = set(available) | set(producers)
+    for stage in stages:
+        missing = [i for i in stage.inputs if i not in known]
+        if missing:
+            raise ValueError(f"Étape {stage.name} : inputs sans producteur {missing}")
+
+    done = set(available)
+    pending = list(stages)
+    while pending:
+        ready = [s for s in pending if all(i in done for i in s.inputs)]
+        if not ready:
+            raise ValueError(f"Cycle entre les étapes {[s.name for s in pending]}")
+        for s in ready:
+            done.update(s.outputs)
+            pending.remove(s)
+
+
+def run_stages(stages, context=None, max_workers=None):
+    """
+    Exécute `stages` dans l'ordre du DAG. `context` contient les artefacts
+    initiaux ; il est complété avec les outputs de chaque étape.
+    Retourne (context, {nom d'étape: secondes}).
+    """
+    context = dict(context or {})
+    check_stages(stages, context)
+    timings = {}
+    pending = list(stages)
+    running = {}
+
+    def timed(stage):
+        rows_in = metrics.rows_of(tuple(context[name] for name in stage.inputs))
+        with metrics.stage(stage.name, rows_in) as st:
+            start = time.perf_counter()
+            outputs = stage.run(context)
+            elapsed = time.perf_counter() - start
+            st.rows_out = metrics.rows_of(tuple(outputs.values()))
+        return outputs, elapsed
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for stage in [s for s in pending if all(i in context for i in s.inputs)]:
+                pending.remove(stage)
+                running[executor.submit(timed, stage)] = stage
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                outputs, elapsed = future.result()
+                context.update(outputs)
+                timings[stage.name] = elapsed
+    return context, timings
@@ -0,0 +1,203 @@
+"""
+quality.py
+Contrôle qualité du Data Warehouse avant écriture : un jeu de règles déclaré
+(RULES), évalué sur fact_orders et les dimensions ; chaque règle est une
+opération vectorisée sur ses colonnes (pas de boucle Python par ligne).
+
+Règles :
+- "not_null"    : valeur absente (clé non résolue, date absente ou illisible) ;
+- "foreign_key" : clé absente de la dimension (clé orpheline, date hors calendrier) ;
+- "range"       : valeur hors [min, max] ("today" = date du jour) ;
+- "before"      : colonne antérieure à une autre (expédiée avant d'être commandée) ;
+- "unique"      : doublon sur un groupe de colonnes (orderid par source).
+
+Chaque règle est une « error » ou un « warning ». Pour chaque table, les
+règles donnent une matrice booléenne lignes × règles : un comptage par
+colonne, et les lignes à écarter sont celles qui violent au moins une erreur.
+
+Modes (datawarehouse.py --quality) :
+- "warn"       : rapport seulement (défaut) ;
+- "fail"       : la construction échoue s'il y a au moins une erreur ;
+- "quarantine" : les commandes en erreur sont retirées de fact_orders et
+                 écrites dans quality/fact_orders_quarantine (avec la liste
+                 des règles violées), leurs lignes de commande sont retirées
+                 de fact_order_lines ; le reste est chargé.
+
+Le rapport <warehouse>/quality/report.json donne, pour chaque règle violée, le
+nombre et le taux de lignes en défaut et quelques lignes d'exemple ; les
+règles respectées sont seulement nommées.
+"""
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import constants
+
+MODES = constants.QUALITY_MODES
+DEFAULT_MODE = constants.DEFAULT_QUALITY_MODE
+
+FOLDER = "quality"
+REPORT = "report.json"
+QUARANTINE = "fact_orders_quarantine"
+
+# Lignes d'exemple par règle dans le rapport
+SAMPLE_ROWS = 5
+
+# Frais de port au-delà desquels une commande est suspecte
+FREIGHT_MAX = 10_000
+
+Rule = namedtuple("Rule", ["name", "table", "check", "columns", "params", "severity"])
+
+RULES = [
+    # fact_orders
+    Rule("customer_key_null", "fact_orders", "not_null", ["customer_key"], {}, "error"),
+    Rule("customer_key_orphan", "fact_orders", "foreign_key", ["customer_key"],
+         {"ref": ("dim_customers", "customer_key")}, "error"),
+    Rule("employee_key_null", "fact_orders", "not_null", ["employee_key"], {}, "error"),
+    Rule("employee_key_orphan", "fact_orders", "foreign_key", ["employee_key"],
+         {"ref": ("dim_employees", "employee_key")}, "error"),
+    Rule("orderdate_null", "fact_orders", "not_null", ["orderdate"], {}, "error"),
+    Rule("orderdate_key_calendar", "fact_orders", "foreign_key", ["orderdate_key"],
+         {"ref": ("dim_temps", "date_key")}, "error"),
+    Rule("orderdate_range", "fact_orders", "range", ["orderdate"], {"min": "1990-01-01", "max": "today"}, "error"),
+    Rule("shippeddate_key_calendar", "fact_orders", "foreign_key", ["shippeddate_key"],
+         {"ref": ("dim_temps", "date_key")}, "warning"),
+    Rule("shipped_before_ordered", "fact_orders", "before", ["shippeddate"], {"other": "orderdate"}, "warning"),
+    Rule("orderid_duplicate", "fact_orders", "unique", ["source", "orderid"], {}, "error"),
+    Rule("freight_negative", "fact_orders", "range", ["freight"], {"min": 0}, "error"),
+    Rule("freight_excessive", "fact_orders", "range", ["freight"], {"max": FREIGHT_MAX}, "warning"),
+    # dimensions
+    Rule("customer_key_duplicate", "dim_customers", "unique", ["customer_key"], {}, "error"),
+    Rule("employee_key_duplicate", "dim_employees", "unique", ["employee_key"], {}, "error"),
+    Rule("date_key_duplicate", "dim_temps", "unique", ["date_key"], {}, "error"),
+]
+
+# Colonnes qui identifient une ligne dans les exemples
+IDENTITY = {
+    "fact_orders": ["fact_key", "source", "orderid"],
+    "dim_customers": ["customer_key", "customerid", "companyname"],
+    "dim_employees": ["employee_key", "firstname", "lastname"],
+    "dim_temps": ["date_key", "date"],
+}
+
+
+class QualityError(Exception):
+    """Au moins une règle « error » violée en mode fail ; `report` est le rapport complet."""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def _bound(value):
+    if isinstance(value, str):
+        value = pd.Timestamp.today().normalize() if value == "today" else pd.Timestamp(value)
+    return value
+
+
+def violations(rule, df, tables):
+    """Masque booléen (numpy) des lignes de `df` qui violent `rule`."""
+    column = df[rule.columns[0]]
+    if rule.check == "not_null":
+        mask = column.isna()
+    elif rule.check == "foreign_key":
+        ref_table, ref_column = rule.params["ref"]
+        mask = column.notna() & ~column.isin(tables[ref_table][ref_column])
+    elif rule.check == "range":
+        mask = pd.Series(False, index=df.index)
+        if "min" in rule.params:
+            mask |= (column < _bound(rule.params["min"])).fillna(False)
+        if "max" in rule.params:
+            mask |= (column > _bound(rule.params["max"])).fillna(False)
+    elif rule.check == "before":
+        mask = (column < df[rule.params["other"]]).fillna(False)
+    elif rule.check == "unique":
+        mask = df.duplicated(rule.columns, keep=False)
+    else:
+        raise ValueError(f"Contrôle inconnu : {rule.check}")
+    return mask.to_numpy(dtype=bool)
+
+
+def evaluate(tables, rules=RULES, sample_rows=SAMPLE_ROWS):
+    """
+    Évalue `rules` sur `tables` ({nom: DataFrame} ; une table absente est
+    ignorée). Retourne (rapport, {table: (matrice lignes × règles, règles,
+    masque des lignes en erreur)}).
+    """
+    report = {"rows": {}, "rejected_rows": {}, "rules": [], "passed": []}
+    results = {}
+    by_table = {}
+    for rule in rules:
+        if rule.table in tables:
+            by_table.setdefault(rule.table, []).append(rule)
+    for name, table_rules in by_table.items():
+        df = tables[name]
+        report["rows"][name] = len(df)
+        # rows x rules
+        matrix = np.column_stack([violations(rule, df, tables) for rule in table_rules]) \
+            if len(df) else np.zeros((0, len(table_rules)), dtype=bool)
+        counts = matrix.sum(axis=0)
+        errors = [i for i, rule in enumerate(table_rules) if rule.severity == "error"]
+        rejected = matrix[:, errors].any(axis=1) if errors else np.zeros(len(df), dtype=bool)
+        results[name] = (matrix, table_rules, rejected)
+        report["rejected_rows"][name] = int(rejected.sum())
+        for i, rule in enumerate(table_rules):
+            if not counts[i]:
+                report["passed"].append(rule.name)
+                continue
+            shown = [c for c in IDENTITY.get(name, []) + rule.columns + [rule.params.get("other")] if c in df.columns]
+            sample = df.iloc[np.flatnonzero(matrix[:, i])[:sample_rows]][list(dict.fromkeys(shown))]
+            report["rules"].append({
+                "rule": rule.name, "table": name, "columns": rule.columns, "severity": rule.severity,
+                "count": int(counts[i]), "rate": round(float(counts[i]) / len(df), 6),
+                "sample": json.loads(sample.to_json(orient="records", date_format="iso")),
+            })
+    report["errors"] = sum(r["count"] for r in report["rules"] if r["severity"] == "error")
+    report["warnings"] = sum(r["count"] for r in report["rules"] if r["severity"] == "warning")
+    return report, results
+
+
+def gate(tables, mode=DEFAULT_MODE, rules=RULES):
+    """
+    Contrôle `tables` selon `mode`. Retourne (fact_orders chargée, commandes
+    en quarantaine ou None, rapport) ; lève QualityError en mode fail.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Mode qualité inconnu : {mode}")
+    report, results = evaluate(tables, rules)
+    report["mode"] = mode
+    fact = tables["fact_orders"]
+    quarantined = None
+    if mode == "quarantine" and "fact_orders" in results and results["fact_orders"][2].any():
+        matrix, fact_rules, bad = results["fact_orders"]
+        # "rule_a;rule_b" for each rejected order
+        names = np.array([rule.name for rule in fact_rules], dtype=object)
+        labels = [";".join(names[row]) for row in matrix[bad]]
+        quarantined = fact[bad].assign(violations=labels).reset_index(drop=True)
+        fact = fact[~bad].reset_index(drop=True)
+    report["quarantined"] = len(quarantined) if quarantined is not None else 0
+    report["status"] = "errors" if report["errors"] else ("warnings" if report["warnings"] else "ok")
+    if mode == "fail" and report["errors"]:
+        failed = [f"{r['rule']} ({r['count']})" for r in report["rules"] if r["severity"] == "error" and r["count"]]
+        report["status"] = "failed"
+        raise QualityError("Contrôle qualité en échec : " + ", ".join(failed), report)
+    return fact, quarantined, report
+
+
+def write_report(report, folder):
+    """Écrit le rapport JSON (atomiquement) et retourne son chemin."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, REPORT)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1, ensure_ascii=False, default=str)
+    os.replace(path + ".part", path)
+    return path
+
+
+def summary(report):
+    """Lignes de texte : une par règle violée."""
+    return [f"{r['severity']:<8} {r['rule']:<26} {r['table']:<14} {r['count']:>9}  ({r['rate']:.2%})"
+            for r in report["rules"]]
@@ -0,0 +1,231 @@
+"""
+query.py
+Requêtes SQL ad hoc sur les tables du Data Warehouse, sans charger fact_orders
+en pandas.
+
+Deux moteurs embarqués :
+- DuckDB (si installé, pip install duckdb) : chaque table est une vue sur son
+  fichier Parquet / CSV (ou une table Arrow en memory-map). Seules les colonnes
+  et les groupes de lignes utiles à la requête sont lus (projection et filtres
+  poussés jusqu'au fichier). Une table partitionnée (fact_orders) est une vue
+  sur la liste de ses partitions.
+- SQLite (bibliothèque standard) : les tables sont copiées par lots dans
+  data/warehouse/warehouse.sqlite, avec un index sur chaque clé et chaque date ;
+  une table n'est recopiée que si son fichier a changé. Les filtres utilisent
+  les index et seules les colonnes demandées sont lues.
+
+Le résultat est toujours un DataFrame.
+
+    python scripts/query.py "SELECT country, COUNT(*) AS n FROM fact_orders f
+                             JOIN dim_customers c USING (customer_key) GROUP BY country"
+    python scripts/query.py --example orders_by_country [--engine sqlite]
+    python scripts/query.py --file requete.sql --output resultat.csv
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import pandas as pd
+
+import constants
+import storage
+
+try:
+    import duckdb
+except ImportError:  # duckdb absent : SQLite
+    duckdb = None
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+WAREHOUSE = os.path.join(BASE, "data", "warehouse")
+SQLITE_FILE = "warehouse.sqlite"
+
+ENGINES = ["duckdb", "sqlite"]
+DEFAULT_ENGINE = "duckdb" if duckdb is not None else "sqlite"
+
+# Tables exposées (celles qui existent dans le dossier du warehouse)
+TABLES = constants.TABLES
+
+# Lignes copiées à la fois dans SQLite
+BATCH_ROWS = 100_000
+
+# Requêtes en étoile prêtes à l'emploi (SQL commun à DuckDB et SQLite)
+EXAMPLES = {
+    "orders_by_country": """
+        SELECT c.country, COUNT(*) AS total_orders, CAST(SUM(f.delivered) AS BIGINT) AS delivered
+        FROM fact_orders f JOIN dim_customers c ON c.customer_key = f.customer_key
+        GROUP BY c.country ORDER BY total_orders DESC""",
+    "orders_by_employee": """
+        SELECT e.firstname || ' ' || e.lastname AS employee_name,
+               COUNT(*) AS total_orders, CAST(SUM(f.delivered) AS BIGINT) AS delivered
+        FROM fact_orders f JOIN dim_employees e ON e.employee_key = f.employee_key
+        GROUP BY employee_name ORDER BY total_orders DESC""",
+    "orders_by_month": """
+        SELECT t.year, t.month, COUNT(*) AS total_orders, CAST(SUM(f.delivered) AS BIGINT) AS delivered
+        FROM fact_orders f JOIN dim_temps t ON t.date_key = f.orderdate_key
+        GROUP BY t.year, t.month ORDER BY t.year, t.month""",
+    "delivery_rate_by_year": """
+        SELECT t.year, ROUND(100.0 * SUM(f.delivered) / COUNT(*), 2) AS delivery_rate
+        FROM fact_orders f JOIN dim_temps t ON t.date_key = f.orderdate_key
+        GROUP BY t.year ORDER BY t.year""",
+    "revenue_by_category": """
+        SELECT p.category, SUM(l.quantity) AS quantity, SUM(l.revenue) AS revenue
+        FROM fact_order_lines l JOIN dim_products p ON p.product_key = l.product_key
+        GROUP BY p.category ORDER BY revenue DESC""",
+}
+
+
+def available_tables(warehouse=WAREHOUSE):
+    """{table: (chemin, format)} pour les tables présentes dans `warehouse`."""
+    found = {}
+    for name in TABLES:
+        try:
+            found[name] = storage.find_table(name, warehouse)
+        except FileNotFoundError:
+            continue
+    return found
+
+
+class QueryEngine:
+    """Connexion SQL embarquée sur les tables du warehouse (`sql()` retourne un DataFrame)."""
+
+    def __init__(self, warehouse=WAREHOUSE, engine=DEFAULT_ENGINE):
+        if engine == "duckdb" and duckdb is None:
+            raise RuntimeError("Le moteur duckdb nécessite le paquet duckdb (pip install duckdb)")
+        if engine not in ENGINES:
+            raise ValueError(f"Moteur inconnu : {engine}")
+        self.warehouse = warehouse
+        self.engine = engine
+        self.tables = available_tables(warehouse)
+        if engine == "duckdb":
+            self.conn = duckdb.connect()
+            self._register_duckdb()
+        else:
+            self.conn = sqlite3.connect(os.path.join(warehouse, SQLITE_FILE), check_same_thread=False)
+            self._sync_sqlite()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    # ---- DuckDB : vues sur les fichiers ----
+    def _register_duckdb(self):
+        for name in self.tables:
+            paths, fmt = storage.table_files(name, self.warehouse)
+            paths_sql = ", ".join("'" + p.replace("'", "''") + "'" for p in paths)
+            if fmt == "parquet":
+                self.conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet([{paths_sql}])")
+            elif fmt == "csv":
+                self.conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_csv_auto([{paths_sql}])")
+            else:
+                tables = [storage.feather.read_table(p, memory_map=True) for p in paths]
+                self.conn.register(name, storage.pa.concat_tables(tables))
+
+    # ---- SQLite : copie par lots, rafraîchie quand le fichier change ----
+    def _sync_sqlite(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS _sources (name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)")
+        known = {row[0]: row[1:] for row in self.conn.execute("SELECT name, size, mtime_ns FROM _sources")}
+        for name, (path, fmt) in self.tables.items():
+            st = os.stat(path)
+            if known.get(name) == (st.st_size, st.st_mtime_ns):
+                continue
+            self._load_sqlite_table(name, *storage.table_files(name, self.warehouse))
+            self.conn.execute("INSERT OR REPLACE INTO _sources VALUES (?, ?, ?)", (name, st.st_size, st.st_mtime_ns))
+            self.conn.commit()
+
+    def _load_sqlite_table(self, name, paths, fmt):
+        self.conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+        columns = []
+        for batch in (b for path in paths for b in _batches(path, fmt)):
+            batch.to_sql(name, self.conn, if_exists="append", index=False)
+            columns = columns or list(batch.columns)
+        for column in columns:
+            if column.endswith("_key") or column in storage.DATE_COLUMNS:
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "ix_{name}_{column}" ON "{name}" ("{column}")')
+
+    def sql(self, query, params=None):
+        """Exécute `query` (paramètres positionnels `?`) et retourne un DataFrame."""
+        if self.engine == "duckdb":
+            return self.conn.execute(query, params or []).df()
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    def explain(self, query):
+        """Plan d'exécution de `query` (filtres / colonnes poussés jusqu'au stockage)."""
+        if self.engine == "duckdb":
+            return "\n".join(row[1] for row in self.conn.execute("EXPLAIN " + query).fetchall())
+        return "\n".join(str(row[-1]) for row in self.conn.execute("EXPLAIN QUERY PLAN " + query).fetchall())
+
+
+def _batches(path, fmt, batch_rows=BATCH_ROWS):
+    """Lit une table par lots de DataFrames (jamais en entier en mémoire)."""
+    if fmt == "parquet":
+        for batch in storage.pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_rows):
+            yield _sqlite_ready(batch.to_pandas())
+    elif fmt == "arrow":
+        for batch in storage.feather.read_table(path, memory_map=True).to_batches(max_chunksize=batch_rows):
+            yield _sqlite_ready(batch.to_pandas())
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        dates = [c for c in header if c in storage.DATE_COLUMNS]
+        yield from (_sqlite_ready(chunk) for chunk in pd.read_csv(path, chunksize=batch_rows, parse_dates=dates))
+
+
+def _sqlite_ready(df):
+    """Types acceptés par sqlite3 : catégories -> texte, dates -> texte ISO, uint64 -> int64 (mêmes bits)."""
+    for column in df.columns:
+        if df[column].dtype == "uint64":
+            df[column] = df[column].to_numpy().view("int64")
+        elif isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+        elif pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+    return df
+
+
+def connect(warehouse=WAREHOUSE, engine=DEFAULT_ENGINE):
+    return QueryEngine(warehouse, engine)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Requêtes SQL sur le Data Warehouse")
+    parser.add_argument("query", nargs="?", help="requête SQL")
+    parser.add_argument("--file", help="fichier .sql contenant la requête")
+    parser.add_argument("--example", choices=sorted(EXAMPLES), help="requête en étoile prédéfinie")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE)
+    parser.add_argument("--warehouse", default=WAREHOUSE)
+    parser.add_argument("--explain", action="store_true", help="afficher le plan d'exécution")
+    parser.add_argument("--output", help="écrire le résultat en CSV")
+    args = parser.parse_args(argv)
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            query = f.read()
+    elif args.example:
+        query = EXAMPLES[args.example]
+    elif args.query:
+        query = args.query
+    else:
+        parser.error("requête manquante (texte, --file ou --example)")
+
+    with connect(args.warehouse, args.engine) as db:
+        if args.explain:
+            print(db.explain(query))
+            return
+        start = time.perf_counter()
+        result = db.sql(query)
+        elapsed = time.perf_counter() - start
+    if args.output:
+        result.to_csv(args.output, index=False)
+    else:
+        print(result.to_string(index=False))
+    print(f"\n{len(result)} lignes ({args.engine}, {elapsed * 1000:.1f}ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+schemas.py
+Schémas déclarés des tables sources : extraits SQL Server (sql_*) et exports
+Access (excel_*, après extract_excel / transform_excel).
+
+Chaque table déclare ses colonnes standardisées : noms possibles dans le
+fichier source (alias, par ordre de préférence), type final et valeur d'une
+colonne absente. read_source() lit seulement ces colonnes, directement dans
+leur type final, avec le lecteur CSV multithread de pyarrow ; les
+standardize_* de warehouse.py n'ajoutent que les colonnes dérivées (clés
+normalisées, ...).
+
+Types :
+- "id"     : texte, cellule vide -> "nan" (identifiant naturel, toujours une chaîne) ;
+- "text"   : texte, cellule vide -> NaN ;
+- "date"   : datetime64[ns], valeur invalide -> NaT ;
+- "number" : float64, valeur invalide -> NaN ;
+- "amount" : float64, valeur vide ou invalide -> 0 ;
+- "flag"   : booléen, vrai pour true / 1 / yes.
+
+Une valeur que pyarrow ne sait pas convertir (date non ISO, montant avec
+symbole monétaire, ...) fait relire les colonnes en texte puis convertir par
+pandas, avec le même résultat qu'avant. Sans pyarrow, tout est lu par pandas
+(colonnes utiles seulement).
+
+    python scripts/schemas.py --bench [--raw data/synthetic]   # lecture typée vs dtype=str
+"""
+import argparse
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:  # pyarrow absent : lecture pandas
+    pa = None
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+
+# aliases: source column names (stripped), the first one present is read
+Column = namedtuple("Column", ["aliases", "kind", "default"])
+
+TRUE_VALUES = ["true", "1", "yes"]
+
+SCHEMAS = {
+    "sql_customers": {
+        "customerid_sql": Column(["CustomerID", "customerid"], "id", "nan"),
+        "companyname": Column(["CompanyName", "Company", "companyname"], "text", ""),
+        "region": Column(["Region", "region"], "text", ""),
+        "city": Column(["City", "city"], "text", ""),
+        "country": Column(["Country", "country"], "text", ""),
+        "phone": Column(["Phone"], "text", ""),
+        "fax": Column(["Fax"], "text", ""),
+    },
+    "excel_customers": {
+        "customer_source_id": Column(["ID", "Id"], "text", ""),
+        "companyname": Column(["Company", "company"], "text", ""),
+        "region": Column(["State/Province", "State"], "text", ""),
+        "city": Column(["City"], "text", ""),
+        "country": Column(["Country/Region", "Country"], "text", ""),
+        "phone": Column(["Business Phone"], "text", ""),
+        "fax": Column(["Fax Number"], "text", ""),
+    },
+    "sql_employees": {
+        "employeeid_sql": Column(["EmployeeID", "employeeid"], "id", "nan"),
+        "firstname": Column(["FirstName", "firstname"], "text", ""),
+        "lastname": Column(["LastName", "lastname"], "text", ""),
+        "title": Column(["Title"], "text", ""),
+    },
+    "excel_employees": {
+        "employee_source_id": Column(["ID", "Id"], "text", ""),
+        "firstname": Column(["First Name", "FirstName"], "text", ""),
+        "lastname": Column(["Last Name", "LastName"], "text", ""),
+        "title": Column(["Job Title", "Title"], "text", ""),
+    },
+    "sql_orders": {
+        "orderid_sql": Column(["OrderID", "orderid"], "id", "nan"),
+        "customerid_sql": Column(["CustomerID", "customerid"], "text", ""),
+        "employeeid_sql": Column(["EmployeeID", "employeeid"], "text", ""),
+        "orderdate": Column(["OrderDate", "orderdate"], "date", pd.NaT),
+        "shippeddate": Column(["ShippedDate", "shippeddate"], "date", pd.NaT),
+        "freight": Column(["Freight", "freight"], "amount", 0.0),
+    },
+    "excel_orders": {
+        "orderid_ex": Column(["Order ID", "OrderID"], "id", "nan"),
+        "customer_source_ref": Column(["Customer", "Company"], "text", ""),
+        "employee_source_ref": Column(["Employee", "EmployeeName"], "text", ""),
+        "orderdate": Column(["Order Date", "OrderDate"], "date", pd.NaT),
+        "shippeddate": Column(["Shipped Date", "ShippedDate"], "date", pd.NaT),
+        "freight": Column(["Shipping Fee", "Freight"], "amount", 0.0),
+        "ship_via": Column(["Ship Via", "ShipVia"], "text", ""),
+    },
+    "excel_order_details": {
+        "lineid": Column(["ID", "Id"], "id", "nan"),
+        "orderid_ex": Column(["Order ID", "OrderID"], "id", "nan"),
+        "product_source_ref": Column(["Product", "ProductName"], "text", ""),
+        "quantity": Column(["Quantity"], "amount", 0.0),
+        "unit_price": Column(["Unit Price", "UnitPrice"], "amount", 0.0),
+        "discount": Column(["Discount"], "amount", 0.0),
+        "line_status": Column(["Status ID", "Status"], "text", ""),
+    },
+    "excel_products": {
+        "product_source_id": Column(["ID", "Id"], "text", ""),
+        "product_code": Column(["Product Code"], "text", ""),
+        "productname": Column(["Product Name", "ProductName"], "text", ""),
+        "category": Column(["Category"], "text", ""),
+        "standard_cost": Column(["Standard Cost"], "number", 0.0),
+        "list_price": Column(["List Price", "UnitPrice"], "number", 0.0),
+        "discontinued": Column(["Discontinued"], "flag", False),
+    },
+    "excel_shippers": {
+        "shipper_source_id": Column(["ID", "Id"], "text", ""),
+        "companyname": Column(["Company", "CompanyName"], "text", ""),
+        "city": Column(["City"], "text", ""),
+        "region": Column(["State/Province"], "text", ""),
+        "country": Column(["Country/Region"], "text", ""),
+        "phone": Column(["Business Phone", "Phone"], "text", ""),
+    },
+    "excel_invoices": {
+        "orderid_ex": Column(["Order ID", "OrderID"], "id", "nan"),
+        "invoice_date": Column(["Invoice Date"], "date", pd.NaT),
+        "tax": Column(["Tax"], "amount", 0.0),
+        "amount_due": Column(["Amount Due"], "amount", 0.0),
+    },
+}
+
+# pyarrow type parsed directly from the CSV
+ARROW_TYPES = {"date": "timestamp[ns]", "number": "double", "amount": "double"}
+
+PANDAS_DTYPES = {"id": object, "text": object, "date": "datetime64[ns]", "number": "float64",
+                 "amount": "float64", "flag": bool}
+
+
+def empty_frame(source):
+    """Table `source` sans ligne, colonnes standardisées typées."""
+    return pd.DataFrame({name: pd.Series(dtype=PANDAS_DTYPES[col.kind])
+                         for name, col in SCHEMAS[source].items()})
+
+
+def resolve_columns(source, header):
+    """{colonne standardisée: nom brut dans `header`} pour les colonnes présentes (premier alias trouvé)."""
+    raw = {}
+    for name in header:
+        raw.setdefault(name.strip(), name)
+    found = {}
+    for name, col in SCHEMAS[source].items():
+        alias = next((a for a in col.aliases if a in raw), None)
+        if alias is not None:
+            found[name] = raw[alias]
+    return found
+
+
+def read_header(path):
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_source(source, path):
+    """
+    Colonnes standardisées de la table `source` lues depuis le CSV `path`
+    (table vide si le fichier est absent), dans l'ordre et les types déclarés.
+    """
+    if path is None or not os.path.exists(path):
+        return empty_frame(source)
+    schema = SCHEMAS[source]
+    found = resolve_columns(source, read_header(path))
+    raw = _read_arrow(path, schema, found) if pa is not None else _read_pandas(path, found)
+
+    out = {}
+    for name, col in schema.items():
+        if name not in found:
+            out[name] = col.default
+            continue
+        values = raw[found[name]]
+        if col.kind == "id":
+            values = values.fillna("nan").astype(str)
+        elif col.kind == "text" and values.hasnans:
+            # pyarrow gives None for an empty cell, pandas NaN (row_hash, astype(str))
+            values = values.where(values.notna(), np.nan)
+        elif col.kind == "date" and values.dtype == object:
+            values = pd.to_datetime(values, errors="coerce")
+        elif col.kind in ("number", "amount") and values.dtype == object:
+            values = pd.to_numeric(values, errors="coerce")
+        elif col.kind == "flag":
+            values = values.astype(str).str.lower().isin(TRUE_VALUES)
+        if col.kind == "amount":
+            values = values.fillna(0)
+        out[name] = values
+    # scalar defaults are broadcast to the number of rows
+    return pd.DataFrame(out, index=pd.RangeIndex(len(raw)))
+
+
+def _read_arrow(path, schema, found):
+    """Colonnes `found` de `path` ; dates et nombres typés par pyarrow, en texte s'il refuse une valeur."""
+    columns = list(dict.fromkeys(found.values()))
+    typed = {}
+    for name, raw_name in found.items():
+        kind = schema[name].kind
+        typed[raw_name] = ARROW_TYPES.get(kind, "string") if raw_name not in typed else "string"
+    parse = pacsv.ParseOptions(newlines_in_values=True)
+    try:
+        table = pacsv.read_csv(path, parse_options=parse, convert_options=_convert_options(columns, typed))
+    except pa.ArrowInvalid:
+        # a value pyarrow cannot convert: text, then pandas coercion (errors="coerce")
+        as_text = {c: "string" for c in columns}
+        table = pacsv.read_csv(path, parse_options=parse, convert_options=_convert_options(columns, as_text))
+    return table.to_pandas()
+
+
+def _convert_options(columns, types):
+    return pacsv.ConvertOptions(include_columns=columns,
+                                column_types={c: pa.type_for_alias(t) for c, t in types.items()},
+                                null_values=[""], strings_can_be_null=True)
+
+
+def _read_pandas(path, found):
+    columns = list(dict.fromkeys(found.values()))
+    return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False, na_values=[""])
+
+
+# -------------------------
+# Benchmark
+# -------------------------
+def _untyped_read(source, path):
+    # previous reader: every column as text, then the same coercions
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[""])
+    df.columns = [c.strip() for c in df.columns]
+    for name, col in SCHEMAS[source].items():
+        alias = next((a for a in col.aliases if a in df.columns), None)
+        if alias is not None and col.kind == "date":
+            pd.to_datetime(df[alias], errors="coerce")
+        elif alias is not None and col.kind in ("number", "amount"):
+            pd.to_numeric(df[alias], errors="coerce")
+    return df
+
+
+def benchmark(raw):
+    """Lecture typée (read_source) vs lecture texte complète, pour chaque source de `raw`."""
+    import datawarehouse
+
+    paths = datawarehouse.discover_sources(os.path.join(raw, "sql_sources"), os.path.join(raw, "excel_sources"))
+    print(f"\n===== Lecture des sources ({raw}) =====")
+    print(f"{'source':<22} {'lignes':>10} {'dtype=str':>10} {'typée':>10}")
+    results = {}
+    for source, path in paths.items():
+        if path is None:
+            continue
+        start = time.perf_counter()
+        df = _untyped_read(source, path)
+        untyped = time.perf_counter() - start
+        start = time.perf_counter()
+        read_source(source, path)
+        typed = time.perf_counter() - start
+        results[source] = {"rows": len(df), "untyped_s": untyped, "typed_s": typed}
+        print(f"{source:<22} {len(df):>10} {untyped * 1000:>8.1f}ms {typed * 1000:>8.1f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schémas des tables sources")
+    parser.add_argument("--bench", action="store_true", help="comparer lecture typée et lecture texte")
+    parser.add_argument("--raw", default=os.path.join(BASE, "data", "raw"),
+                        help="dossier contenant sql_sources/ et excel_sources/")
+    args = parser.parse_args(argv)
+    if args.bench:
+        benchmark(args.raw)
+    else:
+        for source, schema in SCHEMAS.items():
+            print(source)
+            for name, col in schema.items():
+                print(f"  {name:<20} {col.kind:<7} {' | '.join(col.aliases)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+"""
+storage.py
+Stockage des tables du Data Warehouse.
+
+Formats :
+- "parquet" (défaut) : colonnaire, typé, compressé (zstd) ; lecture avec
+  projection de colonnes et memory-map ;
+- "arrow"   : Arrow IPC / Feather v2 non compressé, lu par memory-map sans copie ;
+- "csv"     : export texte, conservé pour compatibilité (Excel, outils externes).
+
+read_table() retrouve le fichier quel que soit son format et ne charge que les
+colonnes demandées ; les dates et les clés restent typées. Sans pyarrow, tout
+retombe sur le CSV.
+
+Une table peut aussi être partitionnée par mois d'une clé de date AAAAMMJJ
+(write_partitioned) : <table>/year=AAAA/month=MM/part.<ext>, plus un catalogue
+<table>/_catalog.json (lignes, clé min/max et empreinte du contenu de chaque
+partition). read_table(..., between=(clé, début, fin)) ne lit que les
+partitions qui recoupent l'intervalle. Une partition dont le contenu n'a pas
+changé n'est pas réécrite ; les autres sont écrites en parallèle.
+
+    python scripts/storage.py --bench [--scale 100]   # temps de chargement / tailles
+    python scripts/storage.py --partitions fact_orders  # catalogue des partitions
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from constants import CATALOG, DEFAULT_FORMAT, EXTENSIONS, FORMATS, WAREHOUSE, catalog_path, table_path
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow absent : seul le CSV est disponible
+    pa = None
+
+# Colonnes à relire comme dates depuis un CSV
+DATE_COLUMNS = {"orderdate", "shippeddate", "date"}
+
+# Tables partitionnées (catalogue : constants.CATALOG), partition des clés de date manquantes
+PARTITIONED = "partitioned"
+NULL_PARTITION = "unknown"
+# En dessous, les partitions sont écrites dans le processus courant
+PARALLEL_MIN_ROWS = 200_000
+
+
+def find_table(name, folder=WAREHOUSE):
+    """(chemin, format) du fichier de la table (catalogue si partitionnée), formats colonnaires en priorité."""
+    path = catalog_path(name, folder)
+    if os.path.exists(path):
+        return path, PARTITIONED
+    for fmt in FORMATS:
+        if fmt != "csv" and pa is None:
+            continue
+        path = table_path(name, folder, fmt)
+        if os.path.exists(path):
+            return path, fmt
+    raise FileNotFoundError(f"Table {name!r} introuvable dans {folder}")
+
+
+def _write_file(df, path, fmt):
+    # écriture atomique : un lecteur ne voit jamais de fichier à moitié écrit
+    tmp_path = path + ".part"
+    try:
+        if fmt == "csv":
+            df.to_csv(tmp_path, index=False)
+        else:
+            table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+            if fmt == "parquet":
+                pq.write_table(table, tmp_path, compression="zstd")
+            else:
+                feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+def write_table(df, name, folder=WAREHOUSE, fmt=DEFAULT_FORMAT):
+    """Écrit `df` au format `fmt` (atomiquement) et retourne le chemin du fichier."""
+    if fmt != "csv" and pa is None:
+        raise RuntimeError(f"Le format {fmt} nécessite pyarrow (pip install pyarrow)")
+    os.makedirs(folder, exist_ok=True)
+    return _write_file(df, table_path(name, folder, fmt), fmt)
+
+
+def drop_other_formats(name, folder=WAREHOUSE, keep=(DEFAULT_FORMAT,)):
+    """Supprime les copies de la table dans les formats hors `keep` (périmées après une reconstruction)."""
+    for fmt in FORMATS:
+        path = table_path(name, folder, fmt)
+        if fmt not in keep and os.path.exists(path):
+            os.remove(path)
+    if PARTITIONED not in keep and os.path.exists(catalog_path(name, folder)):
+        shutil.rmtree(os.path.join(folder, name))
+
+
+# -------------------------
+# Tables partitionnées par mois
+# -------------------------
+def read_catalog(name, folder=WAREHOUSE):
+    with open(catalog_path(name, folder), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _partition_path(month, fmt):
+    if month == 0:
+        return f"{NULL_PARTITION}/part{EXTENSIONS[fmt]}"
+    return f"year={month // 100:04d}/month={month % 100:02d}/part{EXTENSIONS[fmt]}"
+
+
+def _write_partition(part, path, fmt):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt != "csv":
+        # each file keeps only the categories of its own rows (not the whole table's dictionary)
+        for i, field in enumerate(part.schema):
+            if pa.types.is_dictionary(field.type):
+                column = part.column(i).combine_chunks().dictionary_decode().dictionary_encode()
+                part = part.set_column(i, field.name, column)
+    return _write_file(part, path, fmt)
+
+
+def write_partitioned(df, name, folder=WAREHOUSE, fmt=DEFAULT_FORMAT, key="orderdate_key", max_workers=None,
+                      only=None):
+    """
+    Écrit `df` en une partition par mois de `key` (clé de date AAAAMMJJ ; les
+    clés manquantes vont dans la partition « unknown ») et retourne le chemin
+    du catalogue. Seules les partitions nouvelles ou modifiées sont écrites,
+    en parallèle si elles sont assez grosses ; les partitions disparues sont
+    supprimées.
+
+    only=[(année, mois), ...] (None pour « unknown ») : reconstruit seulement
+    ces partitions, réécrites même si leur contenu n'a pas changé ; les autres
+    gardent leur fichier et leur entrée du catalogue précédent.
+    """
+    if fmt != "csv" and pa is None:
+        raise RuntimeError(f"Le format {fmt} nécessite pyarrow (pip install pyarrow)")
+    root = os.path.join(folder, name)
+    os.makedirs(root, exist_ok=True)
+    try:
+        previous = read_catalog(name, folder)
+    except FileNotFoundError:
+        previous = None
+    reusable = {}
+    compatible = previous and previous["format"] == fmt and previous["columns"] == list(df.columns)
+    if compatible:
+        reusable = {p["path"]: p["hash"] for p in previous["partitions"]}
+    if only is not None:
+        if not compatible:
+            raise ValueError(f"Reconstruction partielle de {name!r} impossible : pas de catalogue "
+                             f"au format {fmt} avec les mêmes colonnes (reconstruire la table entière)")
+        selected = {_partition_path(0 if p is None else p[0] * 100 + p[1], fmt) for p in only}
+        kept_entries = {p["path"]: p for p in previous["partitions"] if p["path"] not in selected}
+        reusable = {}
+
+    # rows grouped by month (0: no date), one slice per partition
+    months = (df[key] // 100).fillna(0).astype("int64").to_numpy()
+    order = np.argsort(months, kind="stable")
+    months = months[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(months)) + 1] if len(df) else np.zeros(1, dtype="int64")
+    ends = np.r_[starts[1:], len(df)]
+    if len(df):
+        keys = df[key].fillna(0).astype("int64").to_numpy()[order]
+        lows, highs = np.minimum.reduceat(keys, starts), np.maximum.reduceat(keys, starts)
+        # content fingerprint: order-independent sum of the row hashes (wraps around in uint64)
+        hashes = np.add.reduceat(pd.util.hash_pandas_object(df, index=False).to_numpy()[order], starts)
+    else:
+        lows = highs = hashes = np.zeros(1, dtype="int64")
+
+    partitions, changed = [], []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        month = int(months[start]) if len(df) else 0
+        entry = {
+            "path": _partition_path(month, fmt),
+            "rows": int(end - start),
+            "min": int(lows[i]) if month else None,
+            "max": int(highs[i]) if month else None,
+            "hash": str(int(hashes[i])),
+        }
+        if only is not None and entry["path"] not in selected:
+            entry = kept_entries.pop(entry["path"], None)
+            if entry is not None:
+                partitions.append(entry)
+            continue
+        partitions.append(entry)
+        if reusable.get(entry["path"]) != entry["hash"] or not os.path.exists(os.path.join(root, entry["path"])):
+            changed.append((i, entry))
+    if only is not None:
+        # partitions hors sélection absentes de `df` : conservées telles quelles
+        partitions = sorted(partitions + list(kept_entries.values()), key=lambda p: (p["min"] is not None, p["min"] or 0))
+
+    if changed:
+        # converted and sorted once (same schema in every partition), then sliced without copy
+        rows = pa.Table.from_pandas(df, preserve_index=False).take(order) if fmt != "csv" else df.iloc[order]
+        tasks = []
+        for i, entry in changed:
+            start, end = int(starts[i]), int(ends[i])
+            part = rows.slice(start, end - start) if fmt != "csv" else rows.iloc[start:end]
+            tasks.append((part, os.path.join(root, entry["path"]), fmt))
+        if max_workers != 1 and len(tasks) > 1 and sum(entry["rows"] for _, entry in changed) >= PARALLEL_MIN_ROWS:
+            # Parquet / Arrow encoding releases the GIL: the partitions are written concurrently.
+            # Threads rather than processes: a process pool would pickle every slice (a copy
+            # of the table) to its workers, which costs more than the encoding it spreads.
+            with ThreadPoolExecutor(max_workers) as pool:
+                list(pool.map(lambda task: _write_partition(*task), tasks))
+        else:
+            for task in tasks:
+                _write_partition(*task)
+
+    catalog = {"table": name, "key": key, "format": fmt, "columns": list(df.columns),
+               "rows": sum(p["rows"] for p in partitions), "partitions": partitions}
+    path = catalog_path(name, folder)
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=1)
+    os.replace(path + ".part", path)
+
+    kept = {p["path"] for p in partitions}
+    for old in (previous or {}).get("partitions", []):
+        if old["path"] not in kept:
+            old_path = os.path.join(root, old["path"])
+            if os.path.exists(old_path):
+                os.remove(old_path)
+            try:
+                os.removedirs(os.path.dirname(old_path))
+            except OSError:  # dossier non vide (autre format, autre mois)
+                pass
+    metrics.record(name + "_partitions", {"partitions": len(partitions), "written": len(changed),
+                                          "reused": len(partitions) - len(changed)})
+    return path
+
+
+def select_partitions(catalog, low=None, high=None):
+    """Partitions du catalogue dont la clé [min, max] recoupe [low, high] (bornes incluses, None = ouverte)."""
+    if low is None and high is None:
+        return list(catalog["partitions"])
+    return [p for p in catalog["partitions"]
+            if p["min"] is not None
+            and (low is None or p["max"] >= low)
+            and (high is None or p["min"] <= high)]
+
+
+def table_files(name, folder=WAREHOUSE, between=None):
+    """([chemins], format) des fichiers de la table ; pour une table partitionnée, celles qui recoupent `between`."""
+    return _table_files(name, folder, between)[:2]
+
+
+def _table_files(name, folder, between=None):
+    path, fmt = find_table(name, folder)
+    if fmt != PARTITIONED:
+        return [path], fmt, False
+    catalog = read_catalog(name, folder)
+    parts = catalog["partitions"]
+    if between is not None and between[0] == catalog["key"]:
+        parts = select_partitions(catalog, between[1], between[2])
+    root = os.path.join(folder, name)
+    return [os.path.join(root, p["path"]) for p in parts], catalog["format"], True
+
+
+def date_key(value):
+    """Clé de date AAAAMMJJ (entier) d'une date ou d'un texte « AAAA-MM-JJ » ; None reste None."""
+    if value is None:
+        return None
+    return int(pd.Timestamp(value).strftime("%Y%m%d"))
+
+
+def _read_files(paths, fmt, columns):
+    if fmt != "csv":
+        reader = pq.read_table if fmt == "parquet" else feather.read_table
+        if len(paths) == 1:
+            tables = [reader(paths[0], columns=columns, memory_map=True)]
+        else:
+            # many small files (partitions): read concurrently, pyarrow releases the GIL
+            with ThreadPoolExecutor() as pool:
+                tables = list(pool.map(lambda p: reader(p, columns=columns, memory_map=True), paths))
+    else:
+        header = pd.read_csv(paths[0], nrows=0).columns
+        dates = [c for c in (columns or header) if c in DATE_COLUMNS]
+        frames = [pd.read_csv(p, usecols=columns, parse_dates=dates, keep_default_na=False, na_values=[""])
+                  for p in paths]
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+    # one Arrow table: the dictionaries of the partitions are unified (categories kept)
+    return (tables[0] if len(tables) == 1 else pa.concat_tables(tables)).to_pandas()
+
+
+def read_table(name, folder=WAREHOUSE, columns=None, between=None):
+    """
+    Charge la table `name` (seulement `columns` si précisé) en DataFrame typé.
+    `between=(colonne, début, fin)` ne garde que les lignes dont la colonne est
+    dans [début, fin] (bornes incluses, None = ouverte) ; sur la clé d'une table
+    partitionnée, seules les partitions utiles sont lues.
+    """
+    paths, fmt, partitioned = _table_files(name, folder, between)
+    columns = list(columns) if columns is not None else None
+    read_columns = columns
+    if between is not None and columns is not None and between[0] not in columns:
+        read_columns = columns + [between[0]]
+    if not paths:
+        # no partition in range: the schema of the table, without rows
+        df = _read_files(table_files(name, folder)[0][:1], fmt, read_columns).iloc[0:0]
+    else:
+        df = _read_files(paths, fmt, read_columns)
+    if partitioned:
+        # the partition dictionaries are merged in reading order: back to sorted categories
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                try:
+                    df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+                except TypeError:  # catégories non comparables : ordre de lecture
+                    pass
+    if between is not None:
+        column, low, high = between
+        mask = pd.Series(True, index=df.index)
+        if low is not None:
+            mask &= (df[column] >= low).fillna(False)
+        if high is not None:
+            mask &= (df[column] <= high).fillna(False)
+        if not mask.all():
+            df = df[mask].reset_index(drop=True)
+        df = df[columns] if columns is not None else df
+    return df
+
+
+def table_columns(name, folder=WAREHOUSE):
+    path, fmt = find_table(name, folder)
+    if fmt == PARTITIONED:
+        return read_catalog(name, folder)["columns"]
+    if fmt == "parquet":
+        return pq.read_schema(path).names
+    if fmt == "arrow":
+        return feather.read_table(path, memory_map=True).schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+# -------------------------
+# Benchmark
+# -------------------------
+def _time(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(folder=WAREHOUSE, scale=1, columns=("orderdate", "customer_key", "delivered")):
+    """Compare taille et temps de chargement de fact_orders en CSV / Parquet / Arrow."""
+    fact = read_table("fact_orders", folder)
+    if scale > 1:
+        fact = pd.concat([fact] * scale, ignore_index=True)
+    tmp = tempfile.mkdtemp()
+    try:
+        print(f"\n===== Benchmark stockage fact_orders ({len(fact)} lignes) =====")
+        print(f"{'format':<8} {'taille':>10} {'lecture':>10} {'projection':>11}")
+        results = {}
+        for fmt in FORMATS:
+            if fmt != "csv" and pa is None:
+                continue
+            sub = os.path.join(tmp, fmt)
+            path = write_table(fact, "fact_orders", sub, fmt)
+            size = os.path.getsize(path)
+            full = _time(lambda: read_table("fact_orders", sub))
+            proj = _time(lambda: read_table("fact_orders", sub, columns=columns))
+            results[fmt] = {"bytes": size, "read_s": full, "projected_read_s": proj}
+            print(f"{fmt:<8} {size / 1024:>8.0f}KB {full * 1000:>8.1f}ms {proj * 1000:>9.1f}ms")
+        if pa is not None and "orderdate_key" in fact.columns and fact["orderdate_key"].notna().any():
+            # partitioned parquet: full read vs one month (partition pruning)
+            sub = os.path.join(tmp, PARTITIONED)
+            write_partitioned(fact, "fact_orders", sub, "parquet")
+            month = int(fact["orderdate_key"].max()) // 100
+            between = ("orderdate_key", month * 100 + 1, month * 100 + 31)
+            full = _time(lambda: read_table("fact_orders", sub))
+            pruned = _time(lambda: read_table("fact_orders", sub, columns=columns, between=between))
+            results[PARTITIONED] = {"read_s": full, "pruned_read_s": pruned}
+            print(f"{'mensuel':<8} {'':>10} {full * 1000:>8.1f}ms {pruned * 1000:>9.1f}ms  (un mois)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stockage du Data Warehouse")
+    parser.add_argument("--bench", action="store_true", help="comparer CSV / Parquet / Arrow")
+    parser.add_argument("--scale", type=int, default=1, help="répliquer fact_orders N fois")
+    parser.add_argument("--partitions", metavar="TABLE", help="afficher le catalogue d'une table partitionnée")
+    parser.add_argument("--folder", default=WAREHOUSE)
+    args = parser.parse_args(argv)
+    if args.bench:
+        benchmark(args.folder, args.scale)
+    elif args.partitions:
+        catalog = read_catalog(args.partitions, args.folder)
+        print(f"{args.partitions} : {catalog['rows']} lignes, {len(catalog['partitions'])} partitions "
+              f"({catalog['format']}, clé {catalog['key']})")
+        for p in catalog["partitions"]:
+            print(f"  {p['path']:<36} {p['rows']:>9} lignes  {p['min']} .. {p['max']}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+synthetic.py
+Générateur de données synthétiques au format Northwind pour les tests de charge.
+
+Produit les mêmes extraits que le projet (mêmes noms de fichiers et de
+colonnes) :
+- <sortie>/sql_sources/   Customers.csv, Employees.csv, Orders.csv (export SQL Server)
+- <sortie>/excel_sources/ Customers.csv, Employees.csv, Orders.csv (export Access)
+
+Caractéristiques reproduites :
+- clés asymétriques : quelques clients et employés concentrent la plupart des
+  commandes (loi de Zipf, paramètre --skew) ;
+- recouvrement entre sources : une part des clients / employés Access sont des
+  clients / employés SQL, écrits avec du bruit (casse, accents retirés,
+  espaces doublés, quelques fautes de frappe) ;
+- dates d'expédition manquantes (commandes non livrées) ;
+- quelques commandes Access vers des clients inconnus.
+
+Les commandes sont générées et écrites par lots (--chunk-rows) : la mémoire
+utilisée ne dépend pas du nombre de commandes demandé (10^4 à 10^8).
+
+    python scripts/synthetic.py --orders 1000000 [--output data/synthetic] [--seed 42]
+    python scripts/datawarehouse.py --raw data/synthetic --output data/synthetic/warehouse
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+OUTPUT = os.path.join(BASE, "data", "synthetic")
+
+START_DATE = np.datetime64("1996-07-04")
+FIRST_SQL_ORDER = 10248
+FIRST_EXCEL_ORDER = 30
+
+# Commandes écrites à la fois
+CHUNK_ROWS = 500_000
+
+# Part de commandes saisies dans Access, taux de dates d'expédition manquantes
+EXCEL_SHARE = 0.05
+MISSING_SHIPPED = {"sql": 0.025, "excel": 0.2}
+
+# Part des clients / employés Access qui existent aussi côté SQL, et fautes de frappe
+OVERLAP = 0.5
+TYPO_RATE = 0.05
+ORPHAN_RATE = 0.001
+
+# Vocabulaire des raisons sociales (avec accents, comme dans Northwind)
+NAME_WORDS = [
+    "Alfreds", "Antonio", "Berglunds", "Blauer", "Blondel", "Bólido", "Bon", "Bottom", "Cactus", "Centro",
+    "Chop", "Comércio", "Consolidated", "Drachenblut", "Du", "Eastern", "Ernst", "Familia", "Folies", "Franchi",
+    "Frankenversand", "Galería", "Godos", "Gourmet", "Great", "Hanari", "Hungry", "Island", "Königlich", "La",
+    "Laughing", "Lazy", "Lehmanns", "Lonesome", "Magazzini", "Maison", "Mère", "Morgenstern", "Océano", "Old",
+    "Ottilies", "Paris", "Pericles", "Piccolo", "Princesa", "Queen", "Rattlesnake", "Ricardo", "Romero", "Santé",
+]
+NAME_NOUNS = [
+    "Futterkiste", "Emparedados", "Taquería", "Snabbköp", "Delikatessen", "Père", "Délices", "Markets", "Cozinha",
+    "Comidas", "Suey", "Mineiro", "Holdings", "Drachenblut", "Monde", "Connection", "Handel", "Arquibaldo",
+    "Bergères", "Spécialités", "Gastronomía", "Cocina", "Provisioners", "Carnes", "Coyote", "Trading", "Essen",
+    "Kellerei", "Riuniti", "Paillarde", "Gesundkost", "Grocery", "Canyon", "Market", "Spezialitäten", "Atlántico",
+    "Alimentari", "Insular", "Cozinheira", "Store",
+]
+NAME_SUFFIXES = ["", "Co.", "GmbH", "S.A.", "Ltd", "& Cie", "Importadora", "Ltda."]
+
+FIRST_NAMES = ["Nancy", "Andrew", "Janet", "Margaret", "Steven", "Michael", "Robert", "Laura", "Anne", "Jan",
+               "Mariya", "Hélène", "José", "François", "Zoé", "Björn", "Renée", "Andrés", "Søren", "Inès"]
+LAST_NAMES = ["Davolio", "Fuller", "Leverling", "Peacock", "Buchanan", "Suyama", "King", "Callahan", "Dodsworth",
+              "Kotas", "Sergienko", "Thibault", "Müller", "Gómez", "Lefèvre", "Östberg", "Brontë", "Núñez",
+              "Hellung-Larsen", "Giussani"]
+TITLES = ["Sales Representative", "Sales Manager", "Inside Sales Coordinator", "Vice President, Sales"]
+
+# (ville, région, pays) ; la région est vide hors Amériques comme dans Northwind
+PLACES = [
+    ("Berlin", "", "Germany"), ("México D.F.", "", "Mexico"), ("London", "", "UK"), ("Luleå", "", "Sweden"),
+    ("Mannheim", "", "Germany"), ("Strasbourg", "", "France"), ("Madrid", "", "Spain"), ("Marseille", "", "France"),
+    ("Tsawassen", "BC", "Canada"), ("Buenos Aires", "", "Argentina"), ("Bern", "", "Switzerland"),
+    ("Sao Paulo", "SP", "Brazil"), ("Aachen", "", "Germany"), ("Nantes", "", "France"), ("Graz", "", "Austria"),
+    ("Eugene", "OR", "USA"), ("Seattle", "WA", "USA"), ("Boston", "MA", "USA"), ("Lyon", "", "France"),
+    ("Torino", "", "Italy"), ("Lisboa", "", "Portugal"), ("Caracas", "DF", "Venezuela"), ("Cork", "Co. Cork", "Ireland"),
+    ("Montréal", "Québec", "Canada"), ("Anchorage", "AK", "USA"), ("Oulu", "", "Finland"), ("Warszawa", "", "Poland"),
+]
+SHIPPERS = ["Shipping Company A", "Shipping Company B", "Shipping Company C"]
+
+SQL_CUSTOMER_COLUMNS = ["CustomerID", "CompanyName", "ContactName", "ContactTitle", "Address", "City", "Region",
+                        "PostalCode", "Country", "Phone", "Fax"]
+SQL_EMPLOYEE_COLUMNS = ["EmployeeID", "LastName", "FirstName", "Title", "TitleOfCourtesy", "BirthDate", "HireDate",
+                        "Address", "City", "Region", "PostalCode", "Country", "HomePhone", "Extension", "Photo",
+                        "Notes", "ReportsTo", "PhotoPath"]
+SQL_ORDER_COLUMNS = ["OrderID", "CustomerID", "EmployeeID", "OrderDate", "RequiredDate", "ShippedDate", "ShipVia",
+                     "Freight", "ShipName", "ShipAddress", "ShipCity", "ShipRegion", "ShipPostalCode", "ShipCountry"]
+ACCESS_PERSON_COLUMNS = ["ID", "Company", "Last Name", "First Name", "E-mail Address", "Job Title", "Business Phone",
+                         "Home Phone", "Mobile Phone", "Fax Number", "Address", "City", "State/Province",
+                         "ZIP/Postal Code", "Country/Region", "Web Page", "Notes", "Attachments"]
+ACCESS_ORDER_COLUMNS = ["Order ID", "Employee", "Customer", "Order Date", "Shipped Date", "Ship Via", "Ship Name",
+                        "Ship Address", "Ship City", "Ship State/Province", "Ship ZIP/Postal Code",
+                        "Ship Country/Region", "Shipping Fee", "Taxes", "Payment Type", "Paid Date", "Notes",
+                        "Tax Rate", "Tax Status", "Status ID"]
+
+
+# -------------------------
+# Libellés
+# -------------------------
+def company_names(ids):
+    """Raison sociale unique et déterministe de chaque identifiant entier."""
+    ids = np.asarray(ids)
+    a, b, c = len(NAME_WORDS), len(NAME_NOUNS), len(NAME_SUFFIXES)
+    words = np.array(NAME_WORDS, dtype=object)[ids % a]
+    nouns = np.array(NAME_NOUNS, dtype=object)[(ids // a) % b]
+    suffixes = np.array(NAME_SUFFIXES, dtype=object)[(ids // (a * b)) % c]
+    names = pd.Series(words + " " + nouns + " " + suffixes).str.strip()
+    branch = ids // (a * b * c)
+    return names.where(branch == 0, names + " " + (branch + 1).astype(str)).to_numpy(dtype=object)
+
+
+def customer_codes(ids):
+    """CustomerID SQL : 5 lettres majuscules, uniques (base 26)."""
+    ids = np.asarray(ids, dtype=np.int64)
+    letters = [(ids // 26 ** p) % 26 for p in range(4, -1, -1)]
+    codes = np.stack(letters, axis=1).astype(np.uint8) + ord("A")
+    return codes.view("S5").ravel().astype(str).astype(object)
+
+
+def add_noise(names, rng, typo_rate=TYPO_RATE):
+    """Même entité, autre saisie : casse, accents retirés, espaces doublés, quelques fautes de frappe."""
+    names = pd.Series(names, dtype=object)
+    n = len(names)
+    case = rng.integers(0, 3, n)
+    names = names.where(case != 1, names.str.upper()).where(case != 2, names.str.lower())
+    strip = rng.random(n) < 0.5
+    ascii_names = names.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+    names = names.where(~strip, ascii_names)
+    spaced = rng.random(n) < 0.2
+    names = names.where(~spaced, names.str.replace(" ", "  ", n=1, regex=False))
+    typo = np.flatnonzero(rng.random(n) < typo_rate)
+    if len(typo):
+        values = names.to_numpy(dtype=object).copy()
+        for i in typo:
+            s = values[i]
+            if len(s) > 6:
+                k = int(rng.integers(1, len(s) - 1))
+                values[i] = s[:k] + s[k + 1:]
+        names = pd.Series(values, dtype=object)
+    return names.to_numpy(dtype=object)
+
+
+def zipf_weights(n, skew, rng):
+    """Probabilités de tirage ∝ 1 / rang^skew, rangs mélangés (les gros clients ne sont pas les premiers)."""
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return rng.permutation(weights / weights.sum())
+
+
+def _dates(days):
+    """Jours depuis START_DATE -> texte ISO ("" si manquant)."""
+    text = np.datetime_as_string(START_DATE + days.astype("timedelta64[D]"), unit="D")
+    return np.where(days < 0, "", text)
+
+
+# -------------------------
+# Dimensions
+# -------------------------
+def sizes(orders):
+    """Nombre de clients et d'employés des deux sources pour `orders` commandes."""
+    sql_customers = int(np.clip(orders // 10, 91, 2_000_000))
+    sql_employees = int(np.clip(orders // 2_000, 9, 20_000))
+    excel_customers = int(np.clip(orders // 30, 29, 700_000))
+    excel_employees = int(np.clip(orders // 6_000, 9, 7_000))
+    return sql_customers, sql_employees, excel_customers, excel_employees
+
+
+def generate_people(n, rng, first_id=0):
+    """(prénoms, noms) ; les homonymes sont départagés par un numéro."""
+    ids = np.arange(first_id, first_id + n)
+    first = np.array(FIRST_NAMES, dtype=object)[ids % len(FIRST_NAMES)]
+    # (i % F, (i + i // F) % L): distinct pairs, and neighbours do not share a last name
+    last = np.array(LAST_NAMES, dtype=object)[(ids + ids // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    rank = ids // (len(FIRST_NAMES) * len(LAST_NAMES))
+    last = np.where(rank == 0, last, last + "-" + (rank + 1).astype(str))
+    order = rng.permutation(n)
+    return first[order], last[order]
+
+
+def generate_dimensions(orders, rng, overlap=OVERLAP, typo_rate=TYPO_RATE):
+    """Les quatre tables Customers / Employees (SQL et Access) en DataFrames."""
+    n_sc, n_se, n_ec, n_ee = sizes(orders)
+
+    # SQL customers
+    company = company_names(rng.permutation(n_sc + n_ec))
+    places = rng.integers(0, len(PLACES), n_sc)
+    city, region, country = (np.array([p[i] for p in PLACES], dtype=object)[places] for i in range(3))
+    sql_customers = pd.DataFrame({
+        "CustomerID": customer_codes(np.arange(n_sc)),
+        "CompanyName": company[:n_sc],
+        "ContactName": "", "ContactTitle": "Owner", "Address": "",
+        "City": city, "Region": region, "PostalCode": "", "Country": country,
+        "Phone": "", "Fax": "",
+    })[SQL_CUSTOMER_COLUMNS]
+
+    # Access customers: noisy copies of SQL companies, then companies of their own
+    shared = int(n_ec * overlap)
+    copied = rng.choice(n_sc, shared, replace=False)
+    names = np.concatenate([add_noise(company[copied], rng, typo_rate), company[n_sc:n_sc + n_ec - shared]])
+    places = rng.integers(0, len(PLACES), n_ec)
+    excel_customers = _access_people(np.arange(1, n_ec + 1), names, *generate_people(n_ec, rng), places, "Owner")
+
+    # Employees
+    first, last = generate_people(n_se + n_ee, rng)
+    places = rng.integers(0, len(PLACES), n_se)
+    city, region, country = (np.array([p[i] for p in PLACES], dtype=object)[places] for i in range(3))
+    sql_employees = pd.DataFrame({
+        "EmployeeID": np.arange(1, n_se + 1),
+        "LastName": last[:n_se], "FirstName": first[:n_se],
+        "Title": np.array(TITLES, dtype=object)[rng.integers(0, len(TITLES), n_se)],
+        "City": city, "Region": region, "Country": country,
+    }).reindex(columns=SQL_EMPLOYEE_COLUMNS, fill_value="")
+
+    shared = min(int(n_ee * overlap), n_se)
+    copied = rng.choice(n_se, shared, replace=False)
+    ex_first = np.concatenate([add_noise(first[copied], rng, 0), first[n_se:n_se + n_ee - shared]])
+    ex_last = np.concatenate([add_noise(last[copied], rng, 0), last[n_se:n_se + n_ee - shared]])
+    places = rng.integers(0, len(PLACES), n_ee)
+    excel_employees = _access_people(np.arange(1, n_ee + 1), np.full(n_ee, "Northwind Traders", dtype=object),
+                                     ex_first, ex_last, places, "Sales Representative")
+    return sql_customers, sql_employees, excel_customers, excel_employees
+
+
+def _access_people(ids, company, first, last, places, title):
+    city, region, country = (np.array([p[i] for p in PLACES], dtype=object)[places] for i in range(3))
+    return pd.DataFrame({
+        "ID": ids, "Company": company, "Last Name": last, "First Name": first, "Job Title": title,
+        "City": city, "State/Province": region, "Country/Region": country, "Attachments": 0,
+    }).reindex(columns=ACCESS_PERSON_COLUMNS, fill_value="")
+
+
+# -------------------------
+# Commandes (par lots)
+# -------------------------
+def _order_dates(n, days, rng, missing_rate):
+    ordered = rng.integers(0, days, n)
+    shipped = ordered + rng.integers(1, 36, n)
+    shipped[rng.random(n) < missing_rate] = -1
+    return ordered, shipped
+
+
+def sql_order_chunks(n, customers, employees, rng, days, skew, chunk_rows=CHUNK_ROWS):
+    """Lots de commandes SQL (DataFrames) ; clients et employés tirés selon une loi de Zipf."""
+    p_customer = zipf_weights(len(customers), skew, rng)
+    p_employee = zipf_weights(len(employees), skew / 2, rng)
+    ids = customers["CustomerID"].to_numpy(dtype=object)
+    names = customers["CompanyName"].to_numpy(dtype=object)
+    cities = customers["City"].to_numpy(dtype=object)
+    regions = customers["Region"].to_numpy(dtype=object)
+    countries = customers["Country"].to_numpy(dtype=object)
+    for start in range(0, n, chunk_rows):
+        size = min(chunk_rows, n - start)
+        c = rng.choice(len(customers), size, p=p_customer)
+        ordered, shipped = _order_dates(size, days, rng, MISSING_SHIPPED["sql"])
+        yield pd.DataFrame({
+            "OrderID": np.arange(FIRST_SQL_ORDER + start, FIRST_SQL_ORDER + start + size),
+            "CustomerID": ids[c],
+            "EmployeeID": rng.choice(len(employees), size, p=p_employee) + 1,
+            "OrderDate": _dates(ordered),
+            "RequiredDate": _dates(ordered + 28),
+            "ShippedDate": _dates(shipped),
+            "ShipVia": rng.integers(1, 4, size),
+            "Freight": np.round(rng.lognormal(3.3, 1.2, size), 2),
+            "ShipName": names[c], "ShipAddress": "", "ShipCity": cities[c], "ShipRegion": regions[c],
+            "ShipPostalCode": "", "ShipCountry": countries[c],
+        })
+
+
+def excel_order_chunks(n, customers, employees, rng, days, skew, orphan_rate=ORPHAN_RATE, chunk_rows=CHUNK_ROWS):
+    """Lots de commandes Access : client et employé référencés par leur libellé."""
+    p_customer = zipf_weights(len(customers), skew, rng)
+    p_employee = zipf_weights(len(employees), skew / 2, rng)
+    company = customers["Company"].to_numpy(dtype=object)
+    employee = (employees["First Name"] + " " + employees["Last Name"]).to_numpy(dtype=object)
+    for start in range(0, n, chunk_rows):
+        size = min(chunk_rows, n - start)
+        c = rng.choice(len(customers), size, p=p_customer)
+        customer = company[c]
+        orphans = rng.random(size) < orphan_rate
+        customer[orphans] = "Unknown Company " + pd.Series(np.flatnonzero(orphans) + start).astype(str).to_numpy()
+        ordered, shipped = _order_dates(size, days, rng, MISSING_SHIPPED["excel"])
+        order_date = _dates(ordered)
+        yield pd.DataFrame({
+            "Order ID": np.arange(FIRST_EXCEL_ORDER + start, FIRST_EXCEL_ORDER + start + size),
+            "Employee": employee[rng.choice(len(employees), size, p=p_employee)],
+            "Customer": customer,
+            "Order Date": np.char.add(order_date.astype(str), " 00:00:00"),
+            "Shipped Date": _dates(shipped),
+            "Ship Via": np.array(SHIPPERS, dtype=object)[rng.integers(0, len(SHIPPERS), size)],
+            "Shipping Fee": np.round(rng.lognormal(2.5, 1.5, size), 2),
+            "Taxes": 0,
+            "Status ID": np.where(shipped < 0, "New", "Closed"),
+        }).reindex(columns=ACCESS_ORDER_COLUMNS, fill_value="")
+
+
+def write_chunks(chunks, path):
+    """Écrit les lots les uns après les autres dans `path` (atomiquement) ; retourne le nombre de lignes."""
+    tmp_path = path + ".part"
+    rows = 0
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, index=False, header=(i == 0))
+                rows += len(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return rows
+
+
+def generate(orders, output=OUTPUT, seed=42, excel_share=EXCEL_SHARE, years=10, skew=1.1,
+             overlap=OVERLAP, chunk_rows=CHUNK_ROWS):
+    """Écrit les six extraits sous `output` ; retourne {fichier: nombre de lignes}."""
+    rng = np.random.default_rng(seed)
+    sql_folder = os.path.join(output, "sql_sources")
+    excel_folder = os.path.join(output, "excel_sources")
+    os.makedirs(sql_folder, exist_ok=True)
+    os.makedirs(excel_folder, exist_ok=True)
+
+    sql_c, sql_e, ex_c, ex_e = generate_dimensions(orders, rng, overlap)
+    n_excel = int(orders * excel_share)
+    days = int(years * 365.25)
+
+    counts = {}
+    for folder, name, df in ((sql_folder, "Customers.csv", sql_c), (sql_folder, "Employees.csv", sql_e),
+                             (excel_folder, "Customers.csv", ex_c), (excel_folder, "Employees.csv", ex_e)):
+        counts[os.path.join(folder, name)] = write_chunks([df], os.path.join(folder, name))
+    path = os.path.join(sql_folder, "Orders.csv")
+    counts[path] = write_chunks(sql_order_chunks(orders - n_excel, sql_c, sql_e, rng, days, skew, chunk_rows), path)
+    path = os.path.join(excel_folder, "Orders.csv")
+    counts[path] = write_chunks(excel_order_chunks(n_excel, ex_c, ex_e, rng, days, skew, chunk_rows=chunk_rows), path)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Données synthétiques Northwind (tests de charge)")
+    parser.add_argument("--orders", type=int, default=100_000, help="nombre total de commandes")
+    parser.add_argument("--output", default=OUTPUT, help="dossier de sortie (sql_sources/ et excel_sources/)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--excel-share", type=float, default=EXCEL_SHARE, help="part des commandes Access")
+    parser.add_argument("--years", type=float, default=10, help="période couverte par les commandes")
+    parser.add_argument("--skew", type=float, default=1.1, help="exposant de Zipf des clients")
+    parser.add_argument("--overlap", type=float, default=OVERLAP, help="part des entités Access présentes en SQL")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="commandes écrites par lot")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    counts = generate(args.orders, args.output, args.seed, args.excel_share, args.years, args.skew,
+                      args.overlap, args.chunk_rows)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Données synthétiques générées en {elapsed:.1f}s :")
+    for path, rows in counts.items():
+        print(f" - {os.path.relpath(path, args.output):<28} {rows:>12} lignes")
+
+
+if __name__ == "__main__":
+    main()
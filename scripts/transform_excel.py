@@ -1,75 +1,100 @@
-import pandas as pd
 import os
-import unidecode
+import sys
 
-RAW = "data/raw/excel_sources/"
-OUT = "../data/processed/excel_sources/"
-os.makedirs(OUT, exist_ok=True)
+import manifest
+import metrics
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+RAW = os.path.join(BASE, "data", "raw", "excel_sources")
+OUT = os.path.join(BASE, "data", "processed", "excel_sources")
+
+INPUTS = [os.path.join(RAW, f) for f in ("Customers.csv", "Employees.csv", "Orders.csv")] + \
+         [__file__, os.path.join(os.path.dirname(__file__), "normalization.py")]
+OUTPUTS = [os.path.join(OUT, f) for f in ("customers_norm.csv", "employees_norm.csv", "orders_norm.csv")]
+
+run = metrics.start("transform_excel")
+
+# Sources inchangées depuis la dernière exécution : rien à faire
+# (vérifié avant l'import de pandas pour qu'une relance à vide soit immédiate)
+if "--force" not in sys.argv and manifest.is_fresh("transform_excel", INPUTS, OUTPUTS):
+    print("✔ transform_excel : sources inchangées, rien à faire")
+    metrics.record("skipped", True)
+    run.finish()
+    raise SystemExit
+
+import pandas as pd
 
-def normalize_text(s):
-    if pd.isna(s): return ""
-    s = str(s).strip().lower()
-    s = unidecode.unidecode(s)
-    return " ".join(s.split())
+from normalization import normalize_series
+
+os.makedirs(OUT, exist_ok=True)
 
 # --------------------
 # Customers
 # --------------------
-df = pd.read_csv(RAW + "Customers.csv")
-
-norm = pd.DataFrame()
-norm["customer_source_id"] = df["ID"]
-norm["companyname"] = df["Company"]
-norm["contactname"] = df["First Name"] + " " + df["Last Name"]
-norm["address"]     = df["Address"]
-norm["city"]        = df["City"]
-norm["region"]      = df["State/Province"]
-norm["postalcode"]  = df["ZIP/Postal Code"]
-norm["country"]     = df["Country/Region"]
-norm["phone"]       = df["Business Phone"]
-norm["fax"]         = df["Fax Number"]
-norm["company_norm"] = norm["companyname"].apply(normalize_text)
-
-norm.to_csv(OUT + "customers_norm.csv", index=False)
+with metrics.stage("customers") as st:
+    df = pd.read_csv(os.path.join(RAW, "Customers.csv"))
+
+    norm = pd.DataFrame()
+    norm["customer_source_id"] = df["ID"]
+    norm["companyname"] = df["Company"]
+    norm["contactname"] = df["First Name"] + " " + df["Last Name"]
+    norm["address"]     = df["Address"]
+    norm["city"]        = df["City"]
+    norm["region"]      = df["State/Province"]
+    norm["postalcode"]  = df["ZIP/Postal Code"]
+    norm["country"]     = df["Country/Region"]
+    norm["phone"]       = df["Business Phone"]
+    norm["fax"]         = df["Fax Number"]
+    norm["company_norm"] = normalize_series(norm["companyname"])
+
+    norm.to_csv(os.path.join(OUT, "customers_norm.csv"), index=False)
+    st.rows_in, st.rows_out = len(df), len(norm)
 print("✔ customers_norm.csv généré")
 
 # --------------------
 # Employees
 # --------------------
-df = pd.read_csv(RAW + "Employees.csv")
-
-norm = pd.DataFrame()
-norm["employee_source_id"] = df["ID"]
-norm["firstname"] = df["First Name"]
-norm["lastname"]  = df["Last Name"]
-norm["title"]     = df["Job Title"]
-norm["address"]   = df["Address"]
-norm["city"]      = df["City"]
-norm["region"]    = df["State/Province"]
-norm["postalcode"]= df["ZIP/Postal Code"]
-norm["country"]   = df["Country/Region"]
-norm["notes"]     = df["Notes"]
-norm["emp_norm"]  = (norm["firstname"] + " " + norm["lastname"]).apply(normalize_text)
-
-norm.to_csv(OUT + "employees_norm.csv", index=False)
+with metrics.stage("employees") as st:
+    df = pd.read_csv(os.path.join(RAW, "Employees.csv"))
+
+    norm = pd.DataFrame()
+    norm["employee_source_id"] = df["ID"]
+    norm["firstname"] = df["First Name"]
+    norm["lastname"]  = df["Last Name"]
+    norm["title"]     = df["Job Title"]
+    norm["address"]   = df["Address"]
+    norm["city"]      = df["City"]
+    norm["region"]    = df["State/Province"]
+    norm["postalcode"]= df["ZIP/Postal Code"]
+    norm["country"]   = df["Country/Region"]
+    norm["notes"]     = df["Notes"]
+    norm["emp_norm"]  = normalize_series(norm["firstname"] + " " + norm["lastname"])
+
+    norm.to_csv(os.path.join(OUT, "employees_norm.csv"), index=False)
+    st.rows_in, st.rows_out = len(df), len(norm)
 print("✔ employees_norm.csv généré")
 
 # --------------------
 # Orders
 # --------------------
-df = pd.read_csv(RAW + "Orders.csv")
+with metrics.stage("orders") as st:
+    df = pd.read_csv(os.path.join(RAW, "Orders.csv"))
 
-df["Order Date"] = pd.to_datetime(df["Order Date"], errors="coerce")
-df["Shipped Date"] = pd.to_datetime(df["Shipped Date"], errors="coerce")
+    df["Order Date"] = pd.to_datetime(df["Order Date"], errors="coerce")
+    df["Shipped Date"] = pd.to_datetime(df["Shipped Date"], errors="coerce")
 
-norm = pd.DataFrame()
-norm["order_source_id"] = df["Order ID"]
-norm["customer_norm"] = df["Customer"].apply(normalize_text)
-norm["employee_norm"] = df["Employee"].apply(normalize_text)
-norm["orderdate"]  = df["Order Date"]
-norm["shippeddate"] = df["Shipped Date"]
-norm["shipcountry"] = df["Ship Country/Region"]
-norm["delivered"] = norm["shippeddate"].notna().astype(int)
+    norm = pd.DataFrame()
+    norm["order_source_id"] = df["Order ID"]
+    norm["customer_norm"] = normalize_series(df["Customer"])
+    norm["employee_norm"] = normalize_series(df["Employee"])
+    norm["orderdate"]  = df["Order Date"]
+    norm["shippeddate"] = df["Shipped Date"]
+    norm["shipcountry"] = df["Ship Country/Region"]
+    norm["delivered"] = norm["shippeddate"].notna().astype(int)
 
-norm.to_csv(OUT + "orders_norm.csv", index=False)
+    norm.to_csv(os.path.join(OUT, "orders_norm.csv"), index=False)
+    st.rows_in, st.rows_out = len(df), len(norm)
 print("✔ orders_norm.csv généré")
+
+manifest.record("transform_excel", INPUTS, OUTPUTS)
+run.finish()
@@ -0,0 +1,875 @@
+"""
+warehouse.py
+Star-schema build as a library. Every step (standardize_*, dim_customers,
+dim_employees, dim_temps, dim_products, dim_shippers, fact_orders,
+fact_order_lines, agg_orders, file writes) is a plain function
+declared as a pipeline Stage with named inputs and outputs. build_warehouse()
+runs the DAG: independent stages (the six standardizations, the three
+dimensions, the writes) run concurrently and each stage is timed.
+
+The raw CSV files are read through the declared source schemas (see
+schemas.py): only the needed columns, parsed straight into their final dtypes.
+
+Surrogate keys (customer_key, employee_key, fact_key) are persisted in key
+maps (<warehouse>/keymaps/) so a rebuild never renumbers existing members.
+row_hash fingerprints the source columns of an order and what its customer /
+employee references resolve to. In incremental mode the fact rows whose
+fingerprint did not change are reused as they are; only new or changed orders
+are normalized, keyed and mapped.
+
+Excel customers/employees whose normalized name has no exact SQL match are
+fuzzy-matched to the SQL names (see matching.py); matches above the
+threshold are treated as the same member in the dimensions and the fact.
+
+fact_orders is stored partitioned by month of orderdate_key (see
+storage.write_partitioned): only the months whose rows changed are rewritten.
+
+Before anything is written, quality.py checks the fact and the dimensions
+against a declared rule set (orphan keys, dates outside the calendar,
+duplicate orders, ...); depending on the mode the build only reports the
+violations, fails, or moves the rejected orders to a quarantine table.
+
+The build also writes the dashboard snapshot (dashboard_cells, see
+dashboard_data.py): fact_orders pre-grouped and pre-joined to its labels.
+
+The command-line entry point is scripts/datawarehouse.py.
+"""
+import os
+
+import pandas as pd
+import numpy as np
+from pandas.api.types import union_categoricals
+
+import aggregates
+import constants
+import dashboard_data
+import matching
+import quality
+import schemas
+import storage
+from normalization import normalize_series
+from pipeline import Stage, run_stages
+
+BASE = os.path.join(os.path.dirname(__file__), "..")
+WAREHOUSE = os.path.join(BASE, "data", "warehouse")
+KEYMAPS = "keymaps"
+
+# Surrogate key stores: name -> (natural key columns, surrogate key column)
+KEYMAP_SPECS = {
+    "customers": (["company_norm"], "customer_key"),
+    "employees": (["emp_norm"], "employee_key"),
+    "orders": (["source", "orderid"], "fact_key"),
+    "products": (["product_norm"], "product_key"),
+    "shippers": (["shipper_norm"], "shipper_key"),
+    "order_lines": (["source", "lineid"], "line_key"),
+}
+
+# Source columns of an order, and the references its customer / employee
+# label and key are resolved from; row_hash fingerprints both (see
+# order_fingerprints), a row whose fingerprint is unchanged is not rebuilt
+ORDER_SOURCE_COLUMNS = {
+    "sql": ["orderid_sql", "orderdate", "shippeddate", "freight"],
+    "excel": ["orderid_ex", "orderdate", "shippeddate", "freight"],
+}
+ORDER_REFERENCES = {
+    "sql": {"customer": "customerid_sql", "employee": "employeeid_sql"},
+    "excel": {"customer": "customer_norm", "employee": "employee_norm"},
+}
+RESOLVED = {"customer": ["company_norm", "customer_key"], "employee": ["employee_norm", "employee_key"]}
+
+# -------------------------
+# Helpers
+# -------------------------
+def normalize_key(values):
+    """Normalized join key: unidecode + lower, '-'/'_' as blanks, collapsed whitespace.
+    Each distinct value is normalized once and broadcast back to the rows."""
+    return normalize_series(values, separators="-_")
+
+# -------------------------
+# Surrogate key maps
+# -------------------------
+def keymap_folder(warehouse=WAREHOUSE):
+    return os.path.join(warehouse, KEYMAPS)
+
+def empty_keymap(name):
+    natural, key = KEYMAP_SPECS[name]
+    return pd.DataFrame({**{c: pd.Series(dtype=object) for c in natural},
+                         key: pd.Series(dtype="int64")})
+
+def load_keymap(name, warehouse=WAREHOUSE):
+    """Persisted natural key -> surrogate key map (empty on the first build)."""
+    natural, key = KEYMAP_SPECS[name]
+    try:
+        keymap = storage.read_table(name, keymap_folder(warehouse))
+    except FileNotFoundError:
+        return empty_keymap(name)
+    keymap[natural] = keymap[natural].astype(str)
+    keymap[key] = keymap[key].astype("int64")
+    return keymap
+
+def assign_keys(df, keymap, natural, key):
+    """
+    Surrogate keys for the rows of `df`: a natural key already in `keymap`
+    keeps its key, new ones get max+1, max+2, ... in order of appearance.
+    Returns (keys aligned with df, updated keymap).
+    """
+    lookup = df[natural].astype(str)
+    known = keymap
+    if len(lookup) * 10 < len(keymap):
+        # a few rows (incremental load): only the entries they can match are joined
+        known = keymap[np.logical_and.reduce([keymap[c].isin(lookup[c]).to_numpy() for c in natural])]
+    merged = lookup.merge(known, on=natural, how="left")
+    missing = merged[key].isna()
+    if missing.any():
+        new = lookup[missing.to_numpy()].drop_duplicates()
+        start = int(keymap[key].max()) + 1 if len(keymap) else 1
+        new[key] = np.arange(start, start + len(new), dtype="int64")
+        keymap = pd.concat([keymap, new], ignore_index=True)
+        merged = lookup.merge(pd.concat([known, new], ignore_index=True), on=natural, how="left")
+    return merged[key].astype("int64").to_numpy(), keymap
+
+def hash_lookup(values, keys, targets):
+    """
+    Vectorized hash join of `values` against `keys`: the matching `targets`
+    entry as float (NaN when absent). On duplicate keys the last one wins, as
+    with a dict built from the same columns.
+    """
+    lookup = pd.DataFrame({"key": np.asarray(keys), "target": np.asarray(targets, dtype=float)})
+    lookup = lookup.drop_duplicates("key", keep="last")
+    if lookup.empty:
+        return np.full(len(values), np.nan)
+    pos = pd.Index(lookup["key"]).get_indexer(np.asarray(values))
+    return np.where(pos >= 0, lookup["target"].to_numpy()[pos], np.nan)
+
+def date_key(dates):
+    """YYYYMMDD integer key computed from datetime64 values (NaN for NaT)."""
+    dates = pd.to_datetime(pd.Series(dates, copy=False), errors="coerce")
+    return (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).to_numpy(dtype=float)
+
+def apply_aliases(values, aliases):
+    """Replace the normalized names found in `aliases` by their canonical name."""
+    if not aliases:
+        return values
+    return values.map(aliases).fillna(values)
+
+# -------------------------
+# Fuzzy entity matching (Excel name -> SQL name)
+# -------------------------
+def match_entities(name, sql_names, excel_names, warehouse=WAREHOUSE, threshold=matching.DEFAULT_THRESHOLD):
+    """
+    ({excel name: sql name}, match state) for the Excel names without an exact
+    SQL match whose best fuzzy candidate scores at least `threshold`. The
+    match state (see matching.save_matches) is persisted by the build so later
+    builds only score new names or new targets.
+    """
+    sql_names = pd.Series(sql_names, dtype=object).dropna()
+    sql_names = sql_names[sql_names != ""].unique()
+    excel_names = pd.Series(excel_names, dtype=object).dropna()
+    unmatched = excel_names[(excel_names != "") & ~excel_names.isin(set(sql_names))].unique()
+
+    folder = matching.match_folder(warehouse)
+    matches, targets, model = matching.load_matches(name, folder)
+    matches, targets, model = matching.update_matches(unmatched, sql_names, matches, targets, model)
+    return matching.aliases(matches, threshold), (matches, targets, model)
+
+# -------------------------
+# Standardize: derived columns
+# -------------------------
+# The source columns are already renamed, selected and typed by
+# schemas.read_source (aliases and types are declared in schemas.SCHEMAS);
+# each standardizer only adds the normalized join keys.
+def standardize_customers_sql(df):
+    return df.assign(company_norm=normalize_key(df["companyname"]))
+
+def standardize_customers_excel(df):
+    return df.assign(company_norm=normalize_key(df["companyname"]))
+
+def standardize_employees_sql(df):
+    return df.assign(emp_norm=normalize_key(df["firstname"].fillna("") + " " + df["lastname"].fillna("")))
+
+def standardize_employees_excel(df):
+    return df.assign(emp_norm=normalize_key(df["firstname"].fillna("") + " " + df["lastname"].fillna("")))
+
+def standardize_orders_sql(df):
+    return df
+
+def standardize_orders_excel(df):
+    return df.assign(customer_norm=normalize_key(df["customer_source_ref"]),
+                     employee_norm=normalize_key(df["employee_source_ref"]))
+
+def standardize_order_details_excel(df):
+    return df.assign(product_norm=normalize_key(df["product_source_ref"]))
+
+def standardize_products_excel(df):
+    return df.assign(product_norm=normalize_key(df["productname"]))
+
+def standardize_shippers_excel(df):
+    return df.assign(shipper_norm=normalize_key(df["companyname"]))
+
+def standardize_invoices_excel(df):
+    return df
+
+# -------------------------
+# Build dim_customers: union but keep company_norm as dedupe key
+# -------------------------
+def build_dim_customers(sql_c, ex_c, keymap=None, aliases=None):
+    ex_c = ex_c.assign(company_norm=apply_aliases(ex_c["company_norm"], aliases))
+    cust_all = pd.concat([
+        sql_c.rename(columns={"customerid_sql":"customerid"}).assign(source="sql"),
+        ex_c.rename(columns={"customer_source_id":"customerid"}).assign(source="excel")
+    ], ignore_index=True, sort=False)
+
+    # Ensure company_norm exists
+    cust_all["company_norm"] = cust_all["company_norm"].fillna(normalize_key(cust_all["companyname"]))
+
+    # Deduplicate by normalized company name, prefer SQL rows when both exist
+    cust_all["source_rank"] = cust_all["source"].map({"sql": 0, "excel": 1})
+    cust_all = cust_all.sort_values(["company_norm","source_rank"]).drop_duplicates(subset=["company_norm"], keep="first").reset_index(drop=True)
+
+    # Assign numeric surrogate key (stable across builds through the key map)
+    keys, keymap = assign_keys(cust_all, empty_keymap("customers") if keymap is None else keymap, ["company_norm"], "customer_key")
+    cust_all.insert(0, "customer_key", keys)
+
+    # Keep the fields commonly used
+    return cust_all[["customer_key", "customerid", "companyname", "company_norm", "region", "city", "country", "phone", "fax", "source"]], keymap
+
+# -------------------------
+# Build dim_employees
+# -------------------------
+def build_dim_employees(sql_e, ex_e, keymap=None, aliases=None):
+    ex_e = ex_e.assign(emp_norm=apply_aliases(ex_e["emp_norm"], aliases))
+    emp_all = pd.concat([
+        sql_e.rename(columns={"employeeid_sql":"employeeid"}).assign(source="sql"),
+        ex_e.rename(columns={"employee_source_id":"employeeid"}).assign(source="excel")
+    ], ignore_index=True, sort=False)
+
+    emp_all["emp_norm"] = emp_all["emp_norm"].fillna(
+        normalize_key(emp_all["firstname"].fillna("") + " " + emp_all["lastname"].fillna(""))
+    )
+
+    emp_all["source_rank"] = emp_all["source"].map({"sql":0,"excel":1})
+    emp_all = emp_all.sort_values(["emp_norm","source_rank"]).drop_duplicates(
+        subset=["emp_norm"], keep="first"
+    ).reset_index(drop=True)
+
+    keys, keymap = assign_keys(emp_all, empty_keymap("employees") if keymap is None else keymap, ["emp_norm"], "employee_key")
+    emp_all.insert(0, "employee_key", keys)
+
+    # Colonnes réellement disponibles
+    employee_cols = [c for c in [
+        "employee_key","employeeid","firstname","lastname","title",
+        "emp_norm","city","region","country","homephone","notes","source"
+    ] if c in emp_all.columns]
+
+    return emp_all[employee_cols], keymap
+
+# -------------------------
+# Build dim_temps (full calendar)
+# -------------------------
+def build_dim_temps(sql_o, ex_o):
+    # Determine min/max across both sources
+    min_date = min(
+        pd.to_datetime(sql_o["orderdate"].min(), errors="coerce"),
+        pd.to_datetime(ex_o["orderdate"].min(), errors="coerce")
+    )
+    max_date = max(
+        pd.to_datetime(sql_o["orderdate"].max(), errors="coerce"),
+        pd.to_datetime(ex_o["orderdate"].max(), errors="coerce")
+    )
+    if pd.isna(min_date) or pd.isna(max_date):
+        today = pd.Timestamp.today().normalize()
+        min_date = today - pd.Timedelta(days=365)
+        max_date = today
+    all_dates = pd.date_range(start=min_date.normalize(), end=max_date.normalize(), freq="D")
+    dim_temps = pd.DataFrame({"date": all_dates})
+    dim_temps["date_key"] = date_key(dim_temps["date"]).astype(int)
+    dim_temps["year"] = dim_temps["date"].dt.year
+    dim_temps["month"] = dim_temps["date"].dt.month
+    dim_temps["day"] = dim_temps["date"].dt.day
+    dim_temps["weekday"] = dim_temps["date"].dt.day_name()
+    return dim_temps
+
+# -------------------------
+# Build dim_products / dim_shippers
+# -------------------------
+def build_dim_products(ex_p, keymap=None):
+    products = ex_p.rename(columns={"product_source_id":"productid"}).assign(source="excel")
+    products = products[products["product_norm"] != ""].drop_duplicates(subset=["product_norm"], keep="first").reset_index(drop=True)
+    keys, keymap = assign_keys(products, empty_keymap("products") if keymap is None else keymap, ["product_norm"], "product_key")
+    products.insert(0, "product_key", keys)
+    return products[["product_key", "productid", "product_code", "productname", "product_norm", "category",
+                     "standard_cost", "list_price", "discontinued", "source"]], keymap
+
+def build_dim_shippers(ex_s, keymap=None):
+    shippers = ex_s.rename(columns={"shipper_source_id":"shipperid"}).assign(source="excel")
+    shippers = shippers[shippers["shipper_norm"] != ""].drop_duplicates(subset=["shipper_norm"], keep="first").reset_index(drop=True)
+    keys, keymap = assign_keys(shippers, empty_keymap("shippers") if keymap is None else keymap, ["shipper_norm"], "shipper_key")
+    shippers.insert(0, "shipper_key", keys)
+    return shippers[["shipper_key", "shipperid", "companyname", "shipper_norm", "city", "region", "country",
+                     "phone", "source"]], keymap
+
+# -------------------------
+# Build fact_orders (UNION SQL + EXCEL) and map keys
+# -------------------------
+FACT_COLUMNS = [
+    "fact_key",
+    "orderid",
+    "source",
+    "orderdate",
+    "orderdate_key",
+    "shippeddate",
+    "shippeddate_key",
+    "customer_key",
+    "employee_key",
+    "delivered",
+    "freight",
+    "company_norm",
+    "employee_norm",
+    "row_hash",
+]
+
+def union_orders(sql_o, ex_o, sql_c, sql_e):
+    """SQL and Excel orders in one frame, with the normalized customer/employee labels."""
+    # Prepare SQL orders
+    if not sql_o.empty:
+        sql_o2 = sql_o.rename(columns={
+            "orderid_sql":"orderid",
+            "customerid_sql":"customerid",
+            "employeeid_sql":"employeeid"
+        }).copy()
+        sql_o2["source"] = "sql"
+        # For mapping, compute company_norm via customerid -> lookup companyname in sql customers
+        sql_customer_map = sql_c.set_index("customerid_sql")["company_norm"].to_dict()
+        sql_o2["company_norm"] = sql_o2["customerid"].astype(str).map(sql_customer_map).fillna("")
+        # For employee: map id to emp_norm
+        sql_emp_map = sql_e.set_index("employeeid_sql")["emp_norm"].to_dict()
+        sql_o2["employee_norm"] = sql_o2["employeeid"].astype(str).map(sql_emp_map).fillna("")
+    else:
+        sql_o2 = pd.DataFrame(columns=["orderid","customerid","employeeid","orderdate","shippeddate","freight","source","company_norm","employee_norm"])
+
+    # Prepare Excel orders
+    if not ex_o.empty:
+        ex_o2 = ex_o.rename(columns={
+            "orderid_ex":"orderid",
+            "customer_source_ref":"customer_source",
+            "employee_source_ref":"employee_source"
+        }).copy()
+        ex_o2["source"] = "excel"
+        # company_norm and employee_norm already exist in ex_o
+        ex_o2["company_norm"] = normalize_key(ex_o2.get("customer_norm", ex_o2.get("customer_source","")))
+        ex_o2["employee_norm"] = normalize_key(ex_o2.get("employee_norm", ex_o2.get("employee_source","")))
+    else:
+        ex_o2 = pd.DataFrame(columns=["orderid","customer_source","employee_source","orderdate","shippeddate","freight","source","company_norm","employee_norm"])
+
+    # Union orders
+    # an empty source is left out (its placeholder columns would be all-NA)
+    parts = [part for part in (sql_o2, ex_o2) if len(part)] or [sql_o2, ex_o2]
+    orders_union = pd.concat(parts, ignore_index=True, sort=False)
+    orders_union["orderdate"] = pd.to_datetime(orders_union["orderdate"], errors="coerce")
+    orders_union["shippeddate"] = pd.to_datetime(orders_union["shippeddate"], errors="coerce")
+    orders_union["delivered"] = orders_union["shippeddate"].notna().astype(int)
+    return orders_union
+
+def map_orders(sql_o, ex_o, sql_c, sql_e, dim_customers, dim_employees, dim_temps,
+               customer_aliases=None, employee_aliases=None):
+    """Union of the orders with their normalized labels (fuzzy matches applied) and resolved keys."""
+    orders = union_orders(sql_o, ex_o, sql_c, sql_e).reset_index(drop=True)
+    orders["company_norm"] = apply_aliases(orders["company_norm"], customer_aliases)
+    orders["employee_norm"] = apply_aliases(orders["employee_norm"], employee_aliases)
+    return resolve_fact_keys(orders, dim_customers, dim_employees, dim_temps)
+
+def order_fingerprints(frames, mapping):
+    """
+    row_hash of the orders of each source ({"sql": sql_o, "excel": ex_o}):
+    their source columns, plus the label and key their customer / employee
+    references resolve to. Each distinct reference is mapped once, in a single
+    map_orders call on one order that carries it, so the fingerprint needs no
+    normalization or key lookup per row, and a renamed customer or a new fuzzy
+    match changes the fingerprint of its orders only. `mapping` holds the
+    arguments of map_orders after the two order frames.
+    """
+    references, samples, start = [], {}, 0
+    for source, orders in frames.items():
+        carriers = []
+        for entity, column in ORDER_REFERENCES[source].items():
+            codes, uniques = pd.factorize(orders[column], use_na_sentinel=False)
+            carrier = np.empty(len(uniques), dtype="int64")
+            carrier[codes] = np.arange(len(codes))
+            carriers.append(carrier)
+            references.append((source, entity, codes, start, len(uniques)))
+            start += len(uniques)
+        samples[source] = orders.iloc[np.concatenate(carriers)]
+    # union_orders puts the SQL orders first
+    resolved = map_orders(samples["sql"], samples["excel"], *mapping)
+
+    hashes = {}
+    for source, orders in frames.items():
+        # categorize=False: order ids are unique, factorizing them first only costs
+        row = pd.util.hash_pandas_object(orders[ORDER_SOURCE_COLUMNS[source]], index=False, categorize=False)
+        hashes[source] = {"row": row.to_numpy(),
+                          "source": np.full(len(orders), pd.util.hash_array(np.array([source], dtype=object))[0])}
+    for source, entity, codes, start, count in references:
+        block = resolved[RESOLVED[entity]].iloc[start:start + count]
+        hashes[source][entity] = pd.util.hash_pandas_object(block, index=False).to_numpy()[codes]
+    return {source: pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+            for source, parts in hashes.items()}
+
+def resolve_date_keys(orders, dim_temps):
+    """orderdate_key / shippeddate_key (YYYYMMDD); only dates present in dim_temps get one."""
+    known_dates = dim_temps["date_key"].to_numpy()
+    for column in ["orderdate", "shippeddate"]:
+        keys = date_key(orders[column])
+        orders[column + "_key"] = np.where(np.isin(keys, known_dates), keys, np.nan)
+    return orders
+
+def refresh_date_keys(fact, dim_temps):
+    """
+    Date keys of reused fact rows against the current calendar: a key no longer
+    in dim_temps is dropped, and only the dates without a key are looked up.
+    """
+    known_dates = dim_temps["date_key"].to_numpy()
+    for column in ["orderdate", "shippeddate"]:
+        keys = fact[column + "_key"].to_numpy(dtype=float, na_value=np.nan)
+        keys = np.where(np.isin(keys, known_dates), keys, np.nan)
+        missing = np.isnan(keys) & fact[column].notna().to_numpy()
+        if missing.any():
+            computed = date_key(fact.loc[missing, column])
+            keys[missing] = np.where(np.isin(computed, known_dates), computed, np.nan)
+        fact[column + "_key"] = keys
+    return fact
+
+def concat_rows(top, bottom):
+    """Rows of `top` then `bottom` (same columns); categoricals stay categorical instead of falling back to object."""
+    columns = {}
+    for column in top.columns:
+        if isinstance(top[column].dtype, pd.CategoricalDtype) and isinstance(bottom[column].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals([top[column], bottom[column]])
+        else:
+            columns[column] = pd.concat([top[column], bottom[column]], ignore_index=True)
+    return pd.DataFrame(columns)
+
+def resolve_fact_keys(orders, dim_customers, dim_employees, dim_temps):
+    """
+    Resolve customer_key, employee_key and the date keys of `orders` in one
+    pass: hash joins on the normalized names, with a fallback on the source ids
+    for the rows left unmatched, and date keys computed from datetime64.
+    """
+    orders = orders.copy()
+    ids = orders.reindex(columns=["customerid", "employeeid"])
+
+    # customer_key: company_norm first, then the customer id
+    customer_key = hash_lookup(orders["company_norm"], dim_customers["company_norm"], dim_customers["customer_key"])
+    fallback = np.isnan(customer_key) & ids["customerid"].notna().to_numpy()
+    customer_key[fallback] = hash_lookup(ids.loc[fallback, "customerid"].astype(str),
+                                         dim_customers["customerid"].astype(str), dim_customers["customer_key"])
+
+    # employee_key: emp_norm first, then the employee id
+    employee_key = hash_lookup(orders["employee_norm"], dim_employees["emp_norm"], dim_employees["employee_key"])
+    fallback = np.isnan(employee_key) & ids["employeeid"].notna().to_numpy()
+    employee_key[fallback] = hash_lookup(ids.loc[fallback, "employeeid"].astype(str),
+                                         dim_employees["employeeid"].astype(str), dim_employees["employee_key"])
+
+    orders["customer_key"] = customer_key
+    orders["employee_key"] = employee_key
+    return resolve_date_keys(orders, dim_temps)
+
+def key_match_rates(fact):
+    """Share of fact rows whose keys were resolved, per source."""
+    source = fact["source"].astype(str)
+    rates = fact[["customer_key", "employee_key", "orderdate_key", "shippeddate_key"]].notna().groupby(source).mean()
+    rates.insert(0, "rows", source.value_counts())
+    return rates
+
+def build_fact_orders(sql_o, ex_o, sql_c, sql_e, dim_customers, dim_employees, dim_temps,
+                      keymap=None, previous_fact=None, customer_aliases=None, employee_aliases=None):
+    """
+    fact_orders and the updated order key map. fact_key is stable across builds
+    (key map on source + orderid). With `previous_fact` (incremental load), an
+    order whose fingerprint (row_hash, see order_fingerprints) matches a fully
+    resolved previous row reuses that row; only new, changed or previously
+    unresolved orders are normalized, keyed and resolved. Orders gone from the
+    sources are dropped.
+    """
+    mapping = (sql_c, sql_e, dim_customers, dim_employees, dim_temps, customer_aliases, employee_aliases)
+    frames = {"sql": sql_o, "excel": ex_o}
+    hashes = order_fingerprints(frames, mapping)
+
+    kept = None
+    if previous_fact is not None and "row_hash" in previous_fact.columns:
+        prev = previous_fact[previous_fact["customer_key"].notna() & previous_fact["employee_key"].notna()]
+        positions = {source: hash_lookup(h, prev["row_hash"], np.arange(len(prev))) for source, h in hashes.items()}
+        found = np.concatenate([p[~np.isnan(p)] for p in positions.values()]).astype("int64")
+        kept = refresh_date_keys(prev.iloc[found].reset_index(drop=True), dim_temps)
+        for source, p in positions.items():
+            changed = np.isnan(p)
+            frames[source] = frames[source][changed]
+            hashes[source] = hashes[source][changed]
+
+    orders = map_orders(frames["sql"], frames["excel"], *mapping)
+    orders["row_hash"] = np.concatenate([hashes["sql"], hashes["excel"]]) if len(orders) else np.array([], dtype="uint64")
+
+    # Create surrogate fact_key numeric
+    if keymap is None:
+        keymap = empty_keymap("orders")
+    keys, keymap = assign_keys(orders, keymap, ["source", "orderid"], "fact_key")
+    orders.insert(0, "fact_key", keys)
+
+    # Select final fact_orders with orderdate included (for reporting)
+    fact = apply_output_dtypes("fact_orders", orders[FACT_COLUMNS])
+    if kept is not None and len(kept):
+        kept = apply_output_dtypes("fact_orders", kept[FACT_COLUMNS])
+        fact = concat_rows(kept, fact) if len(fact) else kept
+        if not fact["fact_key"].is_monotonic_increasing:
+            fact = fact.sort_values("fact_key", ignore_index=True)
+    return fact, keymap
+
+# -------------------------
+# Build fact_order_lines (Excel order details)
+# -------------------------
+LINE_COLUMNS = [
+    "line_key",
+    "fact_key",
+    "orderid",
+    "source",
+    "orderdate",
+    "orderdate_key",
+    "invoice_date_key",
+    "customer_key",
+    "employee_key",
+    "product_key",
+    "shipper_key",
+    "line_status",
+    "quantity",
+    "unit_price",
+    "discount",
+    "gross_amount",
+    "revenue",
+]
+
+def build_fact_order_lines(ex_od, ex_o, ex_i, fact_orders, order_keymap, dim_products, dim_shippers, dim_temps,
+                           keymap=None, quarantined_keys=None):
+    """
+    One row per order line with quantity / revenue measures. Order-level keys
+    (customer, employee, order date) come from fact_orders through fact_key;
+    product, shipper and invoice date are hash joins on the order line / order.
+    Every join is one-to-one or many-to-one: the build is linear in line count.
+    The lines of the orders in `quarantined_keys` (fact_key held back by the
+    quality gate) are left out, so no line points to a missing order.
+    """
+    lines = ex_od.rename(columns={"orderid_ex":"orderid"}).assign(source="excel").reset_index(drop=True)
+    keys, keymap = assign_keys(lines, empty_keymap("order_lines") if keymap is None else keymap, ["source", "lineid"], "line_key")
+    lines.insert(0, "line_key", keys)
+
+    # fact_key through the order key map, then the order-level keys of fact_orders
+    excel_orders = order_keymap[order_keymap["source"] == "excel"]
+    lines["fact_key"] = hash_lookup(lines["orderid"].astype(str), excel_orders["orderid"], excel_orders["fact_key"])
+    if quarantined_keys is not None and len(quarantined_keys):
+        lines = lines[~lines["fact_key"].isin(quarantined_keys)].reset_index(drop=True)
+    header = fact_orders[["fact_key", "orderdate", "orderdate_key", "customer_key", "employee_key"]]
+    lines = lines.merge(header, on="fact_key", how="left", validate="many_to_one")
+
+    lines["product_key"] = hash_lookup(lines["product_norm"], dim_products["product_norm"], dim_products["product_key"])
+
+    # Shipper of the order ("Ship Via" holds the shipper company name)
+    order_shipper = hash_lookup(normalize_key(ex_o["ship_via"]), dim_shippers["shipper_norm"], dim_shippers["shipper_key"])
+    lines["shipper_key"] = hash_lookup(lines["orderid"], ex_o["orderid_ex"].astype(str), order_shipper)
+
+    # Invoice date key (last invoice of the order)
+    invoice_keys = date_key(ex_i["invoice_date"])
+    invoice_keys = np.where(np.isin(invoice_keys, dim_temps["date_key"].to_numpy()), invoice_keys, np.nan)
+    lines["invoice_date_key"] = hash_lookup(lines["orderid"], ex_i["orderid_ex"].astype(str), invoice_keys)
+
+    # Measures (discount is a fraction of the line amount)
+    lines["gross_amount"] = lines["quantity"] * lines["unit_price"]
+    lines["revenue"] = lines["gross_amount"] * (1 - lines["discount"])
+    return apply_output_dtypes("fact_order_lines", lines[LINE_COLUMNS]), keymap
+
+# -------------------------
+# Stages
+# -------------------------
+# Raw source -> (artefact name, standardizer)
+SOURCES = {
+    "sql_customers": ("sql_c", standardize_customers_sql),
+    "sql_employees": ("sql_e", standardize_employees_sql),
+    "sql_orders": ("sql_o", standardize_orders_sql),
+    "excel_customers": ("ex_c", standardize_customers_excel),
+    "excel_employees": ("ex_e", standardize_employees_excel),
+    "excel_orders": ("ex_o", standardize_orders_excel),
+    "excel_order_details": ("ex_od", standardize_order_details_excel),
+    "excel_products": ("ex_p", standardize_products_excel),
+    "excel_shippers": ("ex_s", standardize_shippers_excel),
+    "excel_invoices": ("ex_i", standardize_invoices_excel),
+}
+
+# Warehouse tables written by build_warehouse (format: see storage.py)
+TABLES = constants.TABLES
+
+# Tables stored one partition per month of their date key
+PARTITIONED = constants.PARTITIONED
+
+# -------------------------
+# Typed output layer
+# -------------------------
+# Keys are nullable integers (no more 19960716.0 when a key is missing) and
+# low-cardinality text columns are categoricals (dictionary-encoded on disk).
+OUTPUT_DTYPES = {
+    "dim_customers": {"customer_key": "int64", "source": "category"},
+    "dim_employees": {"employee_key": "int64", "source": "category"},
+    "dim_temps": {"date_key": "int32", "year": "int16", "month": "int8", "day": "int8",
+                  "weekday": "category"},
+    "fact_orders": {
+        "fact_key": "int64",
+        "orderdate_key": "Int32",
+        "shippeddate_key": "Int32",
+        "customer_key": "Int64",
+        "employee_key": "Int64",
+        "delivered": "int8",
+        "freight": "float64",
+        "source": "category",
+        "company_norm": "category",
+        "employee_norm": "category",
+        "row_hash": "uint64",
+    },
+    "dim_products": {"product_key": "int64", "category": "category", "standard_cost": "float64",
+                     "list_price": "float64", "discontinued": "bool", "source": "category"},
+    "dim_shippers": {"shipper_key": "int64", "source": "category"},
+    "fact_order_lines": {
+        "line_key": "int64",
+        "fact_key": "Int64",
+        "orderdate_key": "Int32",
+        "invoice_date_key": "Int32",
+        "customer_key": "Int64",
+        "employee_key": "Int64",
+        "product_key": "Int64",
+        "shipper_key": "Int64",
+        "source": "category",
+        "line_status": "category",
+        "quantity": "float64",
+        "unit_price": "float64",
+        "discount": "float64",
+        "gross_amount": "float64",
+        "revenue": "float64",
+    },
+    aggregates.CUBE: {"employee_key": "Int64", "source": "category", "total_orders": "int64",
+                      "delivered": "int64", "freight": "float64"},
+}
+
+
+def apply_output_dtypes(name, df):
+    """Cast the columns of warehouse table `name` to their declared output dtypes."""
+    dtypes = {c: t for c, t in OUTPUT_DTYPES.get(name, {}).items() if c in df.columns}
+    return df.astype(dtypes)
+
+
+def _standardize_step(source, standardize):
+    def step(path):
+        return standardize(schemas.read_source(source, path))
+    return step
+
+
+def _write_step(name, warehouse, fmt, csv_export, partitions=None):
+    def step(table):
+        table = apply_output_dtypes(name, table)
+        if name in PARTITIONED:
+            path = storage.write_partitioned(table, name, warehouse, fmt, PARTITIONED[name], only=partitions)
+            keep = {storage.PARTITIONED}
+        else:
+            path = storage.write_table(table, name, warehouse, fmt)
+            keep = {fmt}
+        if csv_export and (fmt != "csv" or name in PARTITIONED):
+            storage.write_table(table, name, warehouse, "csv")
+            keep.add("csv")
+        storage.drop_other_formats(name, warehouse, keep=keep)
+        return path
+    return step
+
+
+def _load_keymap_step(name, warehouse):
+    def step():
+        return load_keymap(name, warehouse)
+    return step
+
+
+def _write_keymap_step(name, warehouse, fmt):
+    def step(keymap):
+        folder = keymap_folder(warehouse)
+        path = storage.write_table(keymap, name, folder, fmt)
+        storage.drop_other_formats(name, folder, keep={fmt})
+        return path
+    return step
+
+
+def _previous_fact_step(warehouse, incremental):
+    # the previous dim_customers is read with the previous facts: the cube
+    # built on both moves the orders of a customer whose country changed
+    def step():
+        if not incremental:
+            return None, None
+        try:
+            fact = storage.read_table("fact_orders", warehouse)
+            customers = storage.read_table("dim_customers", warehouse,
+                                           columns=["customer_key"] + aggregates.CUSTOMER_ATTRIBUTES)
+        except FileNotFoundError:
+            return None, None
+        return fact, customers
+    return step
+
+
+def _match_step(name, column, warehouse, threshold):
+    def step(sql_df, excel_df):
+        return match_entities(name, sql_df[column], excel_df[column], warehouse, threshold)
+    return step
+
+
+def _write_matches_step(name, warehouse, fmt):
+    def step(state):
+        folder = matching.match_folder(warehouse)
+        matching.save_matches(name, folder, *state, fmt=fmt)
+        return folder
+    return step
+
+
+def _after_gate(write):
+    # a write also waits for the quality report: when the gate fails, nothing
+    # in the warehouse (tables, key maps, matches, snapshot) has been touched
+    def step(value, quality_report):
+        return write(value)
+    return step
+
+
+def _quality_step(warehouse, mode, fmt):
+    def step(fact_orders, dim_customers, dim_employees, dim_temps):
+        tables = {"fact_orders": fact_orders, "dim_customers": dim_customers,
+                  "dim_employees": dim_employees, "dim_temps": dim_temps}
+        folder = os.path.join(warehouse, quality.FOLDER)
+        try:
+            fact, quarantined, report = quality.gate(tables, mode)
+        except quality.QualityError as error:
+            storage.drop_other_formats(quality.QUARANTINE, folder, keep=())
+            quality.write_report(error.report, folder)
+            raise
+        if quarantined is not None:
+            storage.write_table(quarantined, quality.QUARANTINE, folder, fmt)
+        storage.drop_other_formats(quality.QUARANTINE, folder, keep={fmt} if quarantined is not None else ())
+        report["report_file"] = quality.write_report(report, folder)
+        keys = quarantined["fact_key"].to_numpy() if quarantined is not None else np.array([], dtype="int64")
+        return fact, report, keys
+    return step
+
+
+def _previous_cube_step(warehouse, incremental):
+    def step():
+        return aggregates.load_cube(warehouse) if incremental else None
+    return step
+
+
+def build_order_cube(fact_orders, dim_customers, previous_fact=None, previous_customers=None, previous_cube=None):
+    """agg_orders: full aggregation, or the previous cube updated with the fact and dim_customers deltas."""
+    if previous_fact is None or previous_customers is None or previous_cube is None:
+        return aggregates.aggregate_orders(fact_orders, dim_customers)
+    return aggregates.update_cube(previous_cube, previous_fact, fact_orders, previous_customers, dim_customers)
+
+
+def _write_snapshot_step(warehouse):
+    # written after fact_orders (and so after the quality gate): the snapshot
+    # is never older than the fact table it was built from, which is what
+    # dashboard_data.snapshot_is_fresh checks
+    def step(cells, fact_orders_file):
+        return dashboard_data.write_snapshot(cells, warehouse)
+    return step
+
+
+def build_stages(warehouse=WAREHOUSE, fmt=storage.DEFAULT_FORMAT, csv_export=False, incremental=False,
+                 match_threshold=matching.DEFAULT_THRESHOLD, quality_mode=quality.DEFAULT_MODE, partitions=None):
+    """
+    Stages of the star-schema build; source paths are the `<source>_path` artefacts.
+    Surrogate keys come from the key maps stored in `<warehouse>/keymaps/`;
+    with `incremental`, unchanged rows of the previous fact table are reused.
+    `quality_mode` is the data-quality gate mode (see quality.MODES).
+    `partitions` ([(year, month), ...], None for the unknown-date partition)
+    limits the partitioned tables' write to those months (see storage.write_partitioned).
+    """
+    stages = []
+    for source, (artefact, standardize) in SOURCES.items():
+        stages.append(Stage(standardize.__name__, _standardize_step(source, standardize),
+                            inputs=[source + "_path"], outputs=[artefact]))
+    for name in KEYMAP_SPECS:
+        stages.append(Stage("load_keymap_" + name, _load_keymap_step(name, warehouse),
+                            outputs=["keymap_" + name]))
+    stages += [
+        Stage("previous_fact", _previous_fact_step(warehouse, incremental),
+              outputs=["previous_fact", "previous_customers"]),
+        Stage("match_customers", _match_step("customers", "company_norm", warehouse, match_threshold),
+              inputs=["sql_c", "ex_c"], outputs=["customer_aliases", "customer_matches"]),
+        Stage("match_employees", _match_step("employees", "emp_norm", warehouse, match_threshold),
+              inputs=["sql_e", "ex_e"], outputs=["employee_aliases", "employee_matches"]),
+        Stage("dim_customers", build_dim_customers,
+              inputs=["sql_c", "ex_c", "keymap_customers", "customer_aliases"],
+              outputs=["dim_customers", "new_keymap_customers"]),
+        Stage("dim_employees", build_dim_employees,
+              inputs=["sql_e", "ex_e", "keymap_employees", "employee_aliases"],
+              outputs=["dim_employees", "new_keymap_employees"]),
+        Stage("dim_temps", build_dim_temps, inputs=["sql_o", "ex_o"], outputs=["dim_temps"]),
+        Stage("fact_orders", build_fact_orders,
+              inputs=["sql_o", "ex_o", "sql_c", "sql_e", "dim_customers", "dim_employees", "dim_temps",
+                      "keymap_orders", "previous_fact", "customer_aliases", "employee_aliases"],
+              outputs=["unchecked_fact_orders", "new_keymap_orders"]),
+        Stage("quality", _quality_step(warehouse, quality_mode, fmt),
+              inputs=["unchecked_fact_orders", "dim_customers", "dim_employees", "dim_temps"],
+              outputs=["fact_orders", "quality_report", "quarantined_keys"]),
+        Stage("key_match_rates", key_match_rates, inputs=["unchecked_fact_orders"], outputs=["key_match_rates"]),
+        Stage("previous_cube", _previous_cube_step(warehouse, incremental), outputs=["previous_cube"]),
+        Stage(aggregates.CUBE, build_order_cube,
+              inputs=["fact_orders", "dim_customers", "previous_fact", "previous_customers", "previous_cube"],
+              outputs=[aggregates.CUBE]),
+        Stage("dim_products", build_dim_products, inputs=["ex_p", "keymap_products"],
+              outputs=["dim_products", "new_keymap_products"]),
+        Stage("dim_shippers", build_dim_shippers, inputs=["ex_s", "keymap_shippers"],
+              outputs=["dim_shippers", "new_keymap_shippers"]),
+        Stage("fact_order_lines", build_fact_order_lines,
+              inputs=["ex_od", "ex_o", "ex_i", "fact_orders", "new_keymap_orders", "dim_products", "dim_shippers",
+                      "dim_temps", "keymap_order_lines", "quarantined_keys"],
+              outputs=["fact_order_lines", "new_keymap_order_lines"]),
+        Stage(dashboard_data.SNAPSHOT, dashboard_data.build_cells,
+              inputs=["fact_orders", "dim_customers", "dim_employees", "dim_temps"],
+              outputs=[dashboard_data.SNAPSHOT]),
+    ]
+    for name in TABLES:
+        stages.append(Stage("write_" + name, _after_gate(_write_step(name, warehouse, fmt, csv_export, partitions)),
+                            inputs=[name, "quality_report"], outputs=[name + "_file"]))
+    for name in KEYMAP_SPECS:
+        stages.append(Stage("write_keymap_" + name, _after_gate(_write_keymap_step(name, warehouse, fmt)),
+                            inputs=["new_keymap_" + name, "quality_report"], outputs=["keymap_" + name + "_file"]))
+    for name, state in (("customers", "customer_matches"), ("employees", "employee_matches")):
+        stages.append(Stage("write_matches_" + name, _after_gate(_write_matches_step(name, warehouse, fmt)),
+                            inputs=[state, "quality_report"], outputs=["matches_" + name + "_file"]))
+    stages.append(Stage("write_" + dashboard_data.SNAPSHOT, _write_snapshot_step(warehouse),
+                        inputs=[dashboard_data.SNAPSHOT, "fact_orders_file"],
+                        outputs=[dashboard_data.SNAPSHOT + "_file"]))
+    return stages
+
+
+def build_warehouse(paths, warehouse=WAREHOUSE, max_workers=None, fmt=storage.DEFAULT_FORMAT, csv_export=False,
+                    incremental=False, match_threshold=matching.DEFAULT_THRESHOLD, quality_mode=quality.DEFAULT_MODE,
+                    partitions=None):
+    """
+    Build the warehouse from the raw source files.
+    `paths` maps each key of SOURCES to a CSV path (or None when absent).
+    Tables are stored as `fmt` (see storage.py), plus a CSV copy if `csv_export`.
+    `incremental` upserts new/changed orders into the existing fact table;
+    `match_threshold` is the minimal fuzzy score to merge an Excel name into a SQL one;
+    `quality_mode` "fail" raises quality.QualityError when a rule of severity error is violated;
+    `partitions` rebuilds only those months of the partitioned tables (see build_stages).
+    Returns (context with every artefact, {stage name: seconds}).
+    """
+    os.makedirs(warehouse, exist_ok=True)
+    context = {source + "_path": paths.get(source) for source in SOURCES}
+    stages = build_stages(warehouse, fmt, csv_export, incremental, match_threshold, quality_mode, partitions)
+    return run_stages(stages, context, max_workers=max_workers)
+
+
+def reset_keymaps(warehouse=WAREHOUSE):
+    """Forget every stored surrogate key (the next build renumbers from 1)."""
+    folder = keymap_folder(warehouse)
+    for name in KEYMAP_SPECS:
+        storage.drop_other_formats(name, folder, keep=())
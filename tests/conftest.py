@@ -0,0 +1,5 @@
+import os
+import sys
+
+# les scripts s'importent entre eux par leur nom (lancés depuis scripts/)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts"))
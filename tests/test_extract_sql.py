@@ -0,0 +1,198 @@
+"""
+Extraction SQL (extract_sql.py) contre une base SQLite qui remplace SQL Server :
+lecture par lots, publication atomique, pool borné, extraction parallèle et
+incrémentale, propagation des erreurs.
+"""
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+import extract_sql
+
+
+def _connect(path):
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+def _insert_orders(conn, first, last):
+    conn.executemany("INSERT INTO Orders VALUES (?, ?, ?)",
+                     [(i, f"C{i % 7}", 10.0 + i) for i in range(first, last + 1)])
+    conn.commit()
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "northwind.sqlite")
+    conn = _connect(path)
+    conn.execute("CREATE TABLE Customers (CustomerID TEXT, CompanyName TEXT)")
+    conn.executemany("INSERT INTO Customers VALUES (?, ?)", [(f"C{i}", f"Company {i}") for i in range(7)])
+    conn.execute("CREATE TABLE Employees (EmployeeID INTEGER, LastName TEXT)")
+    conn.executemany("INSERT INTO Employees VALUES (?, ?)", [(i, f"Name {i}") for i in range(1, 4)])
+    conn.execute("CREATE TABLE Orders (OrderID INTEGER, CustomerID TEXT, Freight REAL)")
+    _insert_orders(conn, 1, 25)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def output(tmp_path):
+    folder = tmp_path / "sql_sources"
+    folder.mkdir()
+    return str(folder)
+
+
+def _csv(output, table):
+    return pd.read_csv(extract_sql.output_path_for(table, output))
+
+
+def test_stream_query_writes_every_chunk(database, output):
+    conn = _connect(database)
+    path = os.path.join(output, "orders.csv")
+    rows = extract_sql.stream_query(conn, "SELECT * FROM [Orders]", path, chunksize=4)
+    assert rows == 25
+    assert pd.read_csv(path).equals(pd.read_sql("SELECT * FROM [Orders]", conn))
+
+
+def test_stream_query_nullable_integers_same_in_every_chunk(database, output):
+    conn = _connect(database)
+    conn.execute("CREATE TABLE Shipments (OrderID INTEGER, ShipVia INTEGER)")
+    conn.executemany("INSERT INTO Shipments VALUES (?, ?)", [(i, None if i in (6, 7) else i % 3) for i in range(1, 11)])
+    path = os.path.join(output, "shipments.csv")
+    extract_sql.stream_query(conn, "SELECT * FROM [Shipments]", path, chunksize=4)
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines[1:6] == ["1,1", "2,2", "3,0", "4,1", "5,2"]
+    assert lines[6:8] == ["6,", "7,"]
+    assert not any(".0" in line for line in lines)
+
+
+def test_stream_query_empty_result_keeps_header(database, output):
+    conn = _connect(database)
+    path = os.path.join(output, "empty.csv")
+    rows = extract_sql.stream_query(conn, "SELECT * FROM [Orders] WHERE [OrderID] < 0", path, chunksize=4)
+    assert rows == 0
+    assert list(pd.read_csv(path).columns) == ["OrderID", "CustomerID", "Freight"]
+
+
+def test_extract_table_publishes_atomically(database, output, monkeypatch):
+    conn = _connect(database)
+    extract_sql.extract_table(conn, "Orders", output, chunksize=4)
+    before = _csv(output, "Orders")
+    assert len(before) == 25
+    assert not os.path.exists(extract_sql.output_path_for("Orders", output) + ".part")
+
+    def broken(conn, query, path, params=None, chunksize=None):
+        with open(path, "w") as f:
+            f.write("OrderID\n1\n")
+        raise RuntimeError("connexion perdue")
+
+    monkeypatch.setattr(extract_sql, "stream_query", broken)
+    with pytest.raises(RuntimeError):
+        extract_sql.extract_table(conn, "Orders", output, chunksize=4)
+    # the published file is still the previous, complete one
+    assert _csv(output, "Orders").equals(before)
+
+
+def test_connection_pool_is_bounded(database):
+    opened = []
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def factory():
+        conn = _connect(database)
+        opened.append(conn)
+        return conn
+
+    pool = extract_sql.ConnectionPool(factory, 2)
+    barrier = threading.Barrier(2)
+
+    def worker():
+        with pool.connection() as conn:
+            with lock:
+                active.append(conn)
+                peak[0] = max(peak[0], len(active))
+            try:
+                barrier.wait(timeout=0.2)
+            except threading.BrokenBarrierError:
+                pass
+            conn.execute("SELECT COUNT(*) FROM [Orders]").fetchone()
+            with lock:
+                active.remove(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pool.close()
+    assert len(opened) <= 2
+    assert peak[0] == 2
+
+
+def test_parallel_partitions_match_serial_extraction(database, output, tmp_path):
+    serial = str(tmp_path / "serial")
+    os.makedirs(serial)
+    extract_sql.extract_parallel(lambda: _connect(database), extract_sql.TABLES, serial, workers=1)
+    timings = extract_sql.extract_parallel(lambda: _connect(database), extract_sql.TABLES, output,
+                                           workers=3, chunksize=4, partitions=4)
+    assert timings["Orders"][0] == 25
+    for table in extract_sql.TABLES:
+        assert _csv(output, table).equals(_csv(serial, table))
+    assert not [f for f in os.listdir(output) if not f.endswith(".csv")]
+
+
+def test_incremental_appends_only_new_rows(database, output):
+    state = {}
+    factory = lambda: _connect(database)
+    extract_sql.extract_parallel(factory, ["Orders"], output, workers=1, incremental=True, state=state)
+    assert state == {"Orders": 25}
+
+    conn = _connect(database)
+    _insert_orders(conn, 26, 30)
+    timings = extract_sql.extract_parallel(factory, ["Orders"], output, workers=1, incremental=True, state=state)
+    assert timings["Orders"][0] == 5
+    assert _csv(output, "Orders")["OrderID"].tolist() == list(range(1, 31))
+    assert extract_sql.load_watermarks(output) == {"Orders": 30}
+
+
+@pytest.mark.parametrize("tables", [["Customers", "Orders", "Missing"], ["Missing", "Orders"]])
+def test_failure_keeps_merged_delta_watermark(database, output, tables):
+    factory = lambda: _connect(database)
+    extract_sql.extract_parallel(factory, ["Orders"], output, workers=1, incremental=True,
+                                 state=extract_sql.load_watermarks(output))
+    conn = _connect(database)
+    _insert_orders(conn, 26, 30)
+
+    # another table fails: the error is raised, but the Orders delta already
+    # merged keeps its watermark
+    with pytest.raises(Exception):
+        extract_sql.extract_parallel(factory, tables, output, workers=1, incremental=True,
+                                     state=extract_sql.load_watermarks(output))
+    assert extract_sql.load_watermarks(output) == {"Orders": 30}
+
+    # the next run does not append the same delta again
+    extract_sql.extract_parallel(factory, ["Orders"], output, workers=1, incremental=True,
+                                 state=extract_sql.load_watermarks(output))
+    ids = _csv(output, "Orders")["OrderID"]
+    assert ids.tolist() == list(range(1, 31))
+
+
+def test_full_extraction_drops_watermark_even_if_another_table_fails(database, output):
+    factory = lambda: _connect(database)
+    extract_sql.extract_parallel(factory, ["Orders"], output, workers=1, incremental=True,
+                                 state=extract_sql.load_watermarks(output))
+    conn = _connect(database)
+    _insert_orders(conn, 26, 30)
+
+    with pytest.raises(Exception):
+        extract_sql.extract_parallel(factory, ["Orders", "Missing"], output, workers=1,
+                                     state=extract_sql.load_watermarks(output))
+    # Orders was fully re-extracted (30 rows): its old watermark is gone
+    assert extract_sql.load_watermarks(output) == {}
+    extract_sql.extract_parallel(factory, ["Orders"], output, workers=1, incremental=True,
+                                 state=extract_sql.load_watermarks(output))
+    assert _csv(output, "Orders")["OrderID"].tolist() == list(range(1, 31))